@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Команди лікарів для пошуку і перегляду збережених анкет
+"""
+
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.ext import CallbackQueryHandler, CommandHandler, ContextTypes, filters
+
+from survey_render import format_survey_result
+from survey_store import extract_red_flags
+
+PAGE_SIZE = 10
+MAX_RECENT = 200
+
+USAGE = (
+    "Команди лікаря:\n"
+    "/find <текст> - пошук за ПІБ і відповідями\n"
+    "/patient <user_id> - анкети пацієнта\n"
+    "/recent [N] - останні N анкет\n"
+    "/survey <номер> - повна анкета\n"
+    "/export <з> <по> - анкети за період у CSV (дати ДД.ММ.РРРР)\n"
+    "/stats - статистика анкет"
+)
+
+
+async def _reply(update, context, text, reply_markup=None):
+    """Відповідь лікарю через спільну чергу вихідних повідомлень"""
+    await context.bot_data['outbound'].reply(update.message, text, reply_markup=reply_markup)
+
+
+def survey_line(record, red_flag_options):
+    """Короткий рядок анкети для списку"""
+    saved_at = datetime.fromisoformat(record['saved_at']).strftime('%d.%m.%Y %H:%M')
+    flag = ' ⚠️' if extract_red_flags(record.get('chervoni_prapory'), red_flag_options) else ''
+    return f"#{record['survey_id']} {saved_at} — {record.get('pib', 'Не вказано')} (ID {record.get('user_id')}){flag}"
+
+
+def _fetch(store, kind, argument, page):
+    """Сторінка результатів; на один запис більше, щоб знати, чи є наступна сторінка"""
+    offset = page * PAGE_SIZE
+    if kind == 'find':
+        return store.search(argument, limit=PAGE_SIZE + 1, offset=offset)
+    if kind == 'patient':
+        return store.for_patient(argument, limit=PAGE_SIZE + 1, offset=offset)
+    limit = min(PAGE_SIZE + 1, argument - offset)
+    return store.recent(limit=limit, offset=offset) if limit > 0 else []
+
+
+async def _render_page(context, kind, argument, page):
+    store = context.bot_data['survey_store']
+    records = await asyncio.to_thread(_fetch, store, kind, argument, page)
+    has_more = len(records) > PAGE_SIZE and (kind != 'recent' or (page + 1) * PAGE_SIZE < argument)
+    records = records[:PAGE_SIZE]
+    if not records:
+        return ("Нічого не знайдено." if page == 0 else "Більше результатів немає."), None
+
+    lines = [survey_line(record, store.red_flag_options) for record in records]
+    text = f"Сторінка {page + 1}:\n\n" + "\n".join(lines) + "\n\nПовна анкета: /survey <номер>"
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton('◀️ Назад', callback_data=f'admin_page:{page - 1}'))
+    if has_more:
+        buttons.append(InlineKeyboardButton('Далі ▶️', callback_data=f'admin_page:{page + 1}'))
+    return text, InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+async def _start_listing(update, context, kind, argument):
+    # Параметри запиту зберігаємо, щоб кнопки гортали саме цей список
+    context.user_data['admin_query'] = [kind, argument]
+    text, reply_markup = await _render_page(context, kind, argument, 0)
+    await _reply(update, context, text, reply_markup)
+
+
+async def find(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Пошук анкет за ПІБ і текстовими відповідями"""
+    text = ' '.join(context.args)
+    if not text:
+        await _reply(update, context, USAGE)
+        return
+    await _start_listing(update, context, 'find', text)
+
+
+async def patient(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Історія анкет пацієнта"""
+    try:
+        user_id = int(context.args[0])
+    except (IndexError, ValueError):
+        await _reply(update, context, USAGE)
+        return
+    await _start_listing(update, context, 'patient', user_id)
+
+
+async def recent(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Останні анкети"""
+    try:
+        count = int(context.args[0]) if context.args else PAGE_SIZE
+    except ValueError:
+        await _reply(update, context, USAGE)
+        return
+    await _start_listing(update, context, 'recent', max(1, min(count, MAX_RECENT)))
+
+
+async def survey(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Повний текст анкети за номером"""
+    try:
+        survey_id = int(context.args[0].lstrip('#'))
+    except (IndexError, ValueError):
+        await _reply(update, context, USAGE)
+        return
+    record = await asyncio.to_thread(context.bot_data['survey_store'].get, survey_id)
+    if record is None:
+        await _reply(update, context, "Анкету не знайдено.")
+        return
+    await _reply(update, context, format_survey_result(record, for_admin=True))
+
+
+async def export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """CSV з анкетами за період (обидві дати включно)"""
+    try:
+        start, end = (datetime.strptime(value, '%d.%m.%Y') for value in context.args)
+    except ValueError:
+        await _reply(update, context, USAGE)
+        return
+    # Модуль вивантаження потрібен рідко: імпортується при першій команді
+    from survey_export import export_file, send_document
+
+    store = context.bot_data['survey_store']
+    path, count, _ = await asyncio.to_thread(
+        export_file, store.iter_surveys(start=start, end=end + timedelta(days=1)))
+    try:
+        if not count:
+            await _reply(update, context, "За цей період анкет немає.")
+            return
+        await send_document(
+            context.bot_data['outbound'], context.bot, [update.effective_chat.id], path,
+            f"surveys_{start:%Y%m%d}_{end:%Y%m%d}.csv", f"📋 Анкет: {count}",
+        )
+    finally:
+        os.unlink(path)
+
+
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Статистика з готових агрегатів (без перечитування анкет)"""
+    from analytics import format_summary
+
+    store = context.bot_data['survey_store']
+    summary = await asyncio.to_thread(store.summary)
+    await _reply(update, context, format_summary(summary, store.red_flag_options, store.onset_options))
+
+
+async def page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Гортання сторінок результатів"""
+    query = update.callback_query
+    await query.answer()
+    admin_query = context.user_data.get('admin_query')
+    if not admin_query:
+        return
+    kind, argument = admin_query
+    text, reply_markup = await _render_page(context, kind, argument, int(query.data.split(':')[1]))
+    context.bot_data['outbound'].submit(
+        context.bot, query.message.chat_id, 'edit_message_text',
+        message_id=query.message.message_id, text=text, reply_markup=reply_markup,
+    )
+
+
+def register(application, survey_store, admin_ids, outbound):
+    """Додає команди лікарів (доступні лише для ADMIN_IDS); відповіді йдуть через outbound"""
+    application.bot_data['survey_store'] = survey_store
+    application.bot_data['outbound'] = outbound
+    admins = filters.User(user_id=admin_ids)
+    application.add_handler(CommandHandler('find', find, filters=admins))
+    application.add_handler(CommandHandler('patient', patient, filters=admins))
+    application.add_handler(CommandHandler('recent', recent, filters=admins))
+    application.add_handler(CommandHandler('survey', survey, filters=admins))
+    application.add_handler(CommandHandler('export', export, filters=admins))
+    application.add_handler(CommandHandler('stats', stats, filters=admins))
+    application.add_handler(CallbackQueryHandler(page, pattern=r'^admin_page:\d+$'))
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Аналітика анкет: агрегати (кількість, гістограми, сума для середнього) за днями,
+тижнями і за весь час у таблиці survey_rollups сховища анкет.
+
+Агрегати оновлюються в тій самій транзакції, що й запис пакета анкет, одним
+SQL-запитом над новими рядками. Той самий запит над усім архівом - перерахунок
+(міграція бази або `python survey_store.py rollup`). /stats читає готові рядки
+за первинним ключем, тож час відповіді не залежить від кількості анкет.
+"""
+
+import json
+from datetime import date, timedelta
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS survey_rollups (
+    period TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    total REAL NOT NULL,
+    PRIMARY KEY (period, bucket, metric, value)
+) WITHOUT ROWID;
+"""
+
+# Відповідь про тривалість болю, набрана вручну, а не обрана з клавіатури: /stats показує
+# лише варіанти клавіатури, решта - однією групою (текст пацієнта лікарям не показується)
+OTHER = 'інше'
+
+# Категорії індексу маси тіла (ВООЗ): нижня межа -> назва
+BMI_CATEGORIES = ((0, 'недостатня вага'), (18.5, 'норма'), (25, 'надлишкова вага'), (30, 'ожиріння'))
+
+# Категорія ІМТ у SQL (value - значення ІМТ)
+_BMI_CASE = 'CASE ' + ' '.join(
+    f"WHEN value < {upper} THEN '{name}'" for (_, name), (upper, _) in zip(BMI_CATEGORIES, BMI_CATEGORIES[1:])
+) + f" ELSE '{BMI_CATEGORIES[-1][1]}' END"
+
+# Факти кожної анкети з id у (?, ?]: (день, тиждень, метрика, значення, число для середнього).
+# Тиждень - дата його понеділка (ISO 8601), тож тиждень на межі років не розривається.
+# Третій параметр - JSON-список варіантів тривалості болю, решта відповідей стає OTHER.
+# Числа беруться з <поле>_value (validation); для анкет, збережених до розбору відповідей,
+# - з тексту: CAST бере числовий префікс ("180 см" -> 180). Неправдоподібні значення відкидаються
+_FACTS = """
+WITH s AS (
+    SELECT id, red_flags, substr(saved_at, 1, 10) AS day, date(saved_at, 'weekday 0', '-6 days') AS week,
+           COALESCE(json_extract(data, '$.shkala_boly_value'), json_extract(data, '$.shkala_boly')) AS pain,
+           json_extract(data, '$.koly_zyavyvsya') AS onset,
+           COALESCE(json_extract(data, '$.zrist_value'), CAST(json_extract(data, '$.zrist') AS REAL)) AS height,
+           COALESCE(json_extract(data, '$.vaga_value'), CAST(json_extract(data, '$.vaga') AS REAL)) AS weight
+    FROM surveys WHERE id > ? AND id <= ?
+), bmi AS (
+    SELECT day, week, weight / (height * height / 10000.0) AS value
+    FROM s WHERE height BETWEEN 100 AND 250 AND weight BETWEEN 20 AND 300
+), facts (day, week, metric, value, amount) AS (
+    SELECT day, week, 'surveys', '', NULL FROM s
+    UNION ALL
+    SELECT day, week, 'red_flags', '', NULL FROM s WHERE red_flags = 1
+    UNION ALL
+    SELECT s.day, s.week, 'red_flag', f.flag, NULL FROM s JOIN survey_red_flags f ON f.survey_id = s.id
+    UNION ALL
+    SELECT day, week, 'pain', CAST(pain AS INTEGER), CAST(pain AS INTEGER) FROM s
+    WHERE CAST(pain AS TEXT) GLOB '[0-9]' OR CAST(pain AS TEXT) = '10'
+    UNION ALL
+    SELECT day, week, 'onset',
+           CASE WHEN onset IN (SELECT value FROM json_each(?)) THEN onset ELSE '""" + OTHER + """' END, NULL
+    FROM s WHERE onset IS NOT NULL
+    UNION ALL
+    SELECT day, week, 'bmi', """ + _BMI_CASE + """, value FROM bmi
+)
+"""
+
+_ROLLUP = _FACTS + """
+INSERT INTO survey_rollups (period, bucket, metric, value, count, total)
+SELECT * FROM (
+    SELECT 'day', day, metric, value, COUNT(*), TOTAL(amount) FROM facts GROUP BY day, metric, value
+    UNION ALL
+    SELECT 'week', week, metric, value, COUNT(*), TOTAL(amount) FROM facts GROUP BY week, metric, value
+    UNION ALL
+    SELECT 'all', '', metric, value, COUNT(*), TOTAL(amount) FROM facts GROUP BY metric, value
+) WHERE true
+ON CONFLICT (period, bucket, metric, value)
+DO UPDATE SET count = count + excluded.count, total = total + excluded.total
+"""
+
+
+def last_id(conn):
+    return conn.execute('SELECT COALESCE(MAX(id), 0) FROM surveys').fetchone()[0]
+
+
+def rollup(conn, after_id, upto_id=None, onset_options=()):
+    """Додає до агрегатів анкети з id у (after_id, upto_id] (викликається в транзакції запису).
+    onset_options - варіанти клавіатури питання про тривалість болю"""
+    if upto_id is None:
+        upto_id = last_id(conn)
+    if upto_id > after_id:
+        conn.execute(_ROLLUP, (after_id, upto_id, json.dumps(list(onset_options), ensure_ascii=False)))
+
+
+def rebuild(conn, onset_options=()):
+    """Перераховує агрегати з усього архіву (викликається в транзакції); окремого пакетного
+    шляху немає - той самий запит, що й для нового пакета, над усіма анкетами"""
+    conn.execute('DELETE FROM survey_rollups')
+    rollup(conn, 0, onset_options=onset_options)
+
+
+def week_bucket(day):
+    """Тиждень дня: дата понеділка"""
+    return (day - timedelta(days=day.weekday())).isoformat()
+
+
+def read_summary(conn, today=None, days=7):
+    """Агрегати за весь час, поточний тиждень і кількість анкет за останні days днів"""
+    today = today or date.today()
+
+    def metrics(period, bucket):
+        rows = conn.execute(
+            'SELECT metric, value, count, total FROM survey_rollups WHERE period = ? AND bucket = ?',
+            (period, bucket),
+        ).fetchall()
+        result = {}
+        for metric, value, count, total in rows:
+            result.setdefault(metric, {})[value] = (count, total)
+        return result
+
+    first_day = today - timedelta(days=days - 1)
+    per_day = dict(conn.execute(
+        "SELECT bucket, count FROM survey_rollups "
+        "WHERE period = 'day' AND metric = 'surveys' AND value = '' AND bucket BETWEEN ? AND ?",
+        (first_day.isoformat(), today.isoformat()),
+    ).fetchall())
+    return {
+        'all': metrics('all', ''),
+        'week': metrics('week', week_bucket(today)),
+        'days': [
+            (day, per_day.get(day.isoformat(), 0))
+            for day in (first_day + timedelta(days=offset) for offset in range(days))
+        ],
+    }
+
+
+def _share(count, total):
+    return f"{count} ({count / total:.0%})" if total else str(count)
+
+
+def _section(title, metrics, onset_options=()):
+    total = metrics.get('surveys', {}).get('', (0, 0))[0]
+    lines = [f"{title}: {total} анкет"]
+    if not total:
+        return lines
+    lines.append(f"   з червоними прапорами: {_share(metrics.get('red_flags', {}).get('', (0, 0))[0], total)}")
+    pain = metrics.get('pain', {})
+    pain_count = sum(count for count, _ in pain.values())
+    if pain_count:
+        mean = sum(amount for _, amount in pain.values()) / pain_count
+        histogram = ' '.join(f"{value}:{pain[value][0]}" for value in sorted(pain, key=int))
+        lines.append(f"   біль (0-10): середнє {mean:.1f}; {histogram}")
+    onset = {}
+    for value, (count, _) in metrics.get('onset', {}).items():
+        # Агрегати, пораховані до групування відповідей, теж не показують текст пацієнта
+        key = value if value in onset_options else OTHER
+        onset[key] = onset.get(key, 0) + count
+    if onset:
+        lines.append("   тривалість болю: " + ', '.join(
+            f"{value} {_share(onset[value], total)}" for value in (*onset_options, OTHER) if value in onset))
+    bmi = metrics.get('bmi', {})
+    bmi_count = sum(count for count, _ in bmi.values())
+    if bmi_count:
+        mean = sum(amount for _, amount in bmi.values()) / bmi_count
+        categories = ', '.join(
+            f"{name} {bmi[name][0]}" for _, name in BMI_CATEGORIES if name in bmi)
+        lines.append(f"   ІМТ: середній {mean:.1f} ({bmi_count} анкет); {categories}")
+    return lines
+
+
+def format_summary(summary, red_flag_options=(), onset_options=()):
+    """Текст відповіді на /stats"""
+    lines = ["📊 СТАТИСТИКА АНКЕТ", ""]
+    lines += _section("За весь час", summary['all'], onset_options)
+    flags = summary['all'].get('red_flag', {})
+    if flags:
+        order = list(red_flag_options) + sorted(set(flags) - set(red_flag_options))
+        lines.append("   червоні прапори: " + ', '.join(
+            f"{flag} {flags[flag][0]}" for flag in order if flag in flags))
+    lines.append("")
+    lines += _section("Цей тиждень", summary['week'], onset_options)
+    lines.append("")
+    lines.append("Останні дні: " + ', '.join(f"{day:%d.%m} - {count}" for day, count in summary['days']))
+    return '\n'.join(lines)
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк аналітики: архів з N анкет записується пакетами через SurveyStore.write_batch
+(агрегати оновлюються інкрементально), після чого порівнюється з повним перерахунком
+і з підрахунком у Python по кожній анкеті. Виводиться вартість запису пакета з агрегатами
+і без, час перерахунку всього архіву і час /stats, який не залежить від розміру архіву.
+
+    python benchmarks/bench_analytics.py --surveys 50000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import analytics  # noqa: E402
+from medical_bot import ONSET_OPTIONS, RED_FLAG_OPTIONS  # noqa: E402
+from survey_store import SurveyStore, survey_record  # noqa: E402
+
+# Відповіді, набрані вручну: в агрегатах - одна група analytics.OTHER
+ONSET_TYPED = ('третій день', 'з минулої осені', 'не пам\'ятаю')
+
+
+def make_records(count, seed):
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    records = []
+    for number in range(count):
+        flags = rng.sample(RED_FLAG_OPTIONS, rng.choice((0, 0, 0, 1, 2)))
+        user_data = {
+            'user_id': 100000 + number,
+            'pib': f'Пацієнт {number}',
+            'shkala_boly': str(rng.randint(0, 10)),
+            'koly_zyavyvsya': rng.choice(ONSET_OPTIONS * 3 + ONSET_TYPED),
+            'chervoni_prapory': ', '.join(flags) if flags else 'Немає таких симптомів',
+            'zrist': rng.choice((str(rng.randint(150, 200)), f'{rng.randint(150, 200)} см', 'не знаю')),
+            'vaga': str(rng.randint(45, 130)),
+        }
+        records.append(survey_record(user_data, start + timedelta(minutes=number * 15)))
+    return records
+
+
+def reference(records):
+    """Агрегати 'за весь час' і кількість анкет за тижнями (понеділок за календарем Python),
+    пораховані по кожній анкеті"""
+    result = Counter()
+    for record in records:
+        result['surveys', ''] += 1
+        day = datetime.fromisoformat(record['saved_at']).date()
+        result['week', (day - timedelta(days=day.isoweekday() - 1)).isoformat()] += 1
+        flags = [option for option in RED_FLAG_OPTIONS if option.lower() in record['chervoni_prapory'].lower()]
+        if flags:
+            result['red_flags', ''] += 1
+        for flag in flags:
+            result['red_flag', flag] += 1
+        result['pain', record['shkala_boly']] += 1
+        onset = record['koly_zyavyvsya']
+        result['onset', onset if onset in ONSET_OPTIONS else analytics.OTHER] += 1
+        try:
+            height = float(record['zrist'].split()[0])
+        except ValueError:
+            continue
+        bmi = float(record['vaga']) / (height * height / 10000.0)
+        name = [name for lower, name in analytics.BMI_CATEGORIES if bmi >= lower][-1]
+        result['bmi', name] += 1
+    return result
+
+
+def rollups(store, period='all'):
+    conn = store.open()
+    rows = conn.execute(
+        'SELECT bucket, metric, value, count, total FROM survey_rollups WHERE period = ? ORDER BY 1, 2, 3',
+        (period,),
+    ).fetchall()
+    return rows
+
+
+def write_all(path, records, batch_size, rollup=True):
+    store = SurveyStore(path, RED_FLAG_OPTIONS, ONSET_OPTIONS)
+    store.open()
+    original = analytics.rollup
+    if not rollup:
+        analytics.rollup = lambda conn, after_id, upto_id=None, onset_options=(): None
+    try:
+        started = time.perf_counter()
+        for start in range(0, len(records), batch_size):
+            store.write_batch(records[start:start + batch_size])
+        return store, time.perf_counter() - started
+    finally:
+        analytics.rollup = original
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--surveys', type=int, default=50000)
+    parser.add_argument('--batch-size', type=int, default=50, help='розмір пакета SurveyWriter')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.CRITICAL)
+    records = make_records(args.surveys, args.seed)
+    workdir = tempfile.mkdtemp(prefix='bench_analytics_')
+
+    plain, plain_time = write_all(os.path.join(workdir, 'plain.db'), records, args.batch_size, rollup=False)
+    store, write_time = write_all(os.path.join(workdir, 'surveys.db'), records, args.batch_size)
+    batches = -(-args.surveys // args.batch_size)
+
+    # Інкрементальні агрегати = повний перерахунок = підрахунок у Python
+    incremental = {period: rollups(store, period) for period in ('all', 'week', 'day')}
+    started = time.perf_counter()
+    store.rebuild_rollups()
+    rebuild_time = time.perf_counter() - started
+    for period, rows in incremental.items():
+        rebuilt = rollups(store, period)
+        # Суми ІМТ складаються в іншому порядку: порівнюємо з точністю округлення
+        assert [row[:4] for row in rebuilt] == [row[:4] for row in rows], period
+        assert all(abs(a[4] - b[4]) < 1e-6 * max(1, abs(b[4])) for a, b in zip(rebuilt, rows)), period
+    expected = reference(records)
+    actual = Counter({(metric, value): count for _, metric, value, count, _ in incremental['all']})
+    actual.update({('week', bucket): count for bucket, metric, _, count, _ in incremental['week'] if metric == 'surveys'})
+    assert actual == expected, (actual - expected, expected - actual)
+
+    today = records[-1]['saved_at'][:10]
+    started = time.perf_counter()
+    for _ in range(100):
+        summary = store.summary(datetime.fromisoformat(today).date())
+    stats_time = (time.perf_counter() - started) / 100
+    small = SurveyStore(os.path.join(workdir, 'small.db'), RED_FLAG_OPTIONS, ONSET_OPTIONS)
+    small.write_batch(records[-1000:])
+    started = time.perf_counter()
+    for _ in range(100):
+        small.summary(datetime.fromisoformat(today).date())
+    small_stats_time = (time.perf_counter() - started) / 100
+
+    print(f"Анкет: {args.surveys}, пакетів по {args.batch_size}: {batches}")
+    print(f"запис пакета: {plain_time / batches * 1e3:.2f} мс без агрегатів, "
+          f"{write_time / batches * 1e3:.2f} мс з агрегатами")
+    print(f"перерахунок усього архіву: {rebuild_time:.2f} с")
+    print(f"/stats: {stats_time * 1e3:.2f} мс ({args.surveys} анкет), {small_stats_time * 1e3:.2f} мс (1000 анкет)")
+    print()
+    text = analytics.format_summary(summary, RED_FLAG_OPTIONS, ONSET_OPTIONS)
+    assert not any(typed in text for typed in ONSET_TYPED), "текст відповідей пацієнтів у /stats"
+    print(text)
+    for item in (plain, store, small):
+        item.close()
+
+
+if __name__ == '__main__':
+    main()
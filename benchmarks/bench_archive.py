@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк зашифрованого архіву анкет (SURVEY_STORAGE=archive):
+
+- запис N анкет пакетами, як у потоці збереження: текстові файли (txt) проти архіву
+  (один фрагмент AES-256-GCM і один fsync на пакет);
+- потокове вивантаження: анкет/с і пік пам'яті, що не залежить від розміру архіву;
+- поворот ключа: перешифрування по сегменту за запуск і повністю, МБ/с; після нього
+  архів розшифровується в ті самі анкети, а старий ключ видаляється;
+- шлях confirm: ті самі пацієнти через справжній Application з txt і з архівом,
+  затримка відповіді на 'Підтвердити' (шифрування - у потоці збереження).
+
+Код виходу 1, якщо дані архіву не збігаються, пік пам'яті вивантаження перевищує
+--max-export-memory або p50 confirm з архівом повільніший за txt більш ніж у --max-slowdown.
+
+    python benchmarks/bench_archive.py --surveys 20000 --patients 300 --repeats 3
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from load_test import BASE, TOKEN, FakeBotRequest, LoadTest, percentile  # noqa: E402
+
+
+def make_records(count):
+    """Повні анкети зі сценарію навантажувального тесту"""
+    import medical_bot
+    from survey_store import survey_record
+
+    keys = {medical_bot.STATE_NAMES[question.state]: question.key for question in medical_bot.SURVEY_QUESTIONS}
+    start = datetime(2025, 1, 1)
+    records = []
+    for number in range(count):
+        user_data = {keys[state]: text.format(n=number) for state, text in BASE if state in keys}
+        user_data.update({
+            'user_id': 100000 + number, 'username': f'patient{number}', 'first_name': 'Пацієнт',
+            'vik_value': 40, 'zrist_value': 180, 'vaga_value': 80,
+        })
+        records.append(survey_record(user_data, start + timedelta(minutes=number)))
+    return records
+
+
+def write_all(sink, records, batch_size):
+    sink.open()
+    started = time.perf_counter()
+    for start in range(0, len(records), batch_size):
+        sink.write_batch(records[start:start + batch_size])
+    sink.close()
+    return time.perf_counter() - started
+
+
+def disk_size(directory):
+    return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+
+def digest(records):
+    """Контрольна сума анкет у порядку читання"""
+    checksum = hashlib.sha256()
+    count = 0
+    for record in records:
+        checksum.update(json.dumps(record, ensure_ascii=False, sort_keys=True).encode())
+        count += 1
+    return count, checksum.hexdigest()
+
+
+async def confirm_latency(mode, name, patients, timeout):
+    """Затримки відповіді на 'Підтвердити' і клініка (для перевірки збережених анкет)"""
+    import medical_bot
+
+    surveys_dir = os.path.join(os.environ['SURVEYS_DIR'], f'bot_{name}')
+    clinic = medical_bot.Clinic(surveys_dir=surveys_dir, survey_storage=mode,
+                                survey_db=os.path.join(surveys_dir, 'surveys.db'))
+    request = FakeBotRequest(seed=1)
+    application = medical_bot.build_application(TOKEN, request=request, clinic=clinic)
+    test = LoadTest(application, request, seed=1, think_time=0, timeout=timeout)
+
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    try:
+        await test.run(patients, ramp_up=0)
+    finally:
+        await application.stop()
+        await application.post_shutdown(application)
+        await application.shutdown()
+    assert not test.outcomes['failed'], f"{mode}: {test.outcomes['failed']} пацієнтів не завершили анкету"
+    return sorted(test.latencies['CONFIRM']), clinic
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--surveys', type=int, default=20000, help='анкет у архіві')
+    parser.add_argument('--batch-size', type=int, default=50, help='анкет у пакеті (як у SurveyWriter)')
+    parser.add_argument('--segment-mb', type=float, default=1.0, help='розмір сегмента архіву, МБ')
+    parser.add_argument('--patients', type=int, default=300, help='пацієнтів у перевірці шляху confirm')
+    parser.add_argument('--repeats', type=int, default=3, help='запусків кожного режиму в перевірці confirm')
+    parser.add_argument('--max-export-memory', type=float, default=4.0, help='допустимий пік пам\'яті вивантаження, МБ')
+    parser.add_argument('--max-slowdown', type=float, default=1.5, help='допустиме сповільнення p50 confirm')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_archive_')
+    key_file = os.path.join(workdir, 'survey_archive.key')
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': TOKEN,
+        'ADMIN_IDS': '',
+        'SURVEYS_DIR': workdir,
+        'SURVEY_ARCHIVE_KEY': key_file,
+        'STATE_DB': '',
+        'METRICS_PORT': '',
+        'OUTBOUND_RATE': '1000000',
+        'OUTBOUND_CHAT_RATE': '1000000',
+    })
+    logging.disable(logging.CRITICAL)
+
+    from medical_bot import format_survey_result
+    from survey_archive import SurveyArchive
+    from survey_writer import TextFileSink
+
+    failures = []
+    records = make_records(args.surveys)
+    plain_bytes = sum(len(json.dumps(record, ensure_ascii=False).encode()) for record in records)
+
+    text_dir = os.path.join(workdir, 'txt')
+    text_time = write_all(TextFileSink(text_dir, format_survey_result), records, args.batch_size)
+    archive_dir = os.path.join(workdir, 'archive')
+    archive = SurveyArchive(archive_dir, key_file, segment_size=int(args.segment_mb * 1024 * 1024))
+    archive_time = write_all(archive, records, args.batch_size)
+    archive_bytes = disk_size(archive_dir)
+    print(f"запис {args.surveys} анкет пакетами по {args.batch_size}:")
+    print(f"   txt:    {args.surveys / text_time:8.0f} анкет/с, {disk_size(text_dir) / 1e6:6.1f} МБ, "
+          f"{args.surveys} файлів з відкритими даними")
+    print(f"   archive:{args.surveys / archive_time:8.0f} анкет/с, {archive_bytes / 1e6:6.1f} МБ "
+          f"({plain_bytes / archive_time / 1e6:.1f} МБ/с даних), сегментів {len(archive.segments())}")
+
+    # Потокове вивантаження: у пам'яті один фрагмент, а не весь архів
+    started = time.perf_counter()
+    count, checksum = digest(archive.iter_records())
+    export_time = time.perf_counter() - started
+    tracemalloc.start()
+    digest(archive.iter_records())
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    print(f"вивантаження: {count / export_time:.0f} анкет/с ({archive_bytes / export_time / 1e6:.1f} МБ/с), "
+          f"пік пам'яті {peak:.2f} МБ при архіві {archive_bytes / 1e6:.1f} МБ")
+    if (count, checksum) != digest(records):
+        failures.append("розшифровані анкети не збігаються із записаними")
+    if peak > args.max_export_memory:
+        failures.append(f"пік пам'яті вивантаження {peak:.2f} МБ > {args.max_export_memory} МБ")
+
+    # Поворот ключа: спершу один сегмент (інкрементально), потім решта
+    old_key = archive.keys.active
+    archive.keys.add()
+    first = archive.rotate(limit=1)
+    started = time.perf_counter()
+    rest = archive.rotate()
+    rotate_time = time.perf_counter() - started
+    usage = archive.key_usage()
+    pruned = archive.prune_keys()
+    print(f"поворот ключа: перший запуск --limit 1 - сегментів {first['segments']} (лишилось {first['remaining']}), "
+          f"решта {rest['segments']} сегментів за {rotate_time:.2f} с ({rest['bytes'] / rotate_time / 1e6:.1f} МБ/с); "
+          f"видалено ключів {pruned}")
+    if set(usage) != {archive.keys.active} or pruned != [old_key]:
+        failures.append(f"після повороту фрагменти зашифровано ключами {dict(usage)}, видалено {pruned}")
+    if digest(archive.iter_records()) != (count, checksum):
+        failures.append("після повороту ключа анкети не збігаються")
+
+    # Шлях confirm: шифрування не повинне сповільнювати відповідь пацієнту. Режими
+    # чергуються, порівнюється найкращий p50 з --repeats запусків (шум одного CPU)
+    latencies = {'txt': [], 'archive': []}
+    for repeat in range(args.repeats):
+        for mode in latencies:
+            values, clinic = asyncio.run(confirm_latency(mode, f'{mode}_{repeat}', args.patients, args.timeout))
+            saved = clinic.survey_writer.stats['written']
+            if mode == 'archive':
+                stored = sum(1 for _ in clinic.survey_writer.sink.iter_records())
+                if stored != saved:
+                    failures.append(f"в архіві {stored} анкет, а збережено {saved}")
+            latencies[mode].append(values)
+    for mode, runs in latencies.items():
+        values = min(runs, key=statistics.median)
+        print(f"confirm ({mode}): p50 {statistics.median(values) * 1e3:.2f} мс, "
+              f"p99 {percentile(values, 0.99) * 1e3:.2f} мс ({args.patients} пацієнтів, найкращий з {args.repeats})")
+    slowdown = (min(statistics.median(values) for values in latencies['archive'])
+                / min(statistics.median(values) for values in latencies['txt']))
+    print(f"confirm з архівом / txt: p50 x{slowdown:.2f}")
+    if slowdown > args.max_slowdown:
+        failures.append(f"p50 confirm з архівом повільніший у {slowdown:.2f} раза")
+
+    for failure in failures:
+        print(failure)
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
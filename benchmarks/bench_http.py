@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк шару HTTP до Bot API: затримка відповідей пацієнтам через справжній
+Application з medical_bot.build_application і справжній HTTP клієнт проти фейкового
+Bot API, де кожне нове з'єднання коштує --connect-latency (TCP і TLS рукостискання
+з api.telegram.org). Пацієнти пишуть хвилями з паузою --idle між ними, як у реальному
+трафіку з затишшями; порівнюються пул PTB за замовчуванням (з'єднання закривається
+після 5 с простою) і пул з налаштуваннями BOT_API_*.
+
+Вимірюється шар HTTP, тому ліміт OUTBOUND_RATE на час бенчмарку знято.
+
+    python benchmarks/bench_http.py --patients 50 --rounds 4
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from fake_telegram import FakeTelegram  # noqa: E402
+from load_test import TOKEN, percentile  # noqa: E402
+
+
+async def run(fake, make_request, patients, rounds, idle, timeout):
+    """Затримки відповідей (перша хвиля, наступні хвилі), кількість запитів і нових з'єднань"""
+    import medical_bot
+    from telegram import Update
+
+    application = medical_bot.build_application(TOKEN, webhook=True, request=make_request())
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    calls, connections = len(fake.calls), fake.connections
+    first, warm = [], []
+    try:
+        for number in range(rounds):
+            if number:
+                await asyncio.sleep(idle)
+
+            async def patient(user_id):
+                reply = fake.expect_reply(user_id)
+                started = time.perf_counter()
+                await application.update_queue.put(
+                    Update.de_json(fake.make_update(user_id, '/start'), application.bot))
+                await asyncio.wait_for(reply, timeout)
+                return time.perf_counter() - started
+
+            # Нові пацієнти в кожній хвилі: повторний /start посеред анкети бот ігнорує
+            latencies = await asyncio.gather(*(
+                patient(100000 + number * patients + user) for user in range(patients)))
+            (warm if number else first).extend(latencies)
+    finally:
+        await application.stop()
+        await application.post_shutdown(application)
+        await application.shutdown()
+    return first, warm, len(fake.calls) - calls, fake.connections - connections
+
+
+def report(name, first, warm, requests, connections):
+    warm.sort()
+    first.sort()
+    print(f"{name}:")
+    print(f"   перша хвиля: p50 {statistics.median(first) * 1e3:.1f} мс, p99 {percentile(first, 0.99) * 1e3:.1f} мс")
+    print(f"   після паузи: p50 {statistics.median(warm) * 1e3:.1f} мс, p99 {percentile(warm, 0.99) * 1e3:.1f} мс")
+    print(f"   запитів {requests}, нових з'єднань {connections} "
+          f"(перевикористано {1 - connections / requests:.1%})")
+
+
+async def main(args):
+    if args.rounds < 2:
+        raise SystemExit('--rounds має бути не менше 2')
+    fake = FakeTelegram(connect_latency=args.connect_latency)
+    await fake.start()
+    workdir = tempfile.mkdtemp(prefix='bench_http_')
+    os.environ.update({
+        'TELEGRAM_API_URL': fake.url,
+        'SURVEYS_DIR': workdir,
+        'STATE_DB': '',
+        'METRICS_PORT': '',
+        'OUTBOUND_RATE': '100000',
+    })
+    import logging
+    logging.disable(logging.CRITICAL)
+    import medical_bot
+    from telegram.request import HTTPXRequest
+
+    configs = [
+        ("пул PTB за замовчуванням (256 з'єднань, простій 5 с)", lambda: HTTPXRequest(connection_pool_size=256)),
+        (f"BOT_API_* (пул {medical_bot.BOT_API_POOL_SIZE}, простій {medical_bot.BOT_API_KEEPALIVE:g} с"
+         f"{', HTTP/2' if medical_bot.BOT_API_HTTP2 else ''})", medical_bot.bot_api_request),
+    ]
+    results = []
+    try:
+        for name, make_request in configs:
+            result = await run(fake, make_request, args.patients, args.rounds, args.idle, args.timeout)
+            results.append(result)
+            report(name, *result)
+    finally:
+        await fake.close()
+
+    (_, default_warm, _, default_connections), (_, tuned_warm, _, tuned_connections) = results
+    print(f"p50 після паузи: {statistics.median(default_warm) / statistics.median(tuned_warm):.1f}x швидше, "
+          f"нових з'єднань: {default_connections} -> {tuned_connections}")
+    assert tuned_connections < default_connections, "налаштований пул не перевикористав з'єднання"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patients', type=int, default=50, help='пацієнтів у хвилі')
+    parser.add_argument('--rounds', type=int, default=4, help='кількість хвиль')
+    parser.add_argument('--idle', type=float, default=6.0, help='пауза між хвилями, с')
+    parser.add_argument('--connect-latency', type=float, default=0.1, help='вартість нового з\'єднання, с')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    asyncio.run(main(parser.parse_args()))
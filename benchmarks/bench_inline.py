@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк інтерфейсу анкети (SURVEY_UI): N пацієнтів заповнюють ту саму анкету в режимі
+'reply' (кожне питання - нове повідомлення, кожна відповідь - повідомлення пацієнта) і
+'inline' (кнопки; натискання редагує те саме повідомлення бота). Пацієнт поводиться як
+клієнт Telegram: якщо під останнім повідомленням бота є кнопки з його відповіддю, він їх
+натискає (кілька варіантів - по одному і 'Готово'), інакше відповідає текстом.
+
+Порівнюються повідомлення в чаті на анкету (бота і пацієнта), виклики Bot API за методами
+і час анкети; перевіряється, що анкети в обох режимах збережено з тими самими відповідями.
+Inline-режим проходиться ще раз з лімітом сесій у пам'яті (SESSION_MAX) і вивантаженням
+у STATE_DB: натискання кнопки має відновити вивантажену сесію.
+Код виходу 1, якщо в inline-режимі повідомлень у чаті не менше, ніж у reply.
+
+    python benchmarks/bench_inline.py --patients 200
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from telegram import Update  # noqa: E402
+
+from load_test import SCENARIOS, TOKEN, FakeBotRequest, LoadTest  # noqa: E402
+
+# Відповіді, що порівнюються між режимами
+CHECKED_FIELDS = ('pib', 'vik', 'de_bolit', 'kharakter_boly', 'chervoni_prapory', 'suputni', 'aktyvnist',
+                  'sport_yakyi', 'zrist_value', 'vaga_value')
+
+
+class KeyboardBotRequest(FakeBotRequest):
+    """Фейковий Bot API, що пам'ятає останнє повідомлення бота з inline-кнопками в кожному чаті"""
+
+    def __init__(self):
+        super().__init__(seed=1)
+        self.keyboards = {}
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        status, body = await super().do_request(url, method, request_data, **kwargs)
+        api_method = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if api_method in ('sendMessage', 'editMessageText', 'editMessageReplyMarkup'):
+            chat_id = int(params['chat_id'])
+            message_id = params.get('message_id') or json.loads(body)['result']['message_id']
+            markup = params.get('reply_markup')
+            markup = json.loads(markup) if isinstance(markup, str) else markup
+            if markup and 'inline_keyboard' in markup:
+                self.keyboards[chat_id] = (message_id, markup['inline_keyboard'])
+            elif message_id == self.keyboards.get(chat_id, (None,))[0] or api_method == 'sendMessage':
+                self.keyboards.pop(chat_id, None)
+            if api_method == 'editMessageReplyMarkup':
+                self._wake(chat_id)
+        return status, body
+
+
+class Patient(LoadTest):
+    """Пацієнт, що натискає кнопки, коли вони є"""
+
+    _callback_id = itertools.count(1)
+
+    async def press(self, user_id, message_id, data):
+        waiter = asyncio.get_running_loop().create_future()
+        self.request.waiters[user_id] = waiter
+        chat = {'id': user_id, 'type': 'private'}
+        user = {'id': user_id, 'is_bot': False, 'first_name': 'Пацієнт', 'username': f'patient{user_id}'}
+        await self.application.update_queue.put(Update.de_json({
+            'update_id': next(self._update_id),
+            'callback_query': {
+                'id': str(next(self._callback_id)), 'from': user, 'chat_instance': str(user_id), 'data': data,
+                'message': {
+                    'message_id': message_id, 'date': int(time.time()), 'chat': chat, 'text': '',
+                    'from': {'id': 1, 'is_bot': True, 'first_name': 'Load'},
+                },
+            },
+        }, self.application.bot))
+        self.updates += 1
+        await asyncio.wait_for(waiter, self.timeout)
+
+    async def answer(self, user_id, text):
+        """Повертає (повідомлень пацієнта, натискань)"""
+        message_id, rows = self.request.keyboards.get(user_id, (None, ()))
+        done = next((button['callback_data'] for row in rows for button in row
+                     if button['callback_data'].endswith(':done')), None)
+        # Позначка ✅ означає вибраний варіант лише на клавіатурі з кількома варіантами
+        buttons = {(button['text'].removeprefix('✅ ') if done else button['text']): button['callback_data']
+                   for row in rows for button in row}
+        selected = {button['text'][2:] for row in rows for button in row if done and button['text'].startswith('✅ ')}
+        answers = text.split(', ') if done else [text]
+        if buttons and all(answer in buttons for answer in answers):
+            # Кілька варіантів: знімає зайві позначки (при редагуванні поточні вже позначені) і ставить потрібні
+            toggles = [option for option in buttons if option in selected.symmetric_difference(answers)]
+            for option in toggles if done else answers:
+                await self.press(user_id, message_id, buttons[option])
+            if done:
+                await self.press(user_id, message_id, done)
+            return 0, len(toggles if done else answers) + bool(done)
+        if not await self.send(user_id, text):
+            raise RuntimeError(f"пацієнт {user_id} не отримав відповіді на {text!r}")
+        return 1, 0
+
+    async def survey(self, number, scenario):
+        user_id = 100000 + number
+        started = time.perf_counter()
+        typed = presses = 0
+        for _, text in SCENARIOS[scenario]:
+            sent, pressed = await self.answer(user_id, text.format(n=number))
+            typed += sent
+            presses += pressed
+        return typed, presses, time.perf_counter() - started
+
+
+async def run(mode, patients, scenario, timeout, spill=False):
+    """spill - у пам'яті лише десята частина сесій, решта вивантажується в STATE_DB
+    і відновлюється при натисканні кнопки"""
+    import medical_bot
+    from session import Session
+    from state_store import SQLitePersistence
+
+    name = f'{mode}_spill' if spill else mode
+    request = KeyboardBotRequest()
+    clinic = medical_bot.Clinic(survey_db=os.path.join(os.environ['SURVEYS_DIR'], f'{name}.db'), survey_ui=mode)
+    persistence = None
+    if spill:
+        clinic.session_cache.max_sessions = max(1, patients // 10)
+        persistence = SQLitePersistence(os.path.join(os.environ['SURVEYS_DIR'], f'{name}_state.db'),
+                                        user_data_type=Session, preload=False)
+    application = medical_bot.build_application(TOKEN, request=request, clinic=clinic, persistence=persistence)
+    test = Patient(application, request, seed=1, think_time=0, timeout=timeout)
+
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    try:
+        results = await asyncio.gather(*(test.survey(number, scenario) for number in range(patients)))
+    finally:
+        await application.stop()
+        await application.post_shutdown(application)
+        await application.shutdown()
+    records = {
+        record['user_id']: {field: record.get(field) for field in CHECKED_FIELDS}
+        for record in clinic.survey_store.recent(limit=patients)
+    }
+    assert len(records) == patients, f"{mode}: збережено {len(records)} анкет з {patients}"
+    calls = {method: count / patients for method, count in request.calls.items() if method != 'getMe'}
+    return {
+        'typed': results[0][0],
+        'presses': results[0][1],
+        'calls': calls,
+        'survey': statistics.median(seconds for _, _, seconds in results),
+        'records': records,
+        'sessions': dict(clinic.session_cache.stats),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patients', type=int, default=200)
+    parser.add_argument('--scenario', choices=('plain', 'branching', 'edit'), default='branching')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_inline_')
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': TOKEN,
+        'ADMIN_IDS': '',
+        'SURVEYS_DIR': workdir,
+        'STATE_DB': '',
+        'METRICS_PORT': '',
+        'OUTBOUND_RATE': '1000000',
+        'OUTBOUND_CHAT_RATE': '1000000',
+    })
+    logging.disable(logging.CRITICAL)
+
+    results = {mode: asyncio.run(run(mode, args.patients, args.scenario, args.timeout)) for mode in ('reply', 'inline')}
+    spilled = asyncio.run(run('inline', args.patients, args.scenario, args.timeout, spill=True))
+    for mode, result in results.items():
+        calls = result['calls']
+        chat_messages = calls.get('sendMessage', 0) + result['typed']
+        result['chat_messages'] = chat_messages
+        print(f"{mode}: {chat_messages:.0f} повідомлень у чаті на анкету (бот {calls.get('sendMessage', 0):.0f}, "
+              f"пацієнт {result['typed']}), натискань кнопок {result['presses']}, анкета p50 {result['survey'] * 1e3:.0f} мс")
+        print("   виклики Bot API на анкету: " + ", ".join(f"{method} {count:.0f}" for method, count in sorted(calls.items())))
+    reply, inline = results['reply'], results['inline']
+    assert reply['records'] == inline['records'], "відповіді в режимах reply та inline відрізняються"
+    print(f"повідомлень у чаті: {reply['chat_messages']:.0f} -> {inline['chat_messages']:.0f}, "
+          f"sendMessage: {reply['calls'].get('sendMessage', 0):.0f} -> {inline['calls'].get('sendMessage', 0):.0f}; "
+          "анкети однакові - OK")
+    sessions = spilled['sessions']
+    print(f"inline з вивантаженням сесій: вивантажено {sessions['spilled']}, відновлено {sessions['restored']}")
+    assert sessions['restored'] and spilled['records'] == reply['records'], \
+        "inline: вивантажені сесії не відновлюються при натисканні кнопок"
+    if inline['chat_messages'] >= reply['chat_messages']:
+        print("Inline-режим не зменшив кількість повідомлень")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
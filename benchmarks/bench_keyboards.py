@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Мікро-бенчмарк: побудова клавіатури на кожне повідомлення (як було раніше)
+проти готових клавіатур з реєстру keyboards.py.
+
+    python benchmarks/bench_keyboards.py
+"""
+
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from telegram import ReplyKeyboardMarkup  # noqa: E402
+
+from keyboards import reply_keyboard  # noqa: E402
+
+RED_FLAGS = [
+    ['Незрозуміла втрата ваги', 'Температура'],
+    ['Онкологія в анамнезі'],
+    ['Проблеми з сечовипусканням'],
+    ['Проблеми з дефекацією'],
+    ['Оніміння в промежині'],
+    ['Різка слабкість кінцівки'],
+    ['Немає таких симптомів']
+]
+REGISTERED = reply_keyboard(RED_FLAGS)
+
+
+def per_update_build():
+    """Як у старих обробниках: новий список, новий ReplyKeyboardMarkup і серіалізація PTB"""
+    keyboard = [
+        ['Незрозуміла втрата ваги', 'Температура'],
+        ['Онкологія в анамнезі'],
+        ['Проблеми з сечовипусканням'],
+        ['Проблеми з дефекацією'],
+        ['Оніміння в промежині'],
+        ['Різка слабкість кінцівки'],
+        ['Немає таких симптомів']
+    ]
+    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
+    return {'reply_markup': json.dumps(reply_markup.to_dict())}
+
+
+def registry_lookup():
+    """Новий шлях: готовий об'єкт і готовий JSON"""
+    return {'reply_markup': REGISTERED.json}
+
+
+def peak_allocation(func, calls=1000):
+    """Середній пік виділеної пам'яті під час одного виклику (байти)"""
+    func()
+    tracemalloc.start()
+    total = 0
+    for _ in range(calls):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func()
+        total += max(0, tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return total / calls
+
+
+def main():
+    number = 20000
+    for name, func in (('побудова на кожне оновлення', per_update_build), ('реєстр клавіатур', registry_lookup)):
+        seconds = min(timeit.repeat(func, number=number, repeat=5)) / number
+        print(f"{name:30} {seconds * 1e6:8.2f} мкс/оновлення  {peak_allocation(func):8.0f} байт/оновлення")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Мікро-бенчмарк: накладні витрати інструментації metrics.py на одне оновлення
+(обгортка обробника стану + гістограма + воронка) і вартість одного збирання /metrics.
+
+    python benchmarks/bench_metrics.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from telegram import Update  # noqa: E402
+
+from metrics import REGISTRY, ConversationMetrics, Histogram  # noqa: E402
+
+STATE_NAMES = tuple(f'STATE_{i}' for i in range(25))
+
+
+async def handler(update, context):
+    """Порожній обробник: вимірюємо лише обгортку"""
+    return 1
+
+
+def make_update(user_id):
+    return Update.de_json({
+        'update_id': 1,
+        'message': {
+            'message_id': 1, 'date': 0, 'text': 'x',
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'P'},
+        },
+    }, None)
+
+
+async def time_calls(func, updates):
+    started = time.perf_counter()
+    for update in updates:
+        await func(update, None)
+    return (time.perf_counter() - started) / len(updates)
+
+
+async def handler_overhead(calls=200000):
+    conversation_metrics = ConversationMetrics(STATE_NAMES)
+    wrapped = conversation_metrics._wrap(handler, 0, STATE_NAMES[0])
+    updates = [make_update(user_id) for user_id in range(1000)] * (calls // 1000)
+    plain = min([await time_calls(handler, updates) for _ in range(3)])
+    instrumented = min([await time_calls(wrapped, updates) for _ in range(3)])
+    return plain, instrumented
+
+
+def main():
+    plain, instrumented = asyncio.run(handler_overhead())
+    print(f"{'обробник без метрик':34} {plain * 1e6:8.3f} мкс/оновлення")
+    print(f"{'обробник з метриками':34} {instrumented * 1e6:8.3f} мкс/оновлення"
+          f"  (+{(instrumented - plain) * 1e6:.3f} мкс)")
+
+    histogram = Histogram((0.001, 0.01, 0.1, 1, 10))
+    number = 1000000
+    seconds = min(timeit.repeat(lambda: histogram.observe(0.02), number=number, repeat=5)) / number
+    print(f"{'Histogram.observe':34} {seconds * 1e9:8.0f} нс")
+
+    seconds = min(timeit.repeat(REGISTRY.render, number=100, repeat=3)) / 100
+    print(f"{'збирання /metrics':34} {seconds * 1e3:8.3f} мс  ({len(REGISTRY.render())} байт)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк format_survey_result: шаблон з кешем проти попередньої реалізації.
+Збіг виводу з попередньою реалізацією перевіряє tests/test_render.py (python -m pytest).
+
+    python benchmarks/bench_render.py
+"""
+
+import os
+import sys
+import timeit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+from survey_render import _render_body, format_survey_result  # noqa: E402
+from test_render import BASE_SURVEY, legacy_format_survey_result  # noqa: E402
+
+
+def confirmation_path(render):
+    """Як при підтвердженні: превʼю пацієнту, копія лікарям і файл"""
+    render(BASE_SURVEY, False)
+    render(BASE_SURVEY, True)
+    render(BASE_SURVEY, True)
+
+
+def main():
+    number = 20000
+    for name, render in (('попередня реалізація', legacy_format_survey_result), ('шаблон + кеш', format_survey_result)):
+        seconds = min(timeit.repeat(lambda: confirmation_path(render), number=number, repeat=5)) / number
+        print(f"{name:24} {seconds * 1e6:8.2f} мкс на підтвердження")
+
+    def uncached():
+        _render_body.cache_clear()
+        confirmation_path(format_survey_result)
+
+    seconds = min(timeit.repeat(uncached, number=number, repeat=5)) / number
+    print(f"{'шаблон без кешу':24} {seconds * 1e6:8.2f} мкс на підтвердження")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк повторного візиту: N пацієнтів заповнюють анкету, а потім повертаються з новим
+епізодом болю. Повторний пацієнт бере ПІБ, вік, зріст, вагу, супутні захворювання і
+активність з останньої анкети (вказівник latest_surveys за user_id) і одразу переходить
+до питань про біль. Порівнюються повідомлення пацієнта і бота на візит, час візиту
+і затримка /start (з пошуком попередньої анкети і без).
+
+Перевіряється, що друга анкета збережена з перенесеними відповідями; код виходу 1,
+якщо повторний візит не коротший за перший.
+
+    python benchmarks/bench_returning.py --patients 200
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from load_test import BASE, CONFIRM, TOKEN, FakeBotRequest, LoadTest, percentile  # noqa: E402
+
+
+async def visit(test, user_id, script, number, latencies):
+    """Проходить сценарій; повертає (повідомлень пацієнта, секунд)"""
+    started = time.perf_counter()
+    for state, text in script:
+        sent = time.perf_counter()
+        if not await test.send(user_id, text.format(n=number)):
+            raise RuntimeError(f"пацієнт {user_id} не отримав відповіді в стані {state}")
+        latencies.setdefault(state, []).append(time.perf_counter() - sent)
+    return len(script), time.perf_counter() - started
+
+
+async def wait_written(writer, count, timeout):
+    deadline = time.perf_counter() + timeout
+    while writer.stats['written'] < count:
+        if time.perf_counter() > deadline:
+            raise RuntimeError(f"збережено {writer.stats['written']} анкет з {count}")
+        await asyncio.sleep(0.05)
+
+
+async def run(args):
+    import medical_bot
+
+    skipped = {medical_bot.STATE_NAMES[q.state] for q in medical_bot.SURVEY_QUESTIONS if q.stable}
+    first_script = BASE + CONFIRM
+    returning_script = (
+        [BASE[0], ('RETURNING', medical_bot.REUSE_LABEL)]
+        + [step for step in BASE[1:] if step[0] not in skipped] + CONFIRM
+    )
+
+    request = FakeBotRequest(seed=1)
+    application = medical_bot.build_application(TOKEN, request=request)
+    clinic = application.bot_data['clinic']
+    test = LoadTest(application, request, seed=1, think_time=0, timeout=args.timeout)
+    users = [100000 + number for number in range(args.patients)]
+    results = {}
+
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    try:
+        for name, script, expected in (('перший візит', first_script, 1), ('повторний візит', returning_script, 2)):
+            latencies = {}
+            sent_before = request.calls.get('sendMessage', 0)
+            started = time.perf_counter()
+            visits = await asyncio.gather(*(
+                visit(test, user_id, script, number, latencies) for number, user_id in enumerate(users)
+            ))
+            duration = time.perf_counter() - started
+            await wait_written(clinic.survey_writer, expected * args.patients, args.timeout)
+            results[name] = {
+                'messages': visits[0][0],
+                'replies': (request.calls.get('sendMessage', 0) - sent_before) / args.patients,
+                'visit': statistics.median(seconds for _, seconds in visits),
+                'start': sorted(latencies['start']),
+                'duration': duration,
+            }
+        # Друга анкета кожного пацієнта - з відповідями першої
+        for number, user_id in enumerate(users):
+            record = clinic.survey_store.latest_for_patient(user_id)
+            assert record['pib'] == f'Пацієнт {number}' and record['zrist'] == '180', record
+            assert record['vaga_value'] == 80 and 'prefilled' not in record, record
+        saved = len(clinic.survey_store.for_patient(users[0]))
+        assert saved == 2, f"у пацієнта {saved} анкет замість 2"
+    finally:
+        await application.stop()
+        await application.post_shutdown(application)
+        await application.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patients', type=int, default=200)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_returning_')
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': TOKEN,
+        'ADMIN_IDS': '',
+        'SURVEYS_DIR': workdir,
+        'SURVEY_STORAGE': 'sqlite',
+        'STATE_DB': os.path.join(workdir, 'bot_state.db'),
+        'METRICS_PORT': '',
+        'OUTBOUND_RATE': '1000000',
+        'OUTBOUND_CHAT_RATE': '1000000',
+    })
+    logging.disable(logging.CRITICAL)
+
+    results = asyncio.run(run(args))
+    for name, result in results.items():
+        start = result['start']
+        print(f"{name}: {result['messages']} повідомлень пацієнта, {result['replies']:.0f} відповідей бота, "
+              f"візит p50 {result['visit'] * 1e3:.0f} мс ({args.patients} пацієнтів за {result['duration']:.2f} с); "
+              f"/start p50 {statistics.median(start) * 1e3:.2f} мс, p99 {percentile(start, 0.99) * 1e3:.2f} мс")
+    first, second = results.values()
+    print(f"повторний візит: {first['messages'] - second['messages']} повідомлень пацієнта менше "
+          f"({1 - second['messages'] / first['messages']:.0%}), перенесені відповіді збережено - OK")
+    if second['messages'] >= first['messages']:
+        print("Повторний візит не коротший за перший")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
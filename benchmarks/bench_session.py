@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк пам'яті: 100 000 незавершених анкет у звичайному dict і в компактній Session.
+Відповіді щоразу декодуються з JSON (як текст повідомлень Telegram), тому кожна
+сесія-словник тримає власні копії рядків варіантів. Також вимірюється прохід
+SessionCache: його вартість залежить від кількості протермінованих сесій, а не всіх.
+
+    python benchmarks/bench_session.py [--sessions 100000]
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import medical_bot  # noqa: E402,F401  реєструє довідники варіантів анкети
+from session import Session  # noqa: E402
+from session_cache import SessionCache  # noqa: E402
+from survey_render import format_survey_result  # noqa: E402
+
+# Відповіді в порядку анкети; None - відповідь вільним текстом
+ANSWERS = [
+    ('pib', None),
+    ('vik', None),
+    ('de_bolit', 'Біль віддає у ногу'),
+    ('onіmіnnya', 'Ні'),
+    ('koly_zyavyvsya', 'Більше 3 місяців (хронічний)'),
+    ('travma', 'Ні'),
+    ('kharakter_boly', 'Ниючий'),
+    ('shkala_boly', '7'),
+    ('pohirshue', 'Сидіння'),
+    ('polehshue', 'Лежання'),
+    ('ranishi_epizody', 'Так'),
+    ('ranishi_yak_likuvaly', None),
+    ('chervoni_prapory', 'Немає таких симптомів'),
+    ('suputni', 'Немає супутніх захворювань'),
+    ('aktyvnist', 'Сидяча робота'),
+    ('sport_yakyi', 'Не займаюся спортом'),
+    ('likuvannya', 'Не приймаю ліків'),
+    ('fizioterapiya', 'Ні'),
+    ('zrist', None),
+    ('vaga', None),
+]
+FREE_TEXT = {
+    'pib': 'Пацієнт {n}', 'vik': '{age}', 'ranishi_yak_likuvaly': 'Масаж і ЛФК',
+    'zrist': '{height}', 'vaga': '{weight}',
+}
+
+
+def received(text):
+    """Новий об'єкт рядка, як після розбору JSON оновлення"""
+    return json.loads(json.dumps(text))
+
+
+def fill(session, number, rng):
+    """Заповнює сесію як /start і випадкову кількість відповідей (анкета не завершена)"""
+    session['username'] = received(f'patient{number}')
+    session['user_id'] = 100000 + number
+    session['date'] = received('18.10.2026')
+    session['editing'] = False
+    for key, answer in ANSWERS[:rng.randint(1, len(ANSWERS))]:
+        if answer is None:
+            answer = FREE_TEXT[key].format(
+                n=number, age=rng.randint(18, 90), height=rng.randint(150, 200), weight=rng.randint(45, 130))
+        session[key] = received(answer)
+    return session
+
+
+def build(factory, count, seed):
+    """Створює count сесій і повертає їх разом із приростом пам'яті (байт)"""
+    rng = random.Random(seed)
+    gc.collect()
+    tracemalloc.start()
+    sessions = [fill(factory(), number, rng) for number in range(count)]
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return sessions, size
+
+
+def render_time(sessions):
+    started = time.perf_counter()
+    for session in sessions:
+        format_survey_result(session, for_admin=True)
+    return (time.perf_counter() - started) / len(sessions)
+
+
+def sweep_time(resident, expired):
+    """Час одного проходу, коли з resident сесій протерміновано expired"""
+    cache = SessionCache(ttl=60)
+    for user_id in range(resident):
+        cache._touch(user_id, (user_id, user_id), None)
+    # Найстаріші expired сесій "неактивні" довше за TTL
+    for seen in cache._by_ttl.values():
+        for user_id in range(expired):
+            seen[user_id] -= 3600
+    started = time.perf_counter()
+    count = len(cache._pop_expired(time.monotonic()))
+    assert count == expired, count
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    plain, plain_size = build(dict, args.sessions, args.seed)
+    compact, compact_size = build(Session, args.sessions, args.seed)
+
+    # Та сама анкета в обох представленнях - той самий текст і ті самі дані для збереження
+    for before, after in zip(plain[:1000], compact[:1000]):
+        assert after.to_dict() == before, (before, after)
+        assert format_survey_result(after, for_admin=True) == format_survey_result(before, for_admin=True)
+
+    print(f"Сесій: {args.sessions}")
+    print(f"{'dict':10} {plain_size / 2 ** 20:8.1f} МБ  {plain_size / args.sessions:7.0f} байт/сесію")
+    print(f"{'Session':10} {compact_size / 2 ** 20:8.1f} МБ  {compact_size / args.sessions:7.0f} байт/сесію"
+          f"  ({compact_size / plain_size:.0%} від dict)")
+    sample = plain[:20000], compact[:20000]
+    print(f"format_survey_result: dict {render_time(sample[0]) * 1e6:.2f} мкс, "
+          f"Session {render_time(sample[1]) * 1e6:.2f} мкс")
+    for expired in (0, 1000):
+        print(f"прохід SessionCache ({args.sessions} сесій, протерміновано {expired}): "
+              f"{sweep_time(args.sessions, expired) * 1e3:.3f} мс")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк холодного старту бота: час імпорту medical_bot і час від запуску процесу
+`python medical_bot.py` (polling) до відповіді на перше оновлення, яке вже чекає в черзі
+фейкового Bot API. У STATE_DB заздалегідь лежать --sessions незавершених анкет (як після
+перезапуску на Render); другим оновленням пацієнт з такою анкетою продовжує її, і бот
+має відповісти наступним питанням.
+
+Код виходу 1, якщо час перевищує поріг (--max-import-ms, --max-first-update-ms).
+
+    python benchmarks/bench_startup.py --sessions 20000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from fake_telegram import FakeTelegram  # noqa: E402
+from load_test import TOKEN  # noqa: E402
+from state_store import SCHEMA  # noqa: E402
+
+# Стан VIK (друге питання) і очікувана відповідь на нього
+VIK = 1
+NEXT_PROMPT = '1️⃣ ДЕ САМЕ БОЛИТЬ?'
+
+IMPORT_CODE = (
+    "import time; started = time.perf_counter(); import medical_bot; "
+    "print(time.perf_counter() - started)"
+)
+
+
+def environment(workdir, api_url=''):
+    env = {key: value for key, value in os.environ.items() if key not in ('WEBHOOK_URL', 'RENDER_EXTERNAL_URL')}
+    env.update({
+        'TELEGRAM_BOT_TOKEN': TOKEN,
+        'TELEGRAM_API_URL': api_url,
+        'ADMIN_IDS': '',
+        'SURVEYS_DIR': workdir,
+        'STATE_DB': os.path.join(workdir, 'bot_state.db'),
+        'METRICS_PORT': '',
+        'PYTHONPATH': ROOT,
+    })
+    return env
+
+
+def prepare_state(path, sessions):
+    """STATE_DB з sessions пацієнтами, які відповіли на ПІБ і чекають питання про вік"""
+    with sqlite3.connect(path) as conn:
+        conn.executescript(SCHEMA)
+        conn.executemany('INSERT INTO user_data (user_id, data) VALUES (?, ?)', (
+            (user_id, json.dumps({
+                'user_id': user_id, 'username': f'patient{user_id}', 'pib': f'Пацієнт {user_id}',
+                'date': '18.10.2026', 'editing': False,
+            }, ensure_ascii=False))
+            for user_id in range(1000, 1000 + sessions)
+        ))
+        conn.executemany('INSERT INTO conversations (name, key, user_id, state) VALUES (?, ?, ?, ?)', (
+            ('survey', json.dumps([user_id, user_id]), user_id, VIK)
+            for user_id in range(1000, 1000 + sessions)
+        ))
+
+
+def import_time(workdir, runs):
+    times = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', IMPORT_CODE], env=environment(workdir),
+            capture_output=True, text=True, check=True, cwd=ROOT,
+        ).stdout
+        times.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(times)
+
+
+async def first_update(workdir, sessions, timeout):
+    """(секунди до відповіді на /start, секунди до відповіді пацієнту з відновленою анкетою)"""
+    prepare_state(os.path.join(workdir, 'bot_state.db'), sessions)
+    fake = FakeTelegram()
+    await fake.start()
+    # Оновлення чекають у Telegram, поки бот запускається
+    await fake.pending_updates.put(fake.make_update(1, '/start'))
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(ROOT, 'medical_bot.py'), env=environment(workdir, fake.url), cwd=ROOT,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        await asyncio.wait_for(fake.expect_reply(1), timeout)
+        first = time.perf_counter() - started
+        # Пацієнт з анкетою, збереженою до перезапуску, відповідає на питання про вік
+        returning = 1000 + sessions // 2
+        reply = fake.expect_reply(returning)
+        sent = time.perf_counter()
+        await fake.pending_updates.put(fake.make_update(returning, '40'))
+        text = await asyncio.wait_for(reply, timeout)
+        assert text.startswith(NEXT_PROMPT), text
+        return first, time.perf_counter() - sent
+    finally:
+        process.send_signal(signal.SIGTERM)
+        await process.wait()
+        await fake.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=20000, help='незавершених анкет у STATE_DB')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--max-import-ms', type=float, default=750.0)
+    parser.add_argument('--max-first-update-ms', type=float, default=1500.0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_startup_')
+    imported = import_time(workdir, args.runs)
+    results = []
+    for run in range(args.runs):
+        rundir = os.path.join(workdir, str(run))
+        os.makedirs(rundir)
+        results.append(asyncio.run(first_update(rundir, args.sessions, args.timeout)))
+    first = statistics.median(result[0] for result in results)
+    restored = statistics.median(result[1] for result in results)
+
+    print(f"імпорт medical_bot: {imported * 1e3:.0f} мс (поріг {args.max_import_ms:.0f})")
+    print(f"запуск -> відповідь на перше оновлення ({args.sessions} анкет у STATE_DB): "
+          f"{first * 1e3:.0f} мс (поріг {args.max_first_update_ms:.0f})")
+    print(f"відповідь пацієнту з відновленою анкетою: {restored * 1e3:.0f} мс")
+    if imported * 1e3 > args.max_import_ms or first * 1e3 > args.max_first_update_ms:
+        print("Перевищено поріг часу запуску")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
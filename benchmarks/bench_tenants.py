@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк кількох клінік в одному процесі (TENANTS): `python medical_bot.py` з N ботами
+проти фейкового Bot API (окрема черга getUpdates на кожен токен). Кожен бот відповідає
+на /start, після чого порівнюється пам'ять процесу (RSS) з однією і з N клініками:
+скільки коштує кожна додаткова клініка відносно окремого процесу на клініку.
+
+Перевіряється ізоляція: один і той самий пацієнт заповнює анкети у двох клініках
+одночасно, і стан розмови кожної клініки не впливає на іншу; /stats лікаря клініки
+відповідає її бот. Код виходу 1, якщо додаткова клініка дорожча за --max-share процесу.
+
+    python benchmarks/bench_tenants.py --clinics 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from fake_telegram import FakeTelegram  # noqa: E402
+
+PATIENT = 500
+ADMIN = 9000
+AGE_PROMPT = 'Скільки вам років?'
+NEXT_PROMPT = '1️⃣ ДЕ САМЕ БОЛИТЬ?'
+
+
+def token(number):
+    return f'{1000 + number}:CLINIC{number}'
+
+
+def environment(workdir, api_url, tenants_path):
+    env = {key: value for key, value in os.environ.items() if key not in ('WEBHOOK_URL', 'RENDER_EXTERNAL_URL')}
+    env.update({
+        'TENANTS': tenants_path,
+        'TELEGRAM_API_URL': api_url,
+        'SURVEYS_DIR': os.path.join(workdir, 'surveys'),
+        'STATE_DB': os.path.join(workdir, 'bot_state.db'),
+        'METRICS_PORT': '',
+        'PYTHONPATH': ROOT,
+    })
+    return env
+
+
+def rss_mb(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    raise RuntimeError('VmRSS недоступний')
+
+
+async def ask(fake, number, text, user_id, timeout):
+    """Надсилає повідомлення боту клініки number і чекає на його відповідь"""
+    reply = fake.expect_reply(user_id, token(number))
+    await fake.updates_for(token(number)).put(fake.make_update(user_id, text))
+    return await asyncio.wait_for(reply, timeout)
+
+
+async def run(workdir, clinics, timeout, check):
+    """RSS процесу з clinics ботами після того, як кожен відповів на /start"""
+    os.makedirs(workdir)
+    tenants_path = os.path.join(workdir, 'tenants.json')
+    with open(tenants_path, 'w', encoding='utf-8') as f:
+        json.dump([
+            {'name': f'clinic{number}', 'token': token(number), 'admin_ids': [ADMIN + number]}
+            for number in range(clinics)
+        ], f)
+    fake = FakeTelegram()
+    await fake.start()
+    for number in range(clinics):
+        fake.updates_for(token(number))
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(ROOT, 'medical_bot.py'), env=environment(workdir, fake.url, tenants_path),
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(ask(fake, number, '/start', PATIENT, timeout) for number in range(clinics)))
+        ready = time.perf_counter() - started
+        if check:
+            # Той самий пацієнт у двох клініках: перша вже на питанні про біль, друга чекає ПІБ
+            assert (await ask(fake, 0, 'Іваненко Іван', PATIENT, timeout)).startswith(AGE_PROMPT)
+            assert (await ask(fake, 0, '40', PATIENT, timeout)).startswith(NEXT_PROMPT)
+            assert (await ask(fake, 1, 'Петренко Петро', PATIENT, timeout)).startswith(AGE_PROMPT)
+            assert (await ask(fake, 1, '41', PATIENT, timeout)).startswith(NEXT_PROMPT)
+            text = await ask(fake, 1, '/stats', ADMIN + 1, timeout)
+            assert text.startswith('📊'), text
+        await asyncio.sleep(0.5)
+        return rss_mb(process.pid), ready
+    finally:
+        process.send_signal(signal.SIGTERM)
+        await process.wait()
+        await fake.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clinics', type=int, default=20)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--max-share', type=float, default=0.1,
+                        help='допустима пам\'ять додаткової клініки як частка окремого процесу')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_tenants_')
+    single, _ = asyncio.run(run(os.path.join(workdir, 'single'), 1, args.timeout, check=False))
+    many, ready = asyncio.run(run(os.path.join(workdir, 'many'), args.clinics, args.timeout, check=True))
+    extra = (many - single) / (args.clinics - 1)
+
+    print(f"процес з 1 клінікою: {single:.1f} МБ RSS")
+    print(f"процес з {args.clinics} клініками: {many:.1f} МБ RSS, усі боти відповіли за {ready * 1e3:.0f} мс")
+    print(f"кожна додаткова клініка: {extra:.2f} МБ ({extra / single:.1%} окремого процесу, "
+          f"поріг {args.max_share:.0%}); {args.clinics} окремих процесів: {single * args.clinics:.0f} МБ")
+    print("ізоляція клінік: стан розмов і команди лікарів окремі - OK")
+    if extra > single * args.max_share:
+        print("Додаткова клініка дорожча за поріг")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк горизонтального масштабування: ті самі пацієнти (сценарії load_test.py)
+проходять анкету через WorkerPool з 1, 2, 4... процесами-обробниками. Оновлення
+розподіляються за user_id, як це робить маршрутизатор medical_bot при WORKERS > 1,
+а процеси звертаються до фейкового Bot API (fake_telegram.py) по HTTP і пишуть
+анкети в спільну SQLite. Прискорення обмежене кількістю ядер (виводиться у звіті).
+
+    python benchmarks/bench_workers.py --patients 300 --workers 1 2 4
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from fake_telegram import FakeTelegram  # noqa: E402
+from load_test import SCENARIO_WEIGHTS, SCENARIOS, TOKEN  # noqa: E402
+
+
+def quiet_worker(updates):
+    """medical_bot.run_worker без логів бота"""
+    import medical_bot
+
+    logging.disable(logging.CRITICAL)
+    medical_bot.run_worker(updates)
+
+
+async def roundtrip(fake, pool, user_id, text, timeout):
+    """Надсилає оновлення процесу користувача і чекає на відповідь бота"""
+    reply = fake.expect_reply(user_id)
+    pool.dispatch(user_id, fake.make_update(user_id, text))
+    await asyncio.wait_for(reply, timeout)
+
+
+async def patient(fake, pool, number, scenario, timeout):
+    user_id = 100000 + number
+    for state, text in SCENARIOS[scenario]:
+        await roundtrip(fake, pool, user_id, text.format(n=number), timeout)
+
+
+async def run(count, scenarios, timeout):
+    from workers import WorkerPool
+
+    fake = FakeTelegram()
+    await fake.start()
+    workdir = tempfile.mkdtemp(prefix='bench_workers_')
+    # Процеси-обробники читають налаштування зі змінних оточення при запуску
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': TOKEN,
+        'TELEGRAM_API_URL': fake.url,
+        'ADMIN_IDS': '',
+        'SURVEYS_DIR': workdir,
+        'SURVEY_DB': os.path.join(workdir, 'surveys.db'),
+        'STATE_DB': os.path.join(workdir, 'bot_state.db'),
+        'METRICS_PORT': '',
+        'OUTBOUND_RATE': '1e6',
+        'OUTBOUND_CHAT_RATE': '1e6',
+    })
+    pool = WorkerPool(count, quiet_worker)
+    pool.start()
+    try:
+        # Прогрів: кожен процес імпортував бота і відповідає
+        await asyncio.gather(*(roundtrip(fake, pool, index, '/start', 60) for index in range(count)))
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            patient(fake, pool, number, scenario, timeout) for number, scenario in enumerate(scenarios)
+        ))
+        duration = time.perf_counter() - started
+    finally:
+        await pool.close()
+        await fake.close()
+    with sqlite3.connect(os.path.join(workdir, 'surveys.db')) as conn:
+        saved = conn.execute('SELECT COUNT(*) FROM surveys').fetchone()[0]
+    updates = sum(len(SCENARIOS[scenario]) for scenario in scenarios)
+    return duration, updates, saved
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patients', type=int, default=300)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--timeout', type=float, default=60.0, help='скільки пацієнт чекає на відповідь бота (с)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    names, weights = zip(*SCENARIO_WEIGHTS.items())
+    scenarios = random.Random(args.seed).choices(names, weights, k=args.patients)
+    expected = sum(1 for scenario in scenarios if scenario != 'cancel')
+
+    print(f"Пацієнтів: {args.patients}, ядер CPU: {os.cpu_count()}")
+    baseline = None
+    failed = False
+    for count in args.workers:
+        duration, updates, saved = asyncio.run(run(count, scenarios, args.timeout))
+        throughput = updates / duration
+        baseline = baseline or throughput
+        print(f"процесів {count:2}: {duration:6.2f} с, {throughput:7.0f} оновлень/с "
+              f"(x{throughput / baseline:.2f}), збережено анкет {saved} з {expected}")
+        failed = failed or saved != expected
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Локальний фейковий Telegram Bot API для тестування без мережі.
+
+Запуск бота проти фейкового сервера:
+    python benchmarks/fake_telegram.py --port 8081
+    TELEGRAM_BOT_TOKEN=123:TEST TELEGRAM_API_URL=http://127.0.0.1:8081 \\
+        WEBHOOK_URL=http://127.0.0.1:8080 WEBHOOK_SECRET=secret python medical_bot.py
+
+Сервер відповідає на getMe/setWebhook/deleteWebhook/getUpdates/sendMessage,
+записує всі виклики і може штучно затримувати відповіді (--latency) і перший запит
+кожного нового з'єднання (--connect-latency: TCP і TLS рукостискання з api.telegram.org).
+Оновлення від пацієнтів доставляються методом FakeTelegram.deliver(); для кількох
+ботів (TENANTS) кожен токен має власну чергу getUpdates (updates_for).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from urllib.parse import parse_qsl
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from http_server import HttpServer  # noqa: E402
+
+BOT_USER = {'id': 123, 'is_bot': True, 'first_name': 'MedicalBot', 'username': 'medical_test_bot'}
+
+
+class FakeTelegram:
+    """Фейковий Bot API: записує виклики методів і відповідає як Telegram"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, connect_latency=0.0):
+        self.latency = latency
+        self.connect_latency = connect_latency
+        # Кількість прийнятих з'єднань (перевикористання з'єднань клієнтом)
+        self.connections = 0
+        self.calls = []
+        self.webhook = None
+        self.pending_updates = asyncio.Queue()
+        # Токен бота -> власна черга оновлень (решта ботів читає pending_updates)
+        self.bot_updates = {}
+        # chat_id або (токен, chat_id) -> майбутнє наступної відповіді бота в цей чат
+        self.waiters = {}
+        # Черга оновлень -> кількість getUpdates, що на неї чекають (long polling)
+        self._polling = {}
+        self._message_id = 0
+        self._update_id = 0
+        self.server = HttpServer(host, port)
+        self.server.fallback = self._handle
+        handle_connection = self.server._handle_connection
+
+        async def accept(reader, writer):
+            self.connections += 1
+            if self.connect_latency:
+                await asyncio.sleep(self.connect_latency)
+            await handle_connection(reader, writer)
+
+        self.server._handle_connection = accept
+
+    @property
+    def url(self):
+        return f"http://{self.server.host}:{self.server.port}"
+
+    async def start(self):
+        await self.server.start()
+
+    async def close(self):
+        # Відповідаємо на незавершені long polling запити, щоб їх обробники не скасовувались
+        for queue, count in self._polling.items():
+            for _ in range(count):
+                queue.put_nowait(None)
+        await asyncio.sleep(0.01)
+        await self.server.close()
+
+    def make_update(self, user_id, text, first_name='Пацієнт'):
+        """Формує оновлення з текстовим повідомленням від користувача"""
+        self._update_id += 1
+        self._message_id += 1
+        user = {'id': user_id, 'is_bot': False, 'first_name': first_name, 'username': f'user{user_id}'}
+        message = {
+            'message_id': self._message_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private', 'first_name': first_name},
+            'from': user,
+            'text': text,
+        }
+        if text.startswith('/'):
+            command = text.split()[0]
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+        return {'update_id': self._update_id, 'message': message}
+
+    def updates_for(self, token):
+        """Окрема черга getUpdates бота token"""
+        return self.bot_updates.setdefault(token, asyncio.Queue())
+
+    def expect_reply(self, chat_id, token=None):
+        """Майбутнє з текстом наступного повідомлення бота (будь-якого або token) в чат chat_id"""
+        key = chat_id if token is None else (token, chat_id)
+        waiter = self.waiters[key] = asyncio.get_running_loop().create_future()
+        return waiter
+
+    async def deliver(self, client, user_id, text):
+        """Доставляє оновлення так, як це робить Telegram: на webhook або в getUpdates"""
+        update = self.make_update(user_id, text)
+        if self.webhook is None:
+            await self.pending_updates.put(update)
+            return 200
+        url, secret_token = self.webhook
+        headers = {'X-Telegram-Bot-Api-Secret-Token': secret_token} if secret_token else {}
+        response = await client.post(url, json=update, headers=headers)
+        return response.status_code
+
+    async def _handle(self, request):
+        # /bot<токен>/<метод>
+        token, method = request.path.rsplit('/', 2)[-2:]
+        token = token[3:]
+        if request.headers.get('content-type', '').startswith('application/json'):
+            params = json.loads(request.body or b'{}')
+        else:
+            params = dict(parse_qsl(request.body.decode('utf-8')))
+        self.calls.append((time.monotonic(), method, params))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        handler = getattr(self, f'_api_{method}', None)
+        if handler is None:
+            result = True
+        else:
+            result = await handler(params, token)
+        return 200, 'application/json', json.dumps({'ok': True, 'result': result})
+
+    async def _api_getMe(self, params, token):
+        return BOT_USER
+
+    async def _api_setWebhook(self, params, token):
+        self.webhook = (params.get('url'), params.get('secret_token'))
+        return True
+
+    async def _api_deleteWebhook(self, params, token):
+        self.webhook = None
+        return True
+
+    async def _api_getUpdates(self, params, token):
+        timeout = float(params.get('timeout', 0))
+        queue = self.bot_updates.get(token, self.pending_updates)
+        self._polling[queue] = self._polling.get(queue, 0) + 1
+        try:
+            first = await asyncio.wait_for(queue.get(), timeout=timeout or 0.01)
+        except asyncio.TimeoutError:
+            return []
+        finally:
+            self._polling[queue] -= 1
+        updates = [first]
+        while not queue.empty():
+            updates.append(queue.get_nowait())
+        # None - сервер зупиняється
+        return [update for update in updates if update is not None]
+
+    async def _api_sendMessage(self, params, token):
+        self._message_id += 1
+        chat_id = int(params['chat_id'])
+        waiter = self.waiters.pop((token, chat_id), None) or self.waiters.pop(chat_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(params.get('text', ''))
+        return {
+            'message_id': self._message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': params.get('text', ''),
+        }
+
+    async def _api_editMessageText(self, params, token):
+        return await self._api_sendMessage(params, token)
+
+
+async def _main(args):
+    fake = FakeTelegram(args.host, args.port, args.latency, args.connect_latency)
+    await fake.start()
+    print(f"Фейковий Telegram API: {fake.url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await fake.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help='затримка відповіді, с')
+    parser.add_argument('--connect-latency', type=float, default=0.0, help='затримка нового з\'єднання, с')
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""
+Навантажувальний тест: N одночасних пацієнтів проходять анкету через справжній
+Application з medical_bot.build_application (ConversationHandler, черга оновлень,
+PerUserUpdateProcessor, збереження анкет), а Bot API замінено фейком у тому ж процесі.
+
+Фейковий Bot API записує виклики і може додавати затримку та помилки (NetworkError, 429).
+Сценарії: звичайне заповнення, усі уточнюючі питання, редагування перед підтвердженням,
+скасування. Результат детермінований для заданого --seed і не потребує мережі.
+
+    python benchmarks/load_test.py --patients 1000
+    python benchmarks/load_test.py --patients 200 --latency 0.05 --error-rate 0.01 --json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from telegram import Update  # noqa: E402
+from telegram.request import BaseRequest  # noqa: E402
+
+TOKEN = '123456:LOAD-TEST'
+
+# Сценарії: (стан, в якому пацієнт відповідає, текст). {n} - номер пацієнта
+BASE = [
+    ('start', '/start'),
+    ('PIB', 'Пацієнт {n}'),
+    ('VIK', '40'),
+    ('DE_BOLIT', 'Поперек'),
+    ('ONIMINNYA', 'Ні'),
+    ('KOLY_ZYAVYVSYA', 'До 6 тижнів (гострий)'),
+    ('TRAVMA', 'Ні'),
+    ('KHARAKTER_BOLY', 'Ниючий'),
+    ('SHKALA_BOLY', '5'),
+    ('POHIRSHUE', 'Сидіння'),
+    ('POLEHSHUE', 'Лежання'),
+    ('RANISHI_EPIZODY', 'Ні'),
+    ('CHERVONI_PRAPORY', 'Немає таких симптомів'),
+    ('SUPUTNI', 'Немає супутніх захворювань'),
+    ('AKTYVNIST', 'Сидяча робота'),
+    ('LIKUVANNYA', 'Не приймаю ліків'),
+    ('FIZIOTERAPIYA', 'Ні'),
+    ('ZRIST', '180'),
+    ('VAGA', '80'),
+]
+CONFIRM = [('CONFIRM', '✅ Підтвердити')]
+
+SCENARIOS = {
+    'plain': BASE + CONFIRM,
+    'branching': [
+        ('start', '/start'),
+        ('PIB', 'Пацієнт {n}'),
+        ('VIK', '55'),
+        ('DE_BOLIT', 'Біль віддає у ногу'),
+        ('DE_BOLIT_DETALI', 'у ліву ногу до коліна'),
+        ('ONIMINNYA', 'Так'),
+        ('ONIMINNYA_DE', 'стопа'),
+        ('KOLY_ZYAVYVSYA', 'Більше 3 місяців (хронічний)'),
+        ('TRAVMA', 'Так'),
+        ('TRAVMA_DETALI', 'Пропустити'),
+        ('KHARAKTER_BOLY', 'Гострий'),
+        ('SHKALA_BOLY', '8'),
+        ('POHIRSHUE', 'Ходьба'),
+        ('POLEHSHUE', 'Ліки'),
+        ('RANISHI_EPIZODY', 'Так'),
+        ('RANISHI_YAK_LIKUVALY', 'Масаж'),
+        ('CHERVONI_PRAPORY', 'Оніміння в промежині'),
+        ('SUPUTNI', 'Остеопороз'),
+        ('AKTYVNIST', 'Займаюся спортом'),
+        ('SPORT_YAKYI', 'Біг'),
+        ('LIKUVANNYA', 'Ібупрофен'),
+        ('FIZIOTERAPIYA', 'Так'),
+        ('ZRIST', '170'),
+        ('VAGA', '70'),
+    ] + CONFIRM,
+    'edit': BASE + [
+        ('CONFIRM', '✏️ Змінити дані'),
+        ('EDIT_CHOICE', '👤 ПІБ'),
+        ('PIB', 'Пацієнт {n} (виправлено)'),
+        ('CONFIRM', '✏️ Змінити дані'),
+        ('EDIT_CHOICE', '📍 Локалізація болю'),
+        ('DE_BOLIT', 'Біль віддає у руку'),
+        ('DE_BOLIT_DETALI', 'у праву руку до ліктя'),
+        ('CONFIRM', '✏️ Змінити дані'),
+        ('EDIT_CHOICE', '📊 Інтенсивність'),
+        ('SHKALA_BOLY', '3'),
+    ] + CONFIRM,
+    'cancel': BASE[:8] + [('cancel', '/cancel')],
+}
+# Частка пацієнтів за сценаріями
+SCENARIO_WEIGHTS = {'plain': 50, 'branching': 20, 'edit': 20, 'cancel': 10}
+
+MAX_RETRIES = 5
+
+
+class FakeBotRequest(BaseRequest):
+    """Bot API у тому ж процесі: відповідає на getMe/sendMessage, записує виклики,
+    додає затримку і випадкові помилки. Пацієнт дізнається про відповідь бота
+    через майбутнє, зареєстроване для його чату; після помилки бот сам повторює
+    відправку, тож пацієнт чекає на успішну.
+
+    Випадковість окрема для кожного чату, тому результат не залежить від того,
+    в якому порядку цикл подій перемежовує пацієнтів."""
+
+    def __init__(self, seed, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.seed = seed
+        self._rngs = {}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = {}
+        self.errors = 0
+        self.waiters = {}
+        self._message_id = itertools.count(1)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _wake(self, chat_id):
+        waiter = self.waiters.pop(chat_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(True)
+
+    def _rng(self, chat_id):
+        rng = self._rngs.get(chat_id)
+        if rng is None:
+            rng = self._rngs[chat_id] = random.Random(f'{self.seed}:{chat_id}')
+        return rng
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        chat_id = params.get('chat_id')
+        rng = self._rng(chat_id)
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + rng.uniform(0, self.jitter))
+
+        if chat_id is not None and rng.random() < self.error_rate:
+            self.errors += 1
+            if rng.random() < 0.5:
+                return 429, json.dumps({
+                    'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                    'parameters': {'retry_after': 1},
+                }).encode()
+            return 502, json.dumps({'ok': False, 'error_code': 502, 'description': 'Bad Gateway'}).encode()
+
+        if api_method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Load', 'username': 'load_test_bot'}
+        elif api_method in ('sendMessage', 'editMessageText'):
+            result = {
+                'message_id': next(self._message_id), 'date': int(time.time()),
+                'chat': {'id': int(chat_id), 'type': 'private'}, 'text': params.get('text', ''),
+            }
+            self._wake(int(chat_id))
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class LoadTest:
+    def __init__(self, application, request, seed, think_time, timeout):
+        self.application = application
+        self.request = request
+        self.seed = seed
+        self.think_time = think_time
+        self.timeout = timeout
+        self.latencies = {}
+        self.outcomes = {'completed': 0, 'cancelled': 0, 'failed': 0}
+        self.updates = 0
+        self.retries = 0
+        self._update_id = itertools.count(1)
+
+    def make_update(self, user_id, text):
+        message = {
+            'message_id': next(self._update_id), 'date': int(time.time()), 'text': text,
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Пацієнт', 'username': f'patient{user_id}'},
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+        return Update.de_json({'update_id': message['message_id'], 'message': message}, self.application.bot)
+
+    async def send(self, user_id, text):
+        """Надсилає оновлення і чекає на відповідь бота в чат пацієнта; повертає успіх"""
+        waiter = asyncio.get_running_loop().create_future()
+        self.request.waiters[user_id] = waiter
+        await self.application.update_queue.put(self.make_update(user_id, text))
+        self.updates += 1
+        try:
+            return await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            self.request.waiters.pop(user_id, None)
+            return False
+
+    async def patient(self, number, scenario, start_delay):
+        await asyncio.sleep(start_delay)
+        user_id = 100000 + number
+        rng = random.Random(f'{self.seed}:patient:{number}')
+        for state, text in SCENARIOS[scenario]:
+            text = text.format(n=number)
+            if self.think_time:
+                await asyncio.sleep(rng.uniform(0, self.think_time))
+            for attempt in range(MAX_RETRIES):
+                started = time.perf_counter()
+                ok = await self.send(user_id, text)
+                if ok:
+                    self.latencies.setdefault(state, []).append(time.perf_counter() - started)
+                    break
+                # Як справжній пацієнт: відповіді немає - надсилаємо ще раз
+                self.retries += 1
+                await asyncio.sleep(0.1 * (attempt + 1))
+            else:
+                self.outcomes['failed'] += 1
+                return
+        self.outcomes['cancelled' if scenario == 'cancel' else 'completed'] += 1
+
+    async def run(self, patients, ramp_up):
+        names, weights = zip(*SCENARIO_WEIGHTS.items())
+        scenarios = random.Random(self.seed).choices(names, weights, k=patients)
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            self.patient(number, scenario, ramp_up * number / patients)
+            for number, scenario in enumerate(scenarios)
+        ))
+        return time.perf_counter() - started, scenarios
+
+
+async def run_load_test(args):
+    import medical_bot
+
+    request = FakeBotRequest(args.seed, args.latency, args.jitter, args.error_rate)
+    application = medical_bot.build_application(TOKEN, request=request)
+    test = LoadTest(application, request, args.seed, args.think_time, args.timeout)
+
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    try:
+        duration, scenarios = await test.run(args.patients, args.ramp_up)
+    finally:
+        await application.stop()
+        await application.post_shutdown(application)
+        await application.shutdown()
+
+    expected = sum(1 for scenario in scenarios if scenario != 'cancel') - test.outcomes['failed']
+    states = {}
+    for state, values in sorted(test.latencies.items(), key=lambda item: -len(item[1])):
+        values.sort()
+        states[state] = {
+            'count': len(values),
+            'p50_ms': percentile(values, 0.5) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+            'max_ms': values[-1] * 1000,
+        }
+    return {
+        'patients': args.patients,
+        'seed': args.seed,
+        'outcomes': test.outcomes,
+        'updates': test.updates,
+        'retries': test.retries,
+        'injected_errors': request.errors,
+        'api_calls': request.calls,
+        'duration_s': duration,
+        'throughput_updates_per_s': test.updates / duration,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'surveys_saved': application.bot_data['clinic'].survey_writer.stats['written'],
+        'surveys_expected': expected,
+        'states': states,
+    }
+
+
+def print_report(report):
+    outcomes = report['outcomes']
+    print(f"Пацієнтів: {report['patients']} (підтвердили: {outcomes['completed']}, "
+          f"скасували: {outcomes['cancelled']}, не змогли завершити: {outcomes['failed']})")
+    print(f"Оновлень: {report['updates']}, повторних надсилань: {report['retries']}, "
+          f"штучних помилок Bot API: {report['injected_errors']}")
+    print(f"Тривалість: {report['duration_s']:.2f} с, "
+          f"пропускна здатність: {report['throughput_updates_per_s']:.0f} оновлень/с")
+    print(f"Пікова пам'ять (RSS): {report['peak_rss_mb']:.1f} МБ")
+    print(f"Збережено анкет: {report['surveys_saved']} з {report['surveys_expected']}")
+    print()
+    print(f"{'стан':22} {'к-сть':>7} {'p50, мс':>9} {'p99, мс':>9} {'max, мс':>9}")
+    for state, row in report['states'].items():
+        print(f"{state:22} {row['count']:7} {row['p50_ms']:9.2f} {row['p99_ms']:9.2f} {row['max_ms']:9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patients', type=int, default=1000, help='кількість одночасних пацієнтів')
+    parser.add_argument('--ramp-up', type=float, default=0.0, help='за скільки секунд підключаються всі пацієнти')
+    parser.add_argument('--think-time', type=float, default=0.0, help='максимальна пауза пацієнта між відповідями (с)')
+    parser.add_argument('--latency', type=float, default=0.0, help='затримка кожного виклику Bot API (с)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='додаткова випадкова затримка Bot API (с)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='частка викликів Bot API, що завершуються помилкою')
+    parser.add_argument('--timeout', type=float, default=30.0, help='скільки пацієнт чекає на відповідь бота (с)')
+    parser.add_argument('--outbound-rate', type=float, default=1e6,
+                        help='загальний ліміт відправки, повідомлень/с (за замовчуванням фактично вимкнено)')
+    parser.add_argument('--chat-rate', type=float, default=1e6,
+                        help='ліміт відправки в один чат, повідомлень/с (реальний Telegram: 1)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='вивести звіт у JSON (для CI)')
+    parser.add_argument('--verbose', action='store_true', help='не вимикати логи бота')
+    args = parser.parse_args()
+
+    # Усе зберігається в тимчасовому каталозі; лікарів немає, щоб розсилка
+    # з лімітом 1 повідомлення/с на чат не затягувала завершення тесту
+    workdir = tempfile.mkdtemp(prefix='load_test_')
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': TOKEN,
+        'ADMIN_IDS': '',
+        'SURVEYS_DIR': workdir,
+        'STATE_DB': os.path.join(workdir, 'bot_state.db'),
+        'METRICS_PORT': '',
+        # Ліміти Telegram фейковий сервер не застосовує: за замовчуванням вимірюємо сам бот
+        'OUTBOUND_RATE': str(args.outbound_rate),
+        'OUTBOUND_CHAT_RATE': str(args.chat_rate),
+    })
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+
+    report = asyncio.run(run_load_test(args))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+    # Для CI: кожен пацієнт має завершити сценарій, а кожна підтверджена анкета - зберегтися
+    if report['outcomes']['failed'] or report['surveys_saved'] != report['surveys_expected']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Мінімальний асинхронний HTTP/1.1 сервер на asyncio (без сторонніх залежностей)
+"""
+
+import asyncio
+import logging
+from collections import namedtuple
+from http import HTTPStatus
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_SIZE = 1024 * 1024
+
+Request = namedtuple('Request', ['method', 'path', 'query', 'headers', 'body'])
+
+
+class HttpServer:
+    """HTTP сервер з keep-alive. Обробник маршруту отримує Request
+    і повертає кортеж (статус, content-type, тіло)."""
+
+    def __init__(self, host='0.0.0.0', port=8080):
+        self.host = host
+        self.port = port
+        self.routes = {}
+        self.fallback = None
+        self._server = None
+
+    def route(self, method, path, handler):
+        """Реєструє обробник для методу і шляху"""
+        self.routes[(method, path)] = handler
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        # Порт 0 означає вільний порт, обраний системою
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"HTTP сервер слухає {self.host}:{self.port}")
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                if isinstance(request, int):
+                    await self._write_response(writer, request, 'text/plain', b'', keep_alive=False)
+                    break
+                handler = self.routes.get((request.method, request.path), self.fallback)
+                if handler is None:
+                    status, content_type, body = 404, 'text/plain', b'not found'
+                else:
+                    try:
+                        status, content_type, body = await handler(request)
+                    except Exception as e:
+                        logger.error(f"Помилка обробки HTTP запиту {request.method} {request.path}: {e}")
+                        status, content_type, body = 500, 'text/plain', b'internal error'
+                keep_alive = request.headers.get('connection', '').lower() != 'close'
+                await self._write_response(writer, status, content_type, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        """Читає один запит; повертає None при закритті з'єднання або код помилки"""
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode('latin-1').split()
+        except ValueError:
+            return 400
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            return 400
+        if length > MAX_BODY_SIZE:
+            return 413
+        body = await reader.readexactly(length) if length else b''
+        path, _, query = target.partition('?')
+        return Request(method, path, query, headers, body)
+
+    async def _write_response(self, writer, status, content_type, body, keep_alive):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        head = (
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
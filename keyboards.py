@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Реєстр клавіатур: кожна клавіатура створюється один раз при імпорті
+разом із готовим JSON для параметра reply_markup
+"""
+
+import json
+from typing import NamedTuple
+
+from telegram import (
+    InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove, TelegramObject,
+)
+
+
+class Keyboard(NamedTuple):
+    """Незмінна клавіатура та її серіалізоване представлення"""
+    markup: TelegramObject
+    json: str
+
+
+# rows (кортеж кортежів) -> Keyboard; однакові клавіатури спільні для всіх питань
+_registry = {}
+
+
+def _serialize(markup):
+    return json.dumps(markup.to_dict(), ensure_ascii=False, separators=(',', ':'))
+
+
+def reply_keyboard(rows):
+    """Повертає (і за потреби реєструє) клавіатуру з вказаними рядками кнопок"""
+    key = tuple(tuple(row) for row in rows)
+    keyboard = _registry.get(key)
+    if keyboard is None:
+        markup = ReplyKeyboardMarkup(key, one_time_keyboard=True, resize_keyboard=True)
+        keyboard = _registry[key] = Keyboard(markup, _serialize(markup))
+    return keyboard
+
+
+def inline_keyboard(rows, prefix, selected=(), done=None):
+    """Inline-клавіатура з тими ж кнопками: callback_data '<prefix>:<номер варіанта>'
+    (варіанти нумеруються по рядках). Для вибору кількох варіантів номери selected
+    позначаються ✅, а окремий рядок з кнопкою done завершує вибір ('<prefix>:done')"""
+    key = ('inline', prefix, tuple(tuple(row) for row in rows), tuple(sorted(selected)), done)
+    keyboard = _registry.get(key)
+    if keyboard is None:
+        numbers = iter(range(sum(len(row) for row in rows)))
+        buttons = [
+            [
+                InlineKeyboardButton(f"✅ {option}" if number in selected else option,
+                                     callback_data=f"{prefix}:{number}")
+                for option, number in zip(row, numbers)
+            ]
+            for row in rows
+        ]
+        if done:
+            buttons.append([InlineKeyboardButton(done, callback_data=f"{prefix}:done")])
+        markup = InlineKeyboardMarkup(buttons)
+        keyboard = _registry[key] = Keyboard(markup, _serialize(markup))
+    return keyboard
+
+
+def pressed(update, options):
+    """Відповідь пацієнта: текст повідомлення або варіант натиснутої inline-кнопки
+    з options (None - кнопка не з цього списку, наприклад 'done')"""
+    query = update.callback_query
+    if query is None:
+        return update.message.text
+    number = query.data.rpartition(':')[2]
+    if number.isdigit() and int(number) < len(options):
+        return options[int(number)]
+    return None
+
+
+def registered_keyboards():
+    """Кількість зареєстрованих клавіатур (для діагностики)"""
+    return len(_registry)
+
+
+_remove_markup = ReplyKeyboardRemove()
+REMOVE_KEYBOARD = Keyboard(_remove_markup, _serialize(_remove_markup))
+
+
+async def reply(message, text, keyboard=None):
+    """Відповідає на повідомлення, передаючи готовий JSON клавіатури без повторної серіалізації"""
+    if keyboard is None:
+        return await message.reply_text(text)
+    return await message.reply_text(text, api_kwargs={'reply_markup': keyboard.json})
@@ -4,18 +4,37 @@
 Telegram бот для опитування пацієнтів мануального терапевта
 """
 
+import asyncio
+import importlib.util
 import logging
 import os
+import secrets
+import warnings
+from dataclasses import replace
 from datetime import datetime
-from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from telegram import Update
+from telegram.warnings import PTBUserWarning
 from telegram.ext import (
     Application,
+    TypeHandler,
+    CallbackQueryHandler,
     CommandHandler,
-    MessageHandler,
     ConversationHandler,
-    filters,
     ContextTypes,
 )
+import admin_commands
+from metrics import ConversationMetrics, InstrumentedRequest, MetricsServer, export_stats
+from keyboards import REMOVE_KEYBOARD, inline_keyboard, pressed, reply_keyboard
+from outbound import ROUTINE, URGENT, AdminFanout, OutboundScheduler
+from questionnaire import CALLBACK_PREFIX, EDIT_PREFIX, Branch, Question, Questionnaire
+from session import Session, register_choices
+from session_cache import SessionCache
+from survey_render import format_survey_result
+from survey_store import SurveyStore, survey_record
+from survey_writer import SurveyWriter, TextFileSink
+from triage import Triage
+from validation import AGE, HEIGHT, PAIN, WEIGHT
+from webhook import PerUserUpdateProcessor, serve_webhook
 
 # Налаштування логування
 logging.basicConfig(
@@ -29,101 +48,138 @@ logger = logging.getLogger(__name__)
  KOLY_ZYAVYVSYA, TRAVMA, TRAVMA_DETALІ, KHARAKTER_BOLY,
  SHKALA_BOLY, POHIRSHUE, POLEHSHUE, RANISHI_EPIZODY, RANISHI_YAK_LIKUVALY,
  CHERVONI_PRAPORY, SUPUTNI, AKTYVNIST, SPORT_YAKYI, LIKUVANNYA,
- FIZIOTERAPIYA, ZRIST, VAGA, CONFIRM, EDIT_CHOICE) = range(25)
+ FIZIOTERAPIYA, ZRIST, VAGA, CONFIRM, EDIT_CHOICE, RETURNING) = range(26)
+
+# Назви станів для метрик (в тому ж порядку)
+STATE_NAMES = (
+    'PIB', 'VIK', 'DE_BOLIT', 'DE_BOLIT_DETALI', 'ONIMINNYA', 'ONIMINNYA_DE',
+    'KOLY_ZYAVYVSYA', 'TRAVMA', 'TRAVMA_DETALI', 'KHARAKTER_BOLY',
+    'SHKALA_BOLY', 'POHIRSHUE', 'POLEHSHUE', 'RANISHI_EPIZODY', 'RANISHI_YAK_LIKUVALY',
+    'CHERVONI_PRAPORY', 'SUPUTNI', 'AKTYVNIST', 'SPORT_YAKYI', 'LIKUVANNYA',
+    'FIZIOTERAPIYA', 'ZRIST', 'VAGA', 'CONFIRM', 'EDIT_CHOICE', 'RETURNING',
+)
 
 # Отримання змінних оточення
 TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
 ADMIN_IDS = [int(id) for id in os.environ.get('ADMIN_IDS', '').split(',') if id.strip()]
+SURVEYS_DIR = os.environ.get('SURVEYS_DIR', 'surveys')
+# Формат збереження анкет: sqlite (структуроване сховище), txt (файл на анкету)
+# або archive (зашифрований архів у SURVEYS_DIR/archive з ключами у SURVEY_ARCHIVE_KEY)
+SURVEY_STORAGE = os.environ.get('SURVEY_STORAGE', 'sqlite')
+SURVEY_ARCHIVE_KEY = os.environ.get('SURVEY_ARCHIVE_KEY', 'survey_archive.key')
+SURVEY_DB = os.environ.get('SURVEY_DB', os.path.join(SURVEYS_DIR, 'surveys.db'))
+SURVEY_QUEUE_SIZE = int(os.environ.get('SURVEY_QUEUE_SIZE', '1000'))
+# Невдалий пакет анкет повторюється стільки разів, потім незбережені анкети - у
+# SURVEYS_DIR/failed_surveys.jsonl; при зупинці бот чекає на чергу не довше SURVEY_CLOSE_TIMEOUT с
+SURVEY_WRITE_RETRIES = int(os.environ.get('SURVEY_WRITE_RETRIES', '5'))
+SURVEY_CLOSE_TIMEOUT = float(os.environ.get('SURVEY_CLOSE_TIMEOUT', '30'))
+# Черга вихідних повідомлень: одночасні запити до Bot API і ліміти Telegram (повідомлень/с)
+# Зведення для лікарів: раз на DIGEST_INTERVAL секунд один CSV замість повідомлення на кожну анкету
+DIGEST_INTERVAL = float(os.environ.get('DIGEST_INTERVAL', '0'))
+# Повторному пацієнту пропонується взяти ПІБ, вік, зріст, вагу, супутні захворювання
+# і активність з попередньої анкети (потребує SURVEY_STORAGE=sqlite)
+RETURNING_PREFILL = os.environ.get('RETURNING_PREFILL', '1') == '1'
+# Інтерфейс анкети: 'reply' - кожне питання окремим повідомленням з клавіатурою відповідей;
+# 'inline' - inline-кнопки, натискання редагує те саме повідомлення наступним питанням
+SURVEY_UI = os.environ.get('SURVEY_UI', 'reply')
+OUTBOUND_CONCURRENCY = int(os.environ.get('OUTBOUND_CONCURRENCY', '16'))
+OUTBOUND_RATE = float(os.environ.get('OUTBOUND_RATE', '30'))
+OUTBOUND_CHAT_RATE = float(os.environ.get('OUTBOUND_CHAT_RATE', '1'))
+STATE_DB = os.environ.get('STATE_DB', 'bot_state.db')
+PERSISTENCE_INTERVAL = float(os.environ.get('PERSISTENCE_INTERVAL', '5'))
+CONCURRENT_UPDATES = int(os.environ.get('CONCURRENT_UPDATES', '64'))
+# Сесії в пам'яті: TTL неактивності (с), окремі TTL станів (CONFIRM=172800,PIB=3600),
+# ліміт кількості і вивантаження незавершених анкет у STATE_DB замість видалення
+SESSION_TTL = float(os.environ.get('SESSION_TTL', '86400'))
+SESSION_STATE_TTL = os.environ.get('SESSION_STATE_TTL', '')
+SESSION_MAX = int(os.environ.get('SESSION_MAX', '10000'))
+SESSION_SPILL = os.environ.get('SESSION_SPILL', '1') == '1'
+SESSION_SWEEP_INTERVAL = float(os.environ.get('SESSION_SWEEP_INTERVAL', '60'))
+# Кількість процесів-обробників (більше 1 - головний процес лише маршрутизує оновлення).
+# WORKER_INDEX і WORKER_COUNT задає WorkerPool для кожного процесу-обробника
+WORKERS = int(os.environ.get('WORKERS', '1'))
+WORKER_INDEX = int(os.environ.get('WORKER_INDEX', '0'))
+WORKER_COUNT = int(os.environ.get('WORKER_COUNT', '1'))
+# Кілька ботів (клінік) в одному процесі: JSON-файл з описом клінік (див. tenants.py);
+# TELEGRAM_BOT_TOKEN і ADMIN_IDS тоді не використовуються
+TENANTS = os.environ.get('TENANTS')
+
+# Режим webhook вмикається, якщо відома публічна адреса сервісу (на Render — RENDER_EXTERNAL_URL)
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL') or os.environ.get('RENDER_EXTERNAL_URL')
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+WEBHOOK_QUEUE_SIZE = int(os.environ.get('WEBHOOK_QUEUE_SIZE', '1000'))
+PORT = int(os.environ.get('PORT', '8080'))
+# Адреса Bot API (можна вказати локальний фейковий сервер для тестування)
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL')
+# Пул з'єднань для запитів до Bot API (відправка; long polling має окреме з'єднання):
+# розмір, тайм-аути (с), скільки тримати невикористане з'єднання відкритим і HTTP/2
+BOT_API_POOL_SIZE = int(os.environ.get('BOT_API_POOL_SIZE', '64'))
+BOT_API_POOL_TIMEOUT = float(os.environ.get('BOT_API_POOL_TIMEOUT', '1'))
+BOT_API_CONNECT_TIMEOUT = float(os.environ.get('BOT_API_CONNECT_TIMEOUT', '5'))
+BOT_API_READ_TIMEOUT = float(os.environ.get('BOT_API_READ_TIMEOUT', '5'))
+BOT_API_KEEPALIVE = float(os.environ.get('BOT_API_KEEPALIVE', '60'))
+BOT_API_HTTP2 = os.environ.get('BOT_API_HTTP2', '0') == '1'
+# Локальний endpoint метрик Prometheus (порожній METRICS_PORT вимикає)
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = os.environ.get('METRICS_PORT', '9464')
+
+# Варіанти червоних прапорів (відповідь 'Немає таких симптомів' сюди не входить)
+RED_FLAG_OPTIONS = (
+    'Незрозуміла втрата ваги',
+    'Температура',
+    'Онкологія в анамнезі',
+    'Проблеми з сечовипусканням',
+    'Проблеми з дефекацією',
+    'Оніміння в промежині',
+    'Різка слабкість кінцівки',
+)
 
-def format_survey_result(user_data, for_admin=False):
-    """Форматує результати анкети для відправки"""
-    result = "📋 АНКЕТА ПАЦІЄНТА З БОЛЕМ У СПИНІ\n"
-    result += "=" * 40 + "\n\n"
-    
-    result += f"👤 ПІБ: {user_data.get('pib', 'Не вказано')}\n"
-    result += f"📅 Вік: {user_data.get('vik', 'Не вказано')}\n"
-    result += f"🗓 Дата заповнення: {user_data.get('date', 'Не вказано')}\n\n"
-    
-    result += "1️⃣ ДЕ САМЕ БОЛИТЬ?\n"
-    result += f"   {user_data.get('de_bolit', 'Не вказано')}\n"
-    if user_data.get('onіmіnnya') == 'Так':
-        result += f"   Оніміння/поколювання: {user_data.get('onіmіnnya_de', 'Не вказано')}\n"
-    else:
-        result += f"   Оніміння/поколювання: {user_data.get('onіmіnnya', 'Не вказано')}\n"
-    result += "\n"
-    
-    result += "2️⃣ КОЛИ ПОЯВИВСЯ БІЛЬ?\n"
-    result += f"   {user_data.get('koly_zyavyvsya', 'Не вказано')}\n"
-    if user_data.get('travma') == 'Так':
-        result += f"   Після травми: {user_data.get('travma_detalі', 'Не вказано')}\n"
-    else:
-        result += f"   Травма: {user_data.get('travma', 'Не вказано')}\n"
-    result += "\n"
-    
-    result += "3️⃣ ХАРАКТЕР БОЛЮ:\n"
-    result += f"   {user_data.get('kharakter_boly', 'Не вказано')}\n"
-    result += f"   Інтенсивність (0-10): {user_data.get('shkala_boly', 'Не вказано')}\n\n"
-    
-    result += "4️⃣ ЩО ПОГІРШУЄ/ПОЛЕГШУЄ:\n"
-    result += f"   Погіршує: {user_data.get('pohirshue', 'Не вказано')}\n"
-    result += f"   Полегшує: {user_data.get('polehshue', 'Не вказано')}\n\n"
-    
-    result += "5️⃣ РАНІШЕ ПОДІБНІ ЕПІЗОДИ:\n"
-    result += f"   {user_data.get('ranishi_epizody', 'Не вказано')}\n"
-    if user_data.get('ranishi_epizody') == 'Так':
-        result += f"   Як лікували: {user_data.get('ranishi_yak_likuvaly', 'Не вказано')}\n"
-    result += "\n"
-    
-    result += "6️⃣ ЧЕРВОНІ ПРАПОРИ:\n"
-    result += f"   {user_data.get('chervoni_prapory', 'Немає')}\n\n"
-    
-    result += "7️⃣ СУПУТНІ ЗАХВОРЮВАННЯ:\n"
-    result += f"   {user_data.get('suputni', 'Немає')}\n\n"
-    
-    result += "8️⃣ РІВЕНЬ АКТИВНОСТІ:\n"
-    result += f"   {user_data.get('aktyvnist', 'Не вказано')}\n"
-    if user_data.get('sport_yakyi') and user_data.get('sport_yakyi') != 'Не займаюся спортом':
-        result += f"   Спорт: {user_data.get('sport_yakyi')}\n"
-    result += "\n"
-    
-    result += "9️⃣ ПОТОЧНЕ ЛІКУВАННЯ:\n"
-    result += f"   Ліки: {user_data.get('likuvannya', 'Не вказано')}\n"
-    result += f"   Фізіотерапія/масаж: {user_data.get('fizioterapiya', 'Не вказано')}\n"
-    
-    result += "\n"
-    result += "🔟 АНТРОПОМЕТРИЧНІ ДАНІ:\n"
-    result += f"   Зріст: {user_data.get('zrist', 'Не вказано')} см\n"
-    result += f"   Вага: {user_data.get('vaga', 'Не вказано')} кг\n"
-    
-    result += "\n" + "=" * 40
-    
-    # Додаємо контактну інформацію тільки для адміністраторів
-    if for_admin:
-        result += f"\n📱 Telegram: @{user_data.get('username', 'невідомий')}"
-        result += f"\n🆔 User ID: {user_data.get('user_id', 'невідомий')}"
-    
-    return result
+# Варіанти відповіді 'Коли появився біль?' (аналітика групує решту відповідей в 'інше')
+ONSET_OPTIONS = ('До 6 тижнів (гострий)', '6-12 тижнів (підгострий)', 'Більше 3 місяців (хронічний)')
+
+# Усі вихідні повідомлення йдуть через одну чергу з лімітами Telegram:
+# відповіді пацієнтам поперед копій анкет лікарям, термінові сповіщення - першими
+# (загальний ліміт ділиться між процесами-обробниками; з TENANTS - окремий для кожного бота)
+outbound = OutboundScheduler(OUTBOUND_CONCURRENCY, OUTBOUND_RATE / WORKER_COUNT, OUTBOUND_CHAT_RATE)
+export_stats('outbound', outbound.stats)
+
+# Процес-обробник N слухає METRICS_PORT + N + 1 (METRICS_PORT лишається маршрутизатору)
+metrics_server = MetricsServer(
+    METRICS_HOST, int(METRICS_PORT) + (WORKER_INDEX + 1 if WORKER_COUNT > 1 else 0)
+) if METRICS_PORT else None
+
+# Кнопки підтвердження анкети (клавіатура клініки створюється один раз для її режиму)
+CONFIRM_ROWS = [
+    ['✅ Підтвердити'],
+    ['✏️ Змінити дані'],
+    ['❌ Скасувати']
+]
+CONFIRM_OPTIONS = [row[0] for row in CONFIRM_ROWS]
+CONFIRM_PREFIX = 'survey_confirm'
 
 async def show_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показує анкету для підтвердження"""
+    clinic = context.bot_data['clinic']
     result = format_survey_result(context.user_data, for_admin=False)
     
-    keyboard = [
-        ['✅ Підтвердити'],
-        ['✏️ Змінити дані'],
-        ['❌ Скасувати']
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    
-    await update.message.reply_text(
+    await clinic.survey.show(
+        update,
         "📋 ПЕРЕВІРТЕ ВАШІ ДАНІ:\n\n" + result + "\n\nВсе правильно?",
-        reply_markup=reply_markup
+        clinic.confirm_keyboard
     )
     return CONFIRM
 
+REUSE_LABEL = '✅ Так, дані ті самі'
+REFILL_LABEL = '📝 Заповнити заново'
+RETURNING_ROWS = [[REUSE_LABEL], [REFILL_LABEL]]
+RETURNING_OPTIONS = [REUSE_LABEL, REFILL_LABEL]
+RETURNING_PREFIX = 'survey_returning'
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Початок розмови"""
     user = update.effective_user
+    clinic = context.bot_data['clinic']
     context.user_data.clear()  # Очищаємо попередні дані
     context.user_data['username'] = user.username or user.first_name
     context.user_data['user_id'] = user.id
@@ -132,7 +188,27 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     logger.info(f"Користувач {user.first_name} (@{user.username}) розпочав анкетування. User ID: {user.id}")
     
-    await update.message.reply_text(
+    # Повторний пацієнт: стабільні відповіді з останньої анкети (вказівник за user_id)
+    previous = None
+    if clinic.prefill_store:
+        try:
+            previous = await asyncio.to_thread(clinic.prefill_store.latest_for_patient, user.id)
+        except Exception as e:
+            logger.error(f"Не вдалося прочитати попередню анкету користувача {user.id}: {e}")
+    if previous and clinic.survey.prefill(context.user_data, previous):
+        await outbound.reply(
+            update.message,
+            f"Вітаю знову, {user.first_name}! 👋\n\n"
+            f"Минулого разу ({previous.get('date', previous['saved_at'][:10])}) ви вказали:\n\n"
+            + clinic.survey.prefill_summary(context.user_data) +
+            "\n\nЯкщо ці дані не змінились, одразу перейдемо до питань про біль.\n"
+            "Натисніть /cancel щоб скасувати в будь-який момент.",
+            clinic.returning_keyboard
+        )
+        return RETURNING
+    
+    await outbound.reply(
+        update.message,
         f"Вітаю, {user.first_name}! 👋\n\n"
         "Я допоможу вам заповнити анкету перед прийомом до мануального терапевта.\n\n"
         "Це займе приблизно 5 хвилин. Ваші відповіді допоможуть лікарю краще підготуватися до прийому.\n\n"
@@ -142,698 +218,185 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return PIB
 
-async def pib(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Отримання ПІБ"""
-    context.user_data['pib'] = update.message.text
-    
-    # Якщо в режимі редагування, повертаємося до підтвердження
-    if context.user_data.get('editing'):
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    await update.message.reply_text("Скільки вам років? (введіть число)")
-    return VIK
-
-async def vik(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Отримання віку"""
-    context.user_data['vik'] = update.message.text
-    
-    # Якщо в режимі редагування, повертаємося до підтвердження
-    if context.user_data.get('editing'):
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    keyboard = [
-        ['Шия', 'Грудний відділ'],
-        ['Поперек', 'Крижі'],
-        ['Біль віддає у руку', 'Біль віддає у ногу']
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    
-    await update.message.reply_text(
-        "1️⃣ ДЕ САМЕ БОЛИТЬ?\n\n"
-        "Оберіть одну або декілька зон (можете написати кілька через кому):",
-        reply_markup=reply_markup
-    )
-    return DE_BOLIT
-
-async def de_bolit(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Отримання локалізації болю"""
-    context.user_data['de_bolit'] = update.message.text
-    
-    # Якщо в режимі редагування і немає віддачі, повертаємося до підтвердження
-    if context.user_data.get('editing') and 'віддає' not in update.message.text.lower():
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    if 'віддає' in update.message.text.lower():
-        await update.message.reply_text(
-            "Опишіть детальніше, куди саме віддає біль:\n"
-            "(наприклад: у праву руку до ліктя, у ліву ногу до коліна)"
-        )
-        return DE_BOLIT_DETALІ
-    else:
-        keyboard = [['Так', 'Ні']]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        await update.message.reply_text(
-            "Чи є оніміння, поколювання або слабкість?",
-            reply_markup=reply_markup
-        )
-        return ОНІМІННЯ
-
-async def de_bolit_detalі(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Деталі про віддачу болю"""
-    context.user_data['de_bolit'] += f"\nДеталі: {update.message.text}"
-    
-    # Якщо в режимі редагування, повертаємося до підтвердження
-    if context.user_data.get('editing'):
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    keyboard = [['Так', 'Ні']]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    await update.message.reply_text(
-        "Чи є оніміння, поколювання або слабкість?",
-        reply_markup=reply_markup
-    )
-    return ОНІМІННЯ
-
-async def onіmіnnya(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Оніміння"""
-    context.user_data['onіmіnnya'] = update.message.text
-    
-    # Якщо в режимі редагування і відповідь "Ні", повертаємося до підтвердження
-    if context.user_data.get('editing') and update.message.text != 'Так':
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    if update.message.text == 'Так':
-        await update.message.reply_text("Де саме? (опишіть локалізацію)")
-        return ОНІМІННЯ_DE
-    else:
-        keyboard = [
-            ['До 6 тижнів (гострий)'],
-            ['6-12 тижнів (підгострий)'],
-            ['Більше 3 місяців (хронічний)']
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        await update.message.reply_text(
-            "2️⃣ КОЛИ ПОЯВИВСЯ БІЛЬ?",
-            reply_markup=reply_markup
-        )
-        return KOLY_ZYAVYVSYA
-
-async def onіmіnnya_de(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Локалізація оніміння"""
-    context.user_data['onіmіnnya_de'] = update.message.text
-    
-    # Якщо в режимі редагування, повертаємося до підтвердження
-    if context.user_data.get('editing'):
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    keyboard = [
-        ['До 6 тижнів (гострий)'],
-        ['6-12 тижнів (підгострий)'],
-        ['Більше 3 місяців (хронічний)']
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    await update.message.reply_text(
-        "2️⃣ КОЛИ ПОЯВИВСЯ БІЛЬ?",
-        reply_markup=reply_markup
-    )
-    return KOLY_ZYAVYVSYA
-
-async def koly_zyavyvsya(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Тривалість болю"""
-    context.user_data['koly_zyavyvsya'] = update.message.text
-    
-    # Якщо в режимі редагування, повертаємося до підтвердження
-    if context.user_data.get('editing'):
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    keyboard = [['Так', 'Ні']]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    await update.message.reply_text(
-        "Біль з'явився після травми, падіння або підйому ваги?",
-        reply_markup=reply_markup
-    )
-    return TRAVMA
-
-async def travma(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Травма"""
-    context.user_data['travma'] = update.message.text
-    
-    # Якщо в режимі редагування і відповідь "Ні", повертаємося до підтвердження
-    if context.user_data.get('editing') and update.message.text != 'Так':
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    if update.message.text == 'Так':
-        keyboard = [['Пропустити']]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        await update.message.reply_text(
-            "Що саме сталося? (опишіть ситуацію або натисніть 'Пропустити')",
-            reply_markup=reply_markup
-        )
-        return TRAVMA_DETALІ
-    else:
-        keyboard = [
-            ['Гострий', 'Ниючий', 'Прострілюючий'],
-            ['Пекучий', 'Тиснучий'],
-            ['Постійний', 'Періодичний']
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        await update.message.reply_text(
-            "3️⃣ ОХАРАКТЕРИЗУЙТЕ БІЛЬ\n\n"
-            "Оберіть один або декілька варіантів (можете написати через кому):",
-            reply_markup=reply_markup
-        )
-        return KHARAKTER_BOLY
-
-async def travma_detalі(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Деталі травми"""
-    if update.message.text != 'Пропустити':
-        context.user_data['travma_detalі'] = update.message.text
-    else:
-        context.user_data['travma_detalі'] = 'Не вказано'
-    
-    # Якщо в режимі редагування, повертаємося до підтвердження
-    if context.user_data.get('editing'):
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    keyboard = [
-        ['Гострий', 'Ниючий', 'Прострілюючий'],
-        ['Пекучий', 'Тиснучий'],
-        ['Постійний', 'Періодичний']
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    await update.message.reply_text(
-        "3️⃣ ОХАРАКТЕРИЗУЙТЕ БІЛЬ\n\n"
-        "Оберіть один або декілька варіантів (можете написати через кому):",
-        reply_markup=reply_markup
-    )
-    return KHARAKTER_BOLY
-
-async def kharakter_boly(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Характер болю"""
-    context.user_data['kharakter_boly'] = update.message.text
-    
-    # Якщо в режимі редагування, повертаємося до підтвердження
-    if context.user_data.get('editing'):
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    keyboard = [
-        ['1', '2', '3'],
-        ['4', '5', '6'],
-        ['7', '8', '9', '10']
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    await update.message.reply_text(
-        "Оцініть інтенсивність болю за шкалою від 0 до 10\n"
-        "(0 - немає болю, 10 - максимальний біль):",
-        reply_markup=reply_markup
-    )
-    return SHKALA_BOLY
-
-async def shkala_boly(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Шкала болю"""
-    context.user_data['shkala_boly'] = update.message.text
-    
-    # Якщо в режимі редагування, повертаємося до підтвердження
-    if context.user_data.get('editing'):
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    keyboard = [
-        ['Сидіння', 'Стояння', 'Ходьба'],
-        ['Нахили', 'Повороти'],
-        ['Кашель/чхання', 'Нічний час'],
-        ['Немає особливих факторів']
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    await update.message.reply_text(
-        "4️⃣ ЩО ПОГІРШУЄ БІЛЬ?\n\n"
-        "Оберіть один або декілька варіантів:",
-        reply_markup=reply_markup
-    )
-    return POHIRSHUE
-
-async def pohirshue(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Що погіршує"""
-    context.user_data['pohirshue'] = update.message.text
-    
-    # Якщо в режимі редагування, повертаємося до підтвердження
-    if context.user_data.get('editing'):
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    keyboard = [
-        ['Лежання', 'Рух'],
-        ['Тепло', 'Холод', 'Ліки'],
-        ['Немає полегшення']
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    await update.message.reply_text(
-        "ЩО ПОЛЕГШУЄ БІЛЬ?\n\n"
-        "Оберіть один або декілька варіантів:",
-        reply_markup=reply_markup
-    )
-    return POLEHSHUE
-
-async def polehshue(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Що полегшує"""
-    context.user_data['polehshue'] = update.message.text
-    
-    # Якщо в режимі редагування, повертаємося до підтвердження
-    if context.user_data.get('editing'):
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    keyboard = [['Так', 'Ні']]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    await update.message.reply_text(
-        "5️⃣ ЧИ БУЛИ РАНІШЕ ПОДІБНІ ЕПІЗОДИ БОЛЮ В СПИНІ?",
-        reply_markup=reply_markup
-    )
-    return RANISHI_EPIZODY
-
-async def ranishi_epizody(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Попередні епізоди"""
-    context.user_data['ranishi_epizody'] = update.message.text
-    
-    # Якщо в режимі редагування і відповідь "Ні", повертаємося до підтвердження
-    if context.user_data.get('editing') and update.message.text != 'Так':
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    if update.message.text == 'Так':
-        keyboard = [['Не лікував(ла)']]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        await update.message.reply_text(
-            "Як тоді лікували? (опишіть методи лікування або оберіть 'Не лікував(ла)')",
-            reply_markup=reply_markup
-        )
-        return RANISHI_YAK_LIKUVALY
-    else:
-        keyboard = [
-            ['Незрозуміла втрата ваги', 'Температура'],
-            ['Онкологія в анамнезі'],
-            ['Проблеми з сечовипусканням'],
-            ['Проблеми з дефекацією'],
-            ['Оніміння в промежині'],
-            ['Різка слабкість кінцівки'],
-            ['Немає таких симптомів']
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        await update.message.reply_text(
-            "6️⃣ ЧЕРВОНІ ПРАПОРИ ⚠️\n\n"
-            "Чи є у вас наступні симптоми?\n"
-            "(оберіть всі, що є, або 'Немає таких симптомів'):",
-            reply_markup=reply_markup
-        )
-        return CHERVONI_PRAPORY
-
-async def ranishi_yak_likuvaly(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Попереднє лікування"""
-    context.user_data['ranishi_yak_likuvaly'] = update.message.text
-    
-    # Якщо в режимі редагування, повертаємося до підтвердження
-    if context.user_data.get('editing'):
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    keyboard = [
-        ['Незрозуміла втрата ваги', 'Температура'],
-        ['Онкологія в анамнезі'],
-        ['Проблеми з сечовипусканням'],
-        ['Проблеми з дефекацією'],
-        ['Оніміння в промежині'],
-        ['Різка слабкість кінцівки'],
-        ['Немає таких симптомів']
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    await update.message.reply_text(
-        "6️⃣ ЧЕРВОНІ ПРАПОРИ ⚠️\n\n"
-        "Чи є у вас наступні симптоми?\n"
-        "(оберіть всі, що є, або 'Немає таких симптомів'):",
-        reply_markup=reply_markup
-    )
-    return CHERVONI_PRAPORY
-
-async def chervoni_prapory(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Червоні прапори"""
-    context.user_data['chervoni_prapory'] = update.message.text
-    
-    # Якщо в режимі редагування, повертаємося до підтвердження
-    if context.user_data.get('editing'):
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    keyboard = [
-        ['Остеопороз', 'Цукровий діабет'],
-        ['Ревматичні захворювання'],
-        ['Прийом стероїдів'],
-        ['Немає супутніх захворювань']
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    await update.message.reply_text(
-        "7️⃣ СУПУТНІ ЗАХВОРЮВАННЯ\n\n"
-        "Оберіть всі, що є:",
-        reply_markup=reply_markup
-    )
-    return SUPUTNI
-
-async def suputni(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Супутні захворювання"""
-    context.user_data['suputni'] = update.message.text
-    
-    # Якщо в режимі редагування, повертаємося до підтвердження
-    if context.user_data.get('editing'):
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    keyboard = [
-        ['Сидяча робота'],
-        ['Фізична робота'],
-        ['Займаюся спортом'],
-        ['Мало рухаюсь']
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    await update.message.reply_text(
-        "8️⃣ РІВЕНЬ АКТИВНОСТІ / РОБОТА\n\n"
-        "Оберіть найбільш підходящий варіант:",
-        reply_markup=reply_markup
-    )
-    return AKTYVNIST
-
-async def aktyvnist(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Рівень активності"""
-    context.user_data['aktyvnist'] = update.message.text
-    
-    # Якщо в режимі редагування і немає спорту, повертаємося до підтвердження
-    if context.user_data.get('editing') and 'спорт' not in update.message.text.lower():
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    if 'спорт' in update.message.text.lower():
-        keyboard = [['Не займаюся спортом']]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        await update.message.reply_text(
-            "Яким спортом займаєтесь?",
-            reply_markup=reply_markup
-        )
-        return SPORT_YAKYI
-    else:
-        keyboard = [['Не приймаю ліків']]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        await update.message.reply_text(
-            "9️⃣ ПОТОЧНЕ ЛІКУВАННЯ\n\n"
-            "Які ліки ви зараз приймаєте?\n"
-            "(напишіть назви або оберіть 'Не приймаю ліків')",
-            reply_markup=reply_markup
-        )
-        return LIKUVANNYA
-
-async def sport_yakyi(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Який спорт"""
-    context.user_data['sport_yakyi'] = update.message.text
-    
-    # Якщо в режимі редагування, повертаємося до підтвердження
-    if context.user_data.get('editing'):
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    keyboard = [['Не приймаю ліків']]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    await update.message.reply_text(
-        "9️⃣ ПОТОЧНЕ ЛІКУВАННЯ\n\n"
-        "Які ліки ви зараз приймаєте?\n"
-        "(напишіть назви або оберіть 'Не приймаю ліків')",
-        reply_markup=reply_markup
-    )
-    return LIKUVANNYA
-
-async def likuvannya(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Поточне лікування"""
-    context.user_data['likuvannya'] = update.message.text
-    
-    # Якщо в режимі редагування, повертаємося до підтвердження
-    if context.user_data.get('editing'):
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    keyboard = [['Так', 'Ні']]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    await update.message.reply_text(
-        "Чи проходите зараз фізіотерапію, масаж або мануальну терапію?",
-        reply_markup=reply_markup
-    )
-    return FIZIOTERAPIYA
-
-async def fizioterapiya(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Фізіотерапія"""
-    context.user_data['fizioterapiya'] = update.message.text
-    
-    # Якщо в режимі редагування, повертаємося до підтвердження
-    if context.user_data.get('editing'):
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    # Запитуємо зріст
-    await update.message.reply_text(
-        "🔟 АНТРОПОМЕТРИЧНІ ДАНІ\n\n"
-        "Введіть ваш зріст у сантиметрах:"
-    )
-    return ZRIST
-
-async def zrist(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Зріст"""
-    context.user_data['zrist'] = update.message.text
-    
-    # Якщо в режимі редагування, повертаємося до підтвердження
-    if context.user_data.get('editing'):
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    await update.message.reply_text("Введіть вашу вагу в кілограмах:")
-    return VAGA
-
-async def vaga(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Вага"""
-    context.user_data['vaga'] = update.message.text
-    
-    # Якщо в режимі редагування, повертаємося до підтвердження
-    if context.user_data.get('editing'):
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    # Показуємо повний список відповідей (без персональної інформації для пацієнта)
-    return await show_confirmation(update, context)
-
-async def confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Підтвердження або редагування"""
-    if update.message.text == '✅ Підтвердити':
-        # Відправляємо пацієнту (без персональної інформації)
-        await update.message.reply_text(
-            "✅ Дякую! Анкету заповнено успішно.\n\n"
-            "Ваші дані відправлено лікарю. Очікуйте на підтвердження запису.\n\n"
-            "Бажаєте заповнити анкету заново? Натисніть /start",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        
-        # Відправляємо лікарям (з персональною інформацією)
-        result = format_survey_result(context.user_data, for_admin=True)
-        if ADMIN_IDS:
-            for admin_id in ADMIN_IDS:
-                try:
-                    await context.bot.send_message(chat_id=admin_id, text=result)
-                    logger.info(f"Анкету відправлено адміністратору {admin_id}")
-                except Exception as e:
-                    logger.error(f"Помилка відправки адміністратору {admin_id}: {e}")
-        else:
-            logger.warning("ADMIN_IDS порожній! Анкету не відправлено жодному адміністратору.")
-        
-        # Зберігаємо в файл
-        save_to_file(context.user_data)
-        
-        return ConversationHandler.END
-        
-    elif update.message.text == '✏️ Змінити дані':
-        # Встановлюємо прапорець режиму редагування
-        context.user_data['editing'] = True
-        
-        # Показуємо меню редагування
-        keyboard = [
-            ['👤 ПІБ', '📅 Вік'],
-            ['📍 Локалізація болю', '🔔 Оніміння'],
-            ['⏰ Коли появився біль', '💥 Травма'],
-            ['💊 Характер болю', '📊 Інтенсивність'],
-            ['⬆️ Що погіршує', '⬇️ Що полегшує'],
-            ['🔄 Попередні епізоди', '⚠️ Червоні прапори'],
-            ['🏥 Супутні захворювання', '🏃 Активність'],
-            ['💊 Поточні ліки', '💆 Фізіотерапія'],
-            ['📏 Зріст', '⚖️ Вага'],
-            ['◀️ Назад до перевірки']
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        
-        await update.message.reply_text(
-            "✏️ Оберіть, що ви хочете змінити:",
-            reply_markup=reply_markup
-        )
-        return EDIT_CHOICE
-    else:
-        await update.message.reply_text(
-            "❌ Анкетування скасовано.\n\n"
-            "Натисніть /start щоб почати заново.",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        return ConversationHandler.END
-
-async def edit_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Вибір поля для редагування"""
-    choice = update.message.text
-    
-    if choice == '◀️ Назад до перевірки':
-        # Вимикаємо режим редагування і повертаємось до підтвердження
-        context.user_data['editing'] = False
-        return await show_confirmation(update, context)
-    
-    elif choice == '👤 ПІБ':
-        await update.message.reply_text(
-            f"Поточне ПІБ: {context.user_data.get('pib')}\n\n"
-            "Введіть нове ПІБ:"
-        )
-        return PIB
-        
-    elif choice == '📅 Вік':
-        await update.message.reply_text(
-            f"Поточний вік: {context.user_data.get('vik')}\n\n"
-            "Введіть новий вік:"
-        )
-        return VIK
-        
-    elif choice == '📍 Локалізація болю':
-        keyboard = [
+async def returning(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Повторний пацієнт: взяти дані з попередньої анкети чи заповнити все заново"""
+    clinic = context.bot_data['clinic']
+    survey = clinic.survey
+    choice = pressed(update, RETURNING_OPTIONS)
+    if choice == REUSE_LABEL:
+        return await survey.proceed(update, context, survey.first.state)
+    if choice == REFILL_LABEL:
+        survey.clear_prefill(context.user_data)
+        return await survey.ask(update, survey.first.state)
+    await survey.show(update, "Оберіть, будь ласка, варіант на клавіатурі:", clinic.returning_keyboard)
+    return RETURNING
+
+async def acknowledge(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Відповідь Telegram на натискання кнопки анкети (інакше кнопка показує годинник);
+    не чекаємо на неї, щоб обробка відповіді пацієнта не затримувалась"""
+    context.application.create_task(update.callback_query.answer(), update=update)
+
+YES_NO = [['Так', 'Ні']]
+
+# Опис анкети: питання, варіанти відповідей, умовні переходи і меню редагування
+SURVEY_QUESTIONS = [
+    Question(
+        PIB, 'pib',
+        prompt="Введіть, будь ласка, ваше ПІБ:",
+        next=VIK,
+        edit_label='👤 ПІБ',
+        edit_prompt="Поточне ПІБ: {}\n\nВведіть нове ПІБ:",
+        stable=True,
+    ),
+    Question(
+        VIK, 'vik',
+        prompt="Скільки вам років? (введіть число)",
+        next=DE_BOLIT,
+        edit_label='📅 Вік',
+        edit_prompt="Поточний вік: {}\n\nВведіть новий вік:",
+        parse=AGE,
+        stable=True,
+    ),
+    Question(
+        DE_BOLIT, 'de_bolit',
+        prompt="1️⃣ ДЕ САМЕ БОЛИТЬ?\n\n"
+               "Оберіть одну або декілька зон (можете написати кілька через кому):",
+        keyboard=[
             ['Шия', 'Грудний відділ'],
             ['Поперек', 'Крижі'],
             ['Біль віддає у руку', 'Біль віддає у ногу']
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        await update.message.reply_text(
-            f"Поточна локалізація: {context.user_data.get('de_bolit')}\n\n"
-            "Оберіть нову локалізацію:",
-            reply_markup=reply_markup
-        )
-        return DE_BOLIT
-        
-    elif choice == '🔔 Оніміння':
-        keyboard = [['Так', 'Ні']]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        await update.message.reply_text(
-            f"Поточна відповідь: {context.user_data.get('onіmіnnya')}\n\n"
-            "Чи є оніміння, поколювання або слабкість?",
-            reply_markup=reply_markup
-        )
-        return ОНІМІННЯ
-        
-    elif choice == '⏰ Коли появився біль':
-        keyboard = [
-            ['До 6 тижнів (гострий)'],
-            ['6-12 тижнів (підгострий)'],
-            ['Більше 3 місяців (хронічний)']
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        await update.message.reply_text(
-            f"Поточна відповідь: {context.user_data.get('koly_zyavyvsya')}\n\n"
-            "Коли появився біль?",
-            reply_markup=reply_markup
-        )
-        return KOLY_ZYAVYVSYA
-        
-    elif choice == '💥 Травма':
-        keyboard = [['Так', 'Ні']]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        await update.message.reply_text(
-            f"Поточна відповідь: {context.user_data.get('travma')}\n\n"
-            "Біль з'явився після травми, падіння або підйому ваги?",
-            reply_markup=reply_markup
-        )
-        return TRAVMA
-        
-    elif choice == '💊 Характер болю':
-        keyboard = [
+        ],
+        next=ОНІМІННЯ,
+        branches=(Branch(DE_BOLIT_DETALІ, contains='віддає'),),
+        edit_label='📍 Локалізація болю',
+        edit_prompt="Поточна локалізація: {}\n\nОберіть нову локалізацію:",
+        multi=True,
+    ),
+    Question(
+        DE_BOLIT_DETALІ, 'de_bolit',
+        prompt="Опишіть детальніше, куди саме віддає біль:\n"
+               "(наприклад: у праву руку до ліктя, у ліву ногу до коліна)",
+        next=ОНІМІННЯ,
+        append="\nДеталі: {}",
+    ),
+    Question(
+        ОНІМІННЯ, 'onіmіnnya',
+        prompt="Чи є оніміння, поколювання або слабкість?",
+        keyboard=YES_NO,
+        next=KOLY_ZYAVYVSYA,
+        branches=(Branch(ОНІМІННЯ_DE, equals='Так'),),
+        edit_label='🔔 Оніміння',
+        edit_prompt="Поточна відповідь: {}\n\nЧи є оніміння, поколювання або слабкість?",
+    ),
+    Question(
+        ОНІМІННЯ_DE, 'onіmіnnya_de',
+        prompt="Де саме? (опишіть локалізацію)",
+        next=KOLY_ZYAVYVSYA,
+    ),
+    Question(
+        KOLY_ZYAVYVSYA, 'koly_zyavyvsya',
+        prompt="2️⃣ КОЛИ ПОЯВИВСЯ БІЛЬ?",
+        keyboard=[[option] for option in ONSET_OPTIONS],
+        next=TRAVMA,
+        edit_label='⏰ Коли появився біль',
+        edit_prompt="Поточна відповідь: {}\n\nКоли появився біль?",
+    ),
+    Question(
+        TRAVMA, 'travma',
+        prompt="Біль з'явився після травми, падіння або підйому ваги?",
+        keyboard=YES_NO,
+        next=KHARAKTER_BOLY,
+        branches=(Branch(TRAVMA_DETALІ, equals='Так'),),
+        edit_label='💥 Травма',
+        edit_prompt="Поточна відповідь: {}\n\nБіль з'явився після травми, падіння або підйому ваги?",
+    ),
+    Question(
+        TRAVMA_DETALІ, 'travma_detalі',
+        prompt="Що саме сталося? (опишіть ситуацію або натисніть 'Пропустити')",
+        keyboard=[['Пропустити']],
+        next=KHARAKTER_BOLY,
+        replace={'Пропустити': 'Не вказано'},
+    ),
+    Question(
+        KHARAKTER_BOLY, 'kharakter_boly',
+        prompt="3️⃣ ОХАРАКТЕРИЗУЙТЕ БІЛЬ\n\n"
+               "Оберіть один або декілька варіантів (можете написати через кому):",
+        keyboard=[
             ['Гострий', 'Ниючий', 'Прострілюючий'],
             ['Пекучий', 'Тиснучий'],
             ['Постійний', 'Періодичний']
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        await update.message.reply_text(
-            f"Поточна відповідь: {context.user_data.get('kharakter_boly')}\n\n"
-            "Охарактеризуйте біль:",
-            reply_markup=reply_markup
-        )
-        return KHARAKTER_BOLY
-        
-    elif choice == '📊 Інтенсивність':
-        keyboard = [
+        ],
+        next=SHKALA_BOLY,
+        edit_label='💊 Характер болю',
+        edit_prompt="Поточна відповідь: {}\n\nОхарактеризуйте біль:",
+        multi=True,
+    ),
+    Question(
+        SHKALA_BOLY, 'shkala_boly',
+        prompt="Оцініть інтенсивність болю за шкалою від 0 до 10\n"
+               "(0 - немає болю, 10 - максимальний біль):",
+        keyboard=[
             ['1', '2', '3'],
             ['4', '5', '6'],
             ['7', '8', '9', '10']
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        await update.message.reply_text(
-            f"Поточна оцінка: {context.user_data.get('shkala_boly')}\n\n"
-            "Оцініть інтенсивність болю (0-10):",
-            reply_markup=reply_markup
-        )
-        return SHKALA_BOLY
-        
-    elif choice == '⬆️ Що погіршує':
-        keyboard = [
+        ],
+        next=POHIRSHUE,
+        edit_label='📊 Інтенсивність',
+        edit_prompt="Поточна оцінка: {}\n\nОцініть інтенсивність болю (0-10):",
+        parse=PAIN,
+    ),
+    Question(
+        POHIRSHUE, 'pohirshue',
+        prompt="4️⃣ ЩО ПОГІРШУЄ БІЛЬ?\n\n"
+               "Оберіть один або декілька варіантів:",
+        keyboard=[
             ['Сидіння', 'Стояння', 'Ходьба'],
             ['Нахили', 'Повороти'],
             ['Кашель/чхання', 'Нічний час'],
             ['Немає особливих факторів']
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        await update.message.reply_text(
-            f"Поточна відповідь: {context.user_data.get('pohirshue')}\n\n"
-            "Що погіршує біль?",
-            reply_markup=reply_markup
-        )
-        return POHIRSHUE
-        
-    elif choice == '⬇️ Що полегшує':
-        keyboard = [
+        ],
+        next=POLEHSHUE,
+        edit_label='⬆️ Що погіршує',
+        edit_prompt="Поточна відповідь: {}\n\nЩо погіршує біль?",
+        multi=True,
+        exclusive=('Немає особливих факторів',),
+    ),
+    Question(
+        POLEHSHUE, 'polehshue',
+        prompt="ЩО ПОЛЕГШУЄ БІЛЬ?\n\n"
+               "Оберіть один або декілька варіантів:",
+        keyboard=[
             ['Лежання', 'Рух'],
             ['Тепло', 'Холод', 'Ліки'],
             ['Немає полегшення']
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        await update.message.reply_text(
-            f"Поточна відповідь: {context.user_data.get('polehshue')}\n\n"
-            "Що полегшує біль?",
-            reply_markup=reply_markup
-        )
-        return POLEHSHUE
-        
-    elif choice == '🔄 Попередні епізоди':
-        keyboard = [['Так', 'Ні']]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        await update.message.reply_text(
-            f"Поточна відповідь: {context.user_data.get('ranishi_epizody')}\n\n"
-            "Чи були раніше подібні епізоди болю в спині?",
-            reply_markup=reply_markup
-        )
-        return RANISHI_EPIZODY
-        
-    elif choice == '⚠️ Червоні прапори':
-        keyboard = [
+        ],
+        next=RANISHI_EPIZODY,
+        edit_label='⬇️ Що полегшує',
+        edit_prompt="Поточна відповідь: {}\n\nЩо полегшує біль?",
+        multi=True,
+        exclusive=('Немає полегшення',),
+    ),
+    Question(
+        RANISHI_EPIZODY, 'ranishi_epizody',
+        prompt="5️⃣ ЧИ БУЛИ РАНІШЕ ПОДІБНІ ЕПІЗОДИ БОЛЮ В СПИНІ?",
+        keyboard=YES_NO,
+        next=CHERVONI_PRAPORY,
+        branches=(Branch(RANISHI_YAK_LIKUVALY, equals='Так'),),
+        edit_label='🔄 Попередні епізоди',
+        edit_prompt="Поточна відповідь: {}\n\nЧи були раніше подібні епізоди болю в спині?",
+    ),
+    Question(
+        RANISHI_YAK_LIKUVALY, 'ranishi_yak_likuvaly',
+        prompt="Як тоді лікували? (опишіть методи лікування або оберіть 'Не лікував(ла)')",
+        keyboard=[['Не лікував(ла)']],
+        next=CHERVONI_PRAPORY,
+    ),
+    Question(
+        CHERVONI_PRAPORY, 'chervoni_prapory',
+        prompt="6️⃣ ЧЕРВОНІ ПРАПОРИ ⚠️\n\n"
+               "Чи є у вас наступні симптоми?\n"
+               "(оберіть всі, що є, або 'Немає таких симптомів'):",
+        keyboard=[
             ['Незрозуміла втрата ваги', 'Температура'],
             ['Онкологія в анамнезі'],
             ['Проблеми з сечовипусканням'],
@@ -841,105 +404,510 @@ async def edit_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
             ['Оніміння в промежині'],
             ['Різка слабкість кінцівки'],
             ['Немає таких симптомів']
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        await update.message.reply_text(
-            f"Поточна відповідь: {context.user_data.get('chervoni_prapory')}\n\n"
-            "Чи є тривожні симптоми?",
-            reply_markup=reply_markup
-        )
-        return CHERVONI_PRAPORY
-        
-    elif choice == '🏥 Супутні захворювання':
-        keyboard = [
+        ],
+        next=SUPUTNI,
+        edit_label='⚠️ Червоні прапори',
+        edit_prompt="Поточна відповідь: {}\n\nЧи є тривожні симптоми?",
+        multi=True,
+        exclusive=('Немає таких симптомів',),
+    ),
+    Question(
+        SUPUTNI, 'suputni',
+        prompt="7️⃣ СУПУТНІ ЗАХВОРЮВАННЯ\n\n"
+               "Оберіть всі, що є:",
+        keyboard=[
             ['Остеопороз', 'Цукровий діабет'],
             ['Ревматичні захворювання'],
             ['Прийом стероїдів'],
             ['Немає супутніх захворювань']
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        await update.message.reply_text(
-            f"Поточна відповідь: {context.user_data.get('suputni')}\n\n"
-            "Супутні захворювання:",
-            reply_markup=reply_markup
-        )
-        return SUPUTNI
-        
-    elif choice == '🏃 Активність':
-        keyboard = [
+        ],
+        next=AKTYVNIST,
+        edit_label='🏥 Супутні захворювання',
+        edit_prompt="Поточна відповідь: {}\n\nСупутні захворювання:",
+        stable=True,
+        multi=True,
+        exclusive=('Немає супутніх захворювань',),
+    ),
+    Question(
+        AKTYVNIST, 'aktyvnist',
+        prompt="8️⃣ РІВЕНЬ АКТИВНОСТІ / РОБОТА\n\n"
+               "Оберіть найбільш підходящий варіант:",
+        keyboard=[
             ['Сидяча робота'],
             ['Фізична робота'],
             ['Займаюся спортом'],
             ['Мало рухаюсь']
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        await update.message.reply_text(
-            f"Поточна відповідь: {context.user_data.get('aktyvnist')}\n\n"
-            "Рівень активності / робота:",
-            reply_markup=reply_markup
+        ],
+        next=LIKUVANNYA,
+        branches=(Branch(SPORT_YAKYI, contains='спорт'),),
+        edit_label='🏃 Активність',
+        edit_prompt="Поточна відповідь: {}\n\nРівень активності / робота:",
+        stable=True,
+    ),
+    Question(
+        SPORT_YAKYI, 'sport_yakyi',
+        prompt="Яким спортом займаєтесь?",
+        keyboard=[['Не займаюся спортом']],
+        next=LIKUVANNYA,
+        stable=True,
+    ),
+    Question(
+        LIKUVANNYA, 'likuvannya',
+        prompt="9️⃣ ПОТОЧНЕ ЛІКУВАННЯ\n\n"
+               "Які ліки ви зараз приймаєте?\n"
+               "(напишіть назви або оберіть 'Не приймаю ліків')",
+        keyboard=[['Не приймаю ліків']],
+        next=FIZIOTERAPIYA,
+        edit_label='💊 Поточні ліки',
+        edit_prompt="Поточна відповідь: {}\n\nЯкі ліки приймаєте?",
+    ),
+    Question(
+        FIZIOTERAPIYA, 'fizioterapiya',
+        prompt="Чи проходите зараз фізіотерапію, масаж або мануальну терапію?",
+        keyboard=YES_NO,
+        next=ZRIST,
+        edit_label='💆 Фізіотерапія',
+        edit_prompt="Поточна відповідь: {}\n\nЧи проходите зараз фізіотерапію, масаж або мануальну терапію?",
+    ),
+    Question(
+        ZRIST, 'zrist',
+        prompt="🔟 АНТРОПОМЕТРИЧНІ ДАНІ\n\n"
+               "Введіть ваш зріст у сантиметрах:",
+        next=VAGA,
+        edit_label='📏 Зріст',
+        edit_prompt="Поточний зріст: {} см\n\nВведіть новий зріст у сантиметрах:",
+        parse=HEIGHT,
+        stable=True,
+    ),
+    Question(
+        VAGA, 'vaga',
+        prompt="Введіть вашу вагу в кілограмах:",
+        edit_label='⚖️ Вага',
+        edit_prompt="Поточна вага: {} кг\n\nВведіть нову вагу в кілограмах:",
+        parse=WEIGHT,
+        stable=True,
+    ),
+]
+
+# Відповіді-варіанти з клавіатур зберігаються в сесії пацієнта як коди
+for question in SURVEY_QUESTIONS:
+    if question.keyboard:
+        register_choices(question.key, [option for row in question.keyboard for option in row])
+        register_choices(question.key, question.replace.values())
+
+def survey_questions(overrides=None):
+    """Анкета клініки: SURVEY_QUESTIONS з перевизначеннями (назва стану -> False, щоб
+    пропустити питання, або словник нових текстів). Переходи на пропущене питання ведуть
+    до наступного за ним, уточнення з пропущеним питанням не ставляться, а питання,
+    до яких більше не можна дійти, прибираються (і з меню редагування)"""
+    if not overrides:
+        return SURVEY_QUESTIONS
+    skipped = {STATE_NAMES.index(name) for name, override in overrides.items() if override is False}
+    by_state = {question.state: question for question in SURVEY_QUESTIONS}
+
+    def resolve(state):
+        while state in skipped:
+            state = by_state[state].next
+        return state
+
+    questions = {}
+    for question in SURVEY_QUESTIONS:
+        if question.state in skipped:
+            continue
+        override = overrides.get(STATE_NAMES[question.state]) or {}
+        questions[question.state] = replace(
+            question, **override, next=resolve(question.next),
+            branches=tuple(branch for branch in question.branches if branch.target not in skipped),
         )
-        return AKTYVNIST
-        
-    elif choice == '💊 Поточні ліки':
-        keyboard = [['Не приймаю ліків']]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        await update.message.reply_text(
-            f"Поточна відповідь: {context.user_data.get('likuvannya')}\n\n"
-            "Які ліки приймаєте?",
-            reply_markup=reply_markup
+    first = resolve(SURVEY_QUESTIONS[0].state)
+    if first is None:
+        raise ValueError("в анкеті не лишилось жодного питання")
+    reachable, pending = set(), [first]
+    while pending:
+        state = pending.pop()
+        if state is None or state in reachable:
+            continue
+        reachable.add(state)
+        question = questions[state]
+        pending.extend([question.next] + [branch.target for branch in question.branches])
+    # Перше питання анкети - перше в списку
+    return [questions[first]] + [
+        question for state, question in questions.items() if state in reachable and state != first
+    ]
+
+class Clinic:
+    """Усе, що належить одному боту (клініці): лікарі, сховище і черга збереження анкет,
+    розсилка, тріаж, зведення, скомпільована анкета, сесії і воронка.
+    Обробники знаходять клініку свого бота в context.bot_data['clinic'].
+
+    Спільні для всіх клінік процесу - черга вихідних повідомлень, пули з'єднань
+    з Bot API, STATE_DB, довідники варіантів сесій і endpoint метрик.
+    """
+
+    def __init__(self, name='', admin_ids=ADMIN_IDS, surveys_dir=SURVEYS_DIR, survey_storage=SURVEY_STORAGE,
+                 survey_db=SURVEY_DB, digest_interval=DIGEST_INTERVAL, survey_ui=SURVEY_UI, questions=None):
+        self.name = name
+        self.admin_ids = list(admin_ids)
+        # Сховище анкет з індексами за пацієнтом, датою і червоними прапорами
+        self.survey_store = SurveyStore(survey_db, RED_FLAG_OPTIONS, ONSET_OPTIONS)
+        # Фонове збереження анкет (запускається в post_init, зупиняється в post_shutdown)
+        if survey_storage == 'sqlite':
+            sink = self.survey_store
+        elif survey_storage == 'archive':
+            # Шифрування - у потоці збереження, confirm лише ставить анкету в чергу
+            from survey_archive import SurveyArchive
+            sink = SurveyArchive(os.path.join(surveys_dir, 'archive'), SURVEY_ARCHIVE_KEY)
+        else:
+            sink = TextFileSink(surveys_dir, format_survey_result)
+        self.survey_writer = SurveyWriter(
+            sink, max_backlog=SURVEY_QUEUE_SIZE, max_retries=SURVEY_WRITE_RETRIES,
+            dead_letter=os.path.join(surveys_dir, 'failed_surveys.jsonl'), close_timeout=SURVEY_CLOSE_TIMEOUT,
         )
-        return LIKUVANNYA
-        
-    elif choice == '💆 Фізіотерапія':
-        keyboard = [['Так', 'Ні']]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        await update.message.reply_text(
-            f"Поточна відповідь: {context.user_data.get('fizioterapiya')}\n\n"
-            "Чи проходите зараз фізіотерапію, масаж або мануальну терапію?",
-            reply_markup=reply_markup
+        # Розсилка анкет лікарям
+        self.admin_fanout = AdminFanout(self.admin_ids, outbound)
+        # Зведення будується зі сховища анкет, тому доступне лише для SQLite
+        # (модуль вивантаження імпортується, лише коли зведення увімкнено)
+        self.digest = None
+        if digest_interval > 0 and survey_storage == 'sqlite':
+            from survey_export import Digest
+            self.digest = Digest(self.survey_store, self.admin_ids, outbound, digest_interval)
+        elif digest_interval > 0:
+            logger.warning("DIGEST_INTERVAL потребує SURVEY_STORAGE=sqlite, анкети надсилатимуться окремо")
+        # Термінове сповіщення лікарів про червоні прапори одразу після відповіді
+        self.triage = Triage(self.admin_fanout, RED_FLAG_OPTIONS)
+        # Анкета компілюється один раз: стан і кнопка меню редагування -> питання за O(1)
+        inline = survey_ui == 'inline'
+        self.survey = Questionnaire(survey_questions(questions), on_complete=show_confirmation,
+                                    on_answer=self.triage.on_answer, send=outbound.reply, edit=outbound.edit,
+                                    inline=inline)
+        self.confirm_keyboard = inline_keyboard(CONFIRM_ROWS, CONFIRM_PREFIX) if inline else reply_keyboard(CONFIRM_ROWS)
+        self.returning_keyboard = (
+            inline_keyboard(RETURNING_ROWS, RETURNING_PREFIX) if inline else reply_keyboard(RETURNING_ROWS)
         )
-        return FIZIOTERAPIYA
-        
-    elif choice == '📏 Зріст':
-        await update.message.reply_text(
-            f"Поточний зріст: {context.user_data.get('zrist', 'Не вказано')} см\n\n"
-            "Введіть новий зріст у сантиметрах:"
+        # Завершення анкети прибирає клавіатуру відповідей; inline-кнопки зникають при редагуванні
+        self.final_keyboard = None if inline else REMOVE_KEYBOARD
+        # Попередні анкети повторних пацієнтів читаються зі сховища анкет
+        self.prefill_store = self.survey_store if RETURNING_PREFILL and survey_storage == 'sqlite' else None
+        # Метрики: час обробників за станами, воронка анкети
+        self.conversation_metrics = ConversationMetrics(STATE_NAMES)
+        # Неактивні сесії вивантажуються з пам'яті (O(протермінованих) за прохід)
+        self.session_cache = SessionCache(
+            ttl=SESSION_TTL,
+            state_ttl={
+                STATE_NAMES.index(name.strip()): float(ttl)
+                for name, ttl in (item.split('=') for item in SESSION_STATE_TTL.split(',') if item.strip())
+            },
+            max_sessions=SESSION_MAX,
+            spill=SESSION_SPILL,
+            sweep_interval=SESSION_SWEEP_INTERVAL,
+            on_drop=self.conversation_metrics.forget,
         )
-        return ZRIST
-        
-    elif choice == '⚖️ Вага':
-        await update.message.reply_text(
-            f"Поточна вага: {context.user_data.get('vaga', 'Не вказано')} кг\n\n"
-            "Введіть нову вагу в кілограмах:"
-        )
-        return VAGA
+        # Статистика клініки в bot_component_stat: component="<назва>/survey_writer" (з TENANTS)
+        prefix = f'{name}/' if name else ''
+        export_stats(prefix + 'survey_writer', self.survey_writer.stats)
+        export_stats(prefix + 'triage', self.triage.stats)
+        export_stats(prefix + 'sessions', self.session_cache.stats)
+        if self.digest:
+            export_stats(prefix + 'digest', self.digest.stats)
+
+    async def start(self, application):
+        """Фонові задачі клініки: запис анкет, вивантаження сесій, зведення"""
+        await self.survey_writer.start()
+        await self.session_cache.start()
+        # Зведення надсилає один процес (анкети всіх процесів - у спільному сховищі)
+        if self.digest and WORKER_INDEX == 0:
+            await self.digest.start(application.bot)
+
+    async def close(self):
+        """Дописує анкети з черги і зупиняє фонові задачі клініки"""
+        await self.session_cache.close()
+        if self.digest:
+            await self.digest.close()
+        await self.survey_writer.close()
 
-def save_to_file(user_data):
-    """Зберігає результати в файл"""
-    try:
-        filename = f"surveys/survey_{user_data.get('user_id')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+async def confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Підтвердження або редагування"""
+    clinic = context.bot_data['clinic']
+    choice = pressed(update, CONFIRM_OPTIONS)
+    if choice is None:
+        return None
+    if choice == '✅ Підтвердити':
+        clinic.conversation_metrics.mark_completed(update)
+        # Відправляємо пацієнту (без персональної інформації)
+        await clinic.survey.show(
+            update,
+            "✅ Дякую! Анкету заповнено успішно.\n\n"
+            "Ваші дані відправлено лікарю. Очікуйте на підтвердження запису.\n\n"
+            "Бажаєте заповнити анкету заново? Натисніть /start",
+            clinic.final_keyboard
+        )
+        
+        # Відправляємо лікарям (з персональною інформацією)
+        # Розсилка йде у фоні, щоб не затримувати обробку наступних повідомлень;
+        # анкети з червоними прапорами йдуть поперед звичайних. У режимі зведення
+        # звичайні анкети потраплять у наступний CSV, термінові надсилаються одразу
+        priority = URGENT if clinic.triage.flags(context.user_data) else ROUTINE
+        if clinic.digest is None or priority == URGENT:
+            result = format_survey_result(context.user_data, for_admin=True)
+            context.application.create_task(
+                clinic.admin_fanout.send(context.bot, result, priority), update=update)
         
-        import os
-        os.makedirs('surveys', exist_ok=True)
+        # Ставимо анкету в чергу збереження (запис на диск виконується у фоні)
+        await save_to_file(clinic.survey_writer, context.user_data)
         
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(format_survey_result(user_data, for_admin=True))
+        return ConversationHandler.END
         
-        logger.info(f"Анкету збережено: {filename}")
+    elif choice == '✏️ Змінити дані':
+        # Показуємо меню редагування
+        await clinic.survey.show_edit_menu(update, context)
+        return EDIT_CHOICE
+    else:
+        await clinic.survey.show(
+            update,
+            "❌ Анкетування скасовано.\n\n"
+            "Натисніть /start щоб почати заново.",
+            clinic.final_keyboard
+        )
+        return ConversationHandler.END
+
+async def save_to_file(survey_writer, user_data):
+    """Ставить анкету в чергу збереження"""
+    try:
+        await survey_writer.enqueue(survey_record(user_data))
     except Exception as e:
-        logger.error(f"Помилка збереження файлу: {e}")
+        logger.error(f"Помилка збереження анкети: {e}")
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Скасування розмови"""
-    await update.message.reply_text(
+    await outbound.reply(
+        update.message,
         "❌ Анкетування скасовано.\n\n"
         "Натисніть /start щоб почати заново.",
-        reply_markup=ReplyKeyboardRemove()
+        REMOVE_KEYBOARD
     )
     return ConversationHandler.END
 
+async def start_clinic(application: Application):
+    await application.bot_data['clinic'].start(application)
+
+async def stop_clinic(application: Application):
+    await application.bot_data['clinic'].close()
+
+async def start_shared():
+    """Спільні для всіх ботів процесу фонові задачі"""
+    if metrics_server:
+        await metrics_server.start()
+
+async def stop_shared():
+    if metrics_server:
+        await metrics_server.close()
+    await outbound.close()
+
+async def post_init(application: Application):
+    """Запуск фонових задач після ініціалізації бота"""
+    await start_clinic(application)
+    await start_shared()
+
+async def post_shutdown(application: Application):
+    """Дописуємо анкети з черги перед завершенням роботи"""
+    await stop_clinic(application)
+    await stop_shared()
+
+def bot_api_request(pool='send', connection_pool_size=None):
+    """Пул з'єднань з Bot API з налаштуваннями BOT_API_*; кожен запит вимірюється.
+    pool='updates' - long polling: одне з'єднання на бота, тайм-аут читання задає PTB"""
+    http_version = '1.1'
+    if BOT_API_HTTP2 and pool == 'send':
+        if importlib.util.find_spec('h2'):
+            http_version = '2'
+        else:
+            logger.warning("BOT_API_HTTP2 потребує пакета h2 (pip install 'httpx[http2]'), використовується HTTP/1.1")
+    return InstrumentedRequest(
+        connection_pool_size=connection_pool_size or (BOT_API_POOL_SIZE if pool == 'send' else 1),
+        pool=pool,
+        keepalive=BOT_API_KEEPALIVE,
+        pool_timeout=BOT_API_POOL_TIMEOUT,
+        connect_timeout=BOT_API_CONNECT_TIMEOUT,
+        read_timeout=BOT_API_READ_TIMEOUT,
+        write_timeout=BOT_API_READ_TIMEOUT,
+        http_version=http_version,
+    )
+
+def _builder(token, webhook=False, request=None, get_updates_request=None):
+    """Спільні налаштування Application: Bot API і джерело оновлень"""
+    builder = (
+        Application.builder()
+        .token(token)
+        # Окремі пули для відправки і для long polling, тож відповіді не чекають на getUpdates
+        .request(request or bot_api_request())
+        .get_updates_request(get_updates_request or bot_api_request('updates'))
+    )
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(f"{TELEGRAM_API_URL.rstrip('/')}/bot")
+    if webhook:
+        # Оновлення надходять через власний HTTP сервер (або від маршрутизатора) в обмежену чергу
+        builder = builder.updater(None).update_queue(asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE))
+    return builder
+
+def state_persistence():
+    """Стан незавершених анкет переживає перезапуск бота (порожній STATE_DB вимикає).
+    Процес-обробник завантажує лише сесії своїх користувачів; якщо SessionCache
+    вміє відновлювати вивантажені сесії, при старті не завантажується нічого -
+    кожна сесія читається з диска при першому оновленні її пацієнта"""
+    if not STATE_DB:
+        return None
+    from state_store import SQLitePersistence
+    return SQLitePersistence(
+        STATE_DB, update_interval=PERSISTENCE_INTERVAL, user_data_type=Session,
+        shard=(WORKER_INDEX, WORKER_COUNT), preload=not SESSION_SPILL,
+    )
+
+def build_application(token, webhook=False, request=None, clinic=None, persistence=None,
+                      get_updates_request=None, shared=True):
+    """Створює Application з усіма обробниками.
+    request - власний BaseRequest для Bot API (навантажувальні тести підставляють фейковий);
+    clinic - клініка бота (за замовчуванням з ADMIN_IDS, SURVEY_DB тощо);
+    shared=False - post_init/post_shutdown не запускають спільні компоненти (їх запускає run_tenants)"""
+    clinic = clinic or Clinic()
+    builder = (
+        _builder(token, webhook, request, get_updates_request)
+        .post_init(post_init if shared else start_clinic)
+        .post_shutdown(post_shutdown if shared else stop_clinic)
+        # Компактна сесія пацієнта замість словника user_data
+        .context_types(ContextTypes(user_data=Session))
+        # Різні користувачі обробляються паралельно, один користувач — послідовно
+        .concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES))
+    )
+    persistence = persistence or state_persistence()
+    if persistence:
+        builder = builder.persistence(persistence)
+    application = builder.build()
+    application.bot_data['clinic'] = clinic
+    
+    survey = clinic.survey
+    with warnings.catch_warnings():
+        # Inline-кнопки відстежуються за користувачем, а не за повідомленням (per_message=False):
+        # в анкети одне активне повідомлення з кнопками, і текстові відповіді теж мають потрапляти в розмову
+        warnings.filterwarnings('ignore', message=".*per_message=False", category=PTBUserWarning)
+        conv_handler = ConversationHandler(
+            entry_points=[CommandHandler('start', start)],
+            states={
+                **survey.states(),
+                CONFIRM: survey.answer_handlers(confirm, CONFIRM_PREFIX),
+                EDIT_CHOICE: survey.answer_handlers(survey.edit_choice, EDIT_PREFIX),
+                RETURNING: survey.answer_handlers(returning, RETURNING_PREFIX),
+            },
+            fallbacks=[CommandHandler('cancel', cancel)],
+            name='survey',
+            persistent=persistence is not None,
+        )
+    clinic.conversation_metrics.instrument(conv_handler)
+    
+    if survey.inline:
+        # Кожне натискання кнопки анкети підтверджується, навіть якщо кнопка вже неактуальна.
+        # Окрема група: у групі -1 SessionCache відновлює вивантажену сесію, а PTB у кожній
+        # групі запускає лише перший відповідний обробник
+        application.add_handler(CallbackQueryHandler(acknowledge, pattern=f'^{CALLBACK_PREFIX}'), group=-2)
+    application.add_handler(conv_handler)
+    clinic.session_cache.attach(application, conv_handler)
+    admin_commands.register(application, clinic.survey_store, clinic.admin_ids, outbound)
+    return application
+
+def build_tenants(tenants, webhook=False, request=None):
+    """Application для кожної клініки з TENANTS (назва -> Application). Спільні: цикл подій,
+    черга вихідних повідомлень, пули з'єднань з Bot API і одне з'єднання з STATE_DB"""
+    request = request or bot_api_request()
+    # Кожен бот тримає одне з'єднання long polling
+    get_updates_request = bot_api_request('updates', connection_pool_size=len(tenants))
+    persistence = state_persistence()
+    applications = {}
+    for tenant in tenants:
+        try:
+            clinic = Clinic(
+                tenant.name, tenant.admin_ids, tenant.surveys_dir, tenant.survey_storage, tenant.survey_db,
+                tenant.digest_interval, tenant.survey_ui, tenant.questions,
+            )
+        except ValueError as e:
+            raise ValueError(f"клініка {tenant.name}: {e}") from None
+        applications[tenant.name] = build_application(
+            tenant.token, webhook, request, clinic,
+            persistence.for_tenant(tenant.name) if persistence else None,
+            get_updates_request, shared=False,
+        )
+    return applications
+
+def run_worker(updates):
+    """Процес-обробник (WORKERS > 1): оновлення надходять від маршрутизатора"""
+    from workers import serve_updates
+    logging.getLogger(__name__).info(f"Процес-обробник {WORKER_INDEX + 1} з {WORKER_COUNT}")
+    asyncio.run(serve_updates(build_application(TOKEN, webhook=True), updates))
+
+def build_router(token, pool, webhook=False):
+    """Application головного процесу при WORKERS > 1: отримує оновлення (polling або webhook)
+    і передає кожне процесу-обробнику його користувача"""
+    async def forward(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user = update.effective_user
+        pool.dispatch(user.id if user else 0, update.to_dict())
+
+    async def start_workers(application: Application):
+        pool.start()
+        if metrics_server:
+            await metrics_server.start()
+
+    async def stop_workers(application: Application):
+        if metrics_server:
+            await metrics_server.close()
+        await pool.close()
+
+    application = _builder(token, webhook).post_init(start_workers).post_shutdown(stop_workers).build()
+    application.add_handler(TypeHandler(Update, forward))
+    return application
+
+def main_tenants():
+    """Запуск усіх клінік з TENANTS в одному процесі"""
+    from tenants import load_tenants, run_tenants
+    try:
+        tenants = load_tenants(TENANTS, SURVEYS_DIR, SURVEY_STORAGE, DIGEST_INTERVAL, SURVEY_UI,
+                               states=[STATE_NAMES[question.state] for question in SURVEY_QUESTIONS])
+    except (OSError, ValueError) as e:
+        logger.error(f"❌ Некоректний TENANTS: {e}")
+        print(f"❌ Помилка: {e}")
+        return
+    if WORKERS > 1:
+        logger.warning("WORKERS не підтримується разом з TENANTS, усі клініки обслуговує один процес")
+    for tenant in tenants:
+        if not tenant.admin_ids:
+            logger.warning(f"⚠️ Клініка {tenant.name}: список лікарів порожній, анкети не надсилатимуться")
+    
+    try:
+        applications = build_tenants(tenants, webhook=bool(WEBHOOK_URL))
+    except ValueError as e:
+        logger.error(f"❌ Некоректний TENANTS: {e}")
+        print(f"❌ Помилка: {e}")
+        return
+    extra_stats = {
+        f'{name}/triage': application.bot_data['clinic'].triage.stats
+        for name, application in applications.items()
+    }
+    logger.info(f"🤖 Запущено {len(applications)} ботів: {', '.join(applications)}")
+    print(f"🤖 Запущено {len(applications)} ботів! Натисніть Ctrl+C для зупинки.")
+    asyncio.run(run_tenants(
+        applications,
+        WEBHOOK_URL,
+        port=PORT,
+        webhook_path=WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        extra_stats=extra_stats,
+        on_start=start_shared,
+        on_stop=stop_shared,
+    ))
+
 def main():
     """Запуск бота"""
+    if TENANTS:
+        main_tenants()
+        return
+    
     if not TOKEN:
         logger.error("❌ TELEGRAM_BOT_TOKEN не встановлено в змінних оточення!")
         print("❌ Помилка: TELEGRAM_BOT_TOKEN не знайдено!")
@@ -951,45 +919,28 @@ def main():
         print("⚠️ УВАГА: ADMIN_IDS порожній!")
         print("Анкети не будуть відправлятися адміністраторам.\n")
     
-    application = Application.builder().token(TOKEN).build()
-    
-    conv_handler = ConversationHandler(
-        entry_points=[CommandHandler('start', start)],
-        states={
-            PIB: [MessageHandler(filters.TEXT & ~filters.COMMAND, pib)],
-            VIK: [MessageHandler(filters.TEXT & ~filters.COMMAND, vik)],
-            DE_BOLIT: [MessageHandler(filters.TEXT & ~filters.COMMAND, de_bolit)],
-            DE_BOLIT_DETALІ: [MessageHandler(filters.TEXT & ~filters.COMMAND, de_bolit_detalі)],
-            ОНІМІННЯ: [MessageHandler(filters.TEXT & ~filters.COMMAND, onіmіnnya)],
-            ОНІМІННЯ_DE: [MessageHandler(filters.TEXT & ~filters.COMMAND, onіmіnnya_de)],
-            KOLY_ZYAVYVSYA: [MessageHandler(filters.TEXT & ~filters.COMMAND, koly_zyavyvsya)],
-            TRAVMA: [MessageHandler(filters.TEXT & ~filters.COMMAND, travma)],
-            TRAVMA_DETALІ: [MessageHandler(filters.TEXT & ~filters.COMMAND, travma_detalі)],
-            KHARAKTER_BOLY: [MessageHandler(filters.TEXT & ~filters.COMMAND, kharakter_boly)],
-            SHKALA_BOLY: [MessageHandler(filters.TEXT & ~filters.COMMAND, shkala_boly)],
-            POHIRSHUE: [MessageHandler(filters.TEXT & ~filters.COMMAND, pohirshue)],
-            POLEHSHUE: [MessageHandler(filters.TEXT & ~filters.COMMAND, polehshue)],
-            RANISHI_EPIZODY: [MessageHandler(filters.TEXT & ~filters.COMMAND, ranishi_epizody)],
-            RANISHI_YAK_LIKUVALY: [MessageHandler(filters.TEXT & ~filters.COMMAND, ranishi_yak_likuvaly)],
-            CHERVONI_PRAPORY: [MessageHandler(filters.TEXT & ~filters.COMMAND, chervoni_prapory)],
-            SUPUTNI: [MessageHandler(filters.TEXT & ~filters.COMMAND, suputni)],
-            AKTYVNIST: [MessageHandler(filters.TEXT & ~filters.COMMAND, aktyvnist)],
-            SPORT_YAKYI: [MessageHandler(filters.TEXT & ~filters.COMMAND, sport_yakyi)],
-            LIKUVANNYA: [MessageHandler(filters.TEXT & ~filters.COMMAND, likuvannya)],
-            FIZIOTERAPIYA: [MessageHandler(filters.TEXT & ~filters.COMMAND, fizioterapiya)],
-            ZRIST: [MessageHandler(filters.TEXT & ~filters.COMMAND, zrist)],
-            VAGA: [MessageHandler(filters.TEXT & ~filters.COMMAND, vaga)],
-            CONFIRM: [MessageHandler(filters.TEXT & ~filters.COMMAND, confirm)],
-            EDIT_CHOICE: [MessageHandler(filters.TEXT & ~filters.COMMAND, edit_choice)],
-        },
-        fallbacks=[CommandHandler('cancel', cancel)],
-    )
-    
-    application.add_handler(conv_handler)
+    if WORKERS > 1:
+        from workers import WorkerPool
+        pool = WorkerPool(WORKERS, run_worker)
+        application = build_router(TOKEN, pool, webhook=bool(WEBHOOK_URL))
+        extra_stats = {'workers': pool.stats}
+    else:
+        application = build_application(TOKEN, webhook=bool(WEBHOOK_URL))
+        extra_stats = {'triage': application.bot_data['clinic'].triage.stats}
     
     logger.info("🤖 Бот запущено!")
     print("🤖 Бот запущено! Натисніть Ctrl+C для зупинки.")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if WEBHOOK_URL:
+        asyncio.run(serve_webhook(
+            application,
+            WEBHOOK_URL,
+            port=PORT,
+            webhook_path=WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            extra_stats=extra_stats,
+        ))
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+Метрики бота у текстовому форматі Prometheus (без сторонніх залежностей).
+
+Запис метрики на гарячому шляху - кілька операцій над готовим об'єктом
+(bisect і два додавання для гістограми), тому інструментація завжди увімкнена.
+"""
+
+import bisect
+import logging
+import time
+
+import httpx
+from telegram.ext import ConversationHandler
+from telegram.request import HTTPXRequest
+
+from http_server import HttpServer
+
+logger = logging.getLogger(__name__)
+
+# Межі кошиків гістограм затримок (секунди)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Gauge(Counter):
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # Останній елемент - кошик +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            yield f'{name}_bucket', labels + (('le', str(bound)),), cumulative
+        yield f'{name}_sum', labels, self.sum
+        yield f'{name}_count', labels, self.count
+
+
+class Family:
+    """Метрика з мітками: labels(...) повертає (і кешує) об'єкт для конкретних значень міток"""
+
+    def __init__(self, kind, name, documentation, labelnames, factory):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._factory = factory
+        self._children = {}
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._factory()
+        return child
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for values, child in list(self._children.items()):
+            for name, labels, value in child.samples(self.name, tuple(zip(self.labelnames, values))):
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+        return '\n'.join(lines)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+class Registry:
+    def __init__(self):
+        self._families = []
+        self._collectors = []
+
+    def _add(self, family):
+        self._families.append(family)
+        return family
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Family('counter', name, documentation, labelnames, Counter))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._add(Family('gauge', name, documentation, labelnames, Gauge))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        buckets = tuple(buckets)
+        return self._add(Family('histogram', name, documentation, labelnames, lambda: Histogram(buckets)))
+
+    def register_collector(self, collector):
+        """collector() викликається перед кожним збиранням метрик (оновлює gauge зі сторонньої статистики)"""
+        self._collectors.append(collector)
+
+    def render(self):
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.error(f"Помилка збирання метрик: {e}")
+        return '\n'.join(family.render() for family in self._families) + '\n'
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.histogram(
+    'bot_handler_seconds', 'Час обробки оновлення за станом розмови', ('state',))
+HANDLER_ERRORS = REGISTRY.counter(
+    'bot_handler_errors_total', 'Винятки в обробниках за станом розмови', ('state',))
+STATE_ENTERED = REGISTRY.counter(
+    'bot_survey_state_entered_total', 'Скільки разів пацієнти доходили до стану анкети', ('state',))
+SURVEYS_COMPLETED = REGISTRY.counter(
+    'bot_surveys_completed_total', 'Підтверджені анкети')
+SURVEYS_ABANDONED = REGISTRY.counter(
+    'bot_surveys_abandoned_total', 'Анкети, скасовані на цьому стані (відсів воронки)', ('state',))
+ACTIVE_CONVERSATIONS = REGISTRY.gauge(
+    'bot_active_conversations', 'Незавершені анкети за поточним станом', ('state',))
+API_SECONDS = REGISTRY.histogram(
+    'bot_telegram_api_seconds', 'Тривалість запитів до Bot API', ('method',))
+API_ERRORS = REGISTRY.counter(
+    'bot_telegram_api_errors_total', 'Помилки запитів до Bot API', ('method', 'error'))
+API_REQUESTS = REGISTRY.counter(
+    'bot_telegram_api_requests_total', 'HTTP запити до Bot API за пулом з\'єднань', ('pool',))
+API_CONNECTIONS = REGISTRY.counter(
+    'bot_telegram_api_connections_total', 'Нові з\'єднання з Bot API (решта запитів перевикористовує відкриті)',
+    ('pool',))
+API_CONNECTION_WAIT = REGISTRY.histogram(
+    'bot_telegram_api_connection_wait_seconds',
+    'Час від запиту до відправки заголовків: очікування вільного або нового з\'єднання', ('pool',))
+PERSISTENCE_SECONDS = REGISTRY.histogram(
+    'bot_persistence_write_seconds', 'Тривалість запису на диск', ('store',))
+OUTBOUND_QUEUE_SECONDS = REGISTRY.histogram(
+    'bot_outbound_queue_seconds', 'Час від постановки повідомлення в чергу до відправки', ('priority',))
+TRIAGE_SECONDS = REGISTRY.histogram(
+    'bot_triage_alert_seconds', 'Час від відповіді з червоним прапором до сповіщення лікарів')
+STATS = REGISTRY.gauge(
+    'bot_component_stat', 'Внутрішня статистика компонентів (черга збереження, розсилка, тріаж)',
+    ('component', 'stat'))
+
+
+def export_stats(component, stats):
+    """Експортує словник статистики компонента (числові значення) як bot_component_stat"""
+    def collect():
+        for key, value in stats.items():
+            if isinstance(value, (int, float)):
+                STATS.labels(component, key).set(value)
+    REGISTRY.register_collector(collect)
+
+
+class ConversationMetrics:
+    """Інструментує ConversationHandler: гістограма часу кожного обробника за станом,
+    воронка (досягнуті стани, відсів) і кількість активних анкет за станом"""
+
+    def __init__(self, state_names):
+        self.state_names = state_names
+        # Поточний стан кожного користувача з незавершеною анкетою
+        self._position = {}
+        self._completed = set()
+
+    def instrument(self, handler: ConversationHandler, entry_name='start', fallback_name='cancel'):
+        for entry in handler.entry_points:
+            entry.callback = self._wrap(entry.callback, None, entry_name)
+        for state, handlers in handler.states.items():
+            for state_handler in handlers:
+                state_handler.callback = self._wrap(state_handler.callback, state, self.state_names[state])
+        for fallback in handler.fallbacks:
+            fallback.callback = self._wrap(fallback.callback, None, fallback_name)
+
+    def mark_completed(self, update):
+        """Наступне завершення розмови користувача рахується як підтверджена анкета"""
+        self._completed.add(update.effective_user.id)
+
+    def forget(self, user_id):
+        """Анкету користувача завершено поза обробниками (протермінована сесія) - відсів"""
+        self._completed.discard(user_id)
+        previous = self._position.pop(user_id, None)
+        if previous is not None:
+            ACTIVE_CONVERSATIONS.labels(self.state_names[previous]).dec()
+            SURVEYS_ABANDONED.labels(self.state_names[previous]).inc()
+
+    def _wrap(self, callback, state, name):
+        histogram = HANDLER_SECONDS.labels(name)
+        errors = HANDLER_ERRORS.labels(name)
+        transition = self._transition
+
+        async def wrapper(update, context):
+            started = time.perf_counter()
+            try:
+                new_state = await callback(update, context)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started)
+            transition(update, state, new_state)
+            return new_state
+
+        wrapper.__name__ = getattr(callback, '__name__', name)
+        return wrapper
+
+    def _transition(self, update, state, new_state):
+        user = update.effective_user
+        if new_state is None or user is None:
+            return
+        previous = self._position.get(user.id, state)
+        if previous == new_state:
+            return
+        if previous is not None and user.id in self._position:
+            ACTIVE_CONVERSATIONS.labels(self.state_names[previous]).dec()
+        if new_state == ConversationHandler.END:
+            self._position.pop(user.id, None)
+            if user.id in self._completed:
+                self._completed.discard(user.id)
+                SURVEYS_COMPLETED.labels().inc()
+            elif previous is not None:
+                SURVEYS_ABANDONED.labels(self.state_names[previous]).inc()
+            return
+        name = self.state_names[new_state]
+        self._position[user.id] = new_state
+        STATE_ENTERED.labels(name).inc()
+        ACTIVE_CONVERSATIONS.labels(name).inc()
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest, що вимірює тривалість і помилки кожного виклику Bot API, а також
+    з'єднання свого пулу pool: нові з'єднання і час очікування з'єднання (трасування httpcore).
+    keepalive - скільки секунд тримати невикористане з'єднання відкритим (у httpx за замовчуванням 5)"""
+
+    def __init__(self, *args, pool='send', keepalive=5.0, **kwargs):
+        self.keepalive = keepalive
+        self._requests = API_REQUESTS.labels(pool)
+        self._connections = API_CONNECTIONS.labels(pool)
+        self._connection_wait = API_CONNECTION_WAIT.labels(pool)
+        super().__init__(*args, **kwargs)
+
+    def _build_client(self):
+        limits = self._client_kwargs['limits']
+        self._client_kwargs['limits'] = httpx.Limits(
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=self.keepalive,
+        )
+        self._client_kwargs['event_hooks'] = {'request': [self._trace_request]}
+        return super()._build_client()
+
+    async def _trace_request(self, request):
+        started = time.perf_counter()
+        connections = self._connections
+        connection_wait = self._connection_wait
+
+        async def trace(event, info):
+            if event == 'connection.connect_tcp.started':
+                connections.inc()
+            elif event.endswith('.send_request_headers.started'):
+                connection_wait.observe(time.perf_counter() - started)
+
+        self._requests.inc()
+        request.extensions['trace'] = trace
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+        except Exception as e:
+            API_ERRORS.labels(api_method, type(e).__name__).inc()
+            raise
+        finally:
+            API_SECONDS.labels(api_method).observe(time.perf_counter() - started)
+        if code >= 400:
+            API_ERRORS.labels(api_method, str(code)).inc()
+        return code, payload
+
+
+class MetricsServer:
+    """Локальний endpoint GET /metrics для Prometheus"""
+
+    def __init__(self, host='127.0.0.1', port=9464, registry=REGISTRY):
+        self.registry = registry
+        self.server = HttpServer(host, port)
+        self.server.route('GET', '/metrics', self._handle_metrics)
+
+    async def _handle_metrics(self, request):
+        return 200, 'text/plain; version=0.0.4; charset=utf-8', self.registry.render()
+
+    async def start(self):
+        await self.server.start()
+
+    async def close(self):
+        await self.server.close()
@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+Відправка повідомлень з урахуванням лімітів Telegram
+"""
+
+import asyncio
+import functools
+import heapq
+import itertools
+import logging
+import random
+import time
+from collections import deque
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from metrics import OUTBOUND_QUEUE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Ліміти Telegram (для кожного бота): ~30 повідомлень/с загалом і ~1 повідомлення/с в один чат
+GLOBAL_RATE = 30
+PER_CHAT_RATE = 1
+# Короткий сплеск у чат (кілька повідомлень поспіль) Telegram допускає
+PER_CHAT_BURST = 3
+
+# Пріоритети відправки: менше число - раніше
+URGENT = 0   # червоні прапори
+PATIENT = 1  # відповіді пацієнтам
+ROUTINE = 2  # копії анкет лікарям
+PRIORITY_NAMES = {URGENT: 'urgent', PATIENT: 'patient', ROUTINE: 'routine'}
+
+
+class TokenBucket:
+    """Відро токенів: rate токенів за секунду, не більше capacity одночасно.
+    Наступний токен отримує найтерміновіший з тих, хто чекає"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._waiters = []
+        self._order = itertools.count()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, priority=ROUTINE):
+        """Чекає, доки з'явиться токен, і забирає його"""
+        entry = (priority, next(self._order))
+        heapq.heappush(self._waiters, entry)
+        try:
+            while True:
+                self._refill()
+                first = self._waiters[0] == entry
+                if first and self._tokens >= 1:
+                    heapq.heappop(self._waiters)
+                    self._tokens -= 1
+                    return
+                # Не перший у черзі чекає щонайменше на один токен після першого
+                delay = max(1 - self._tokens, 0) / self.rate
+                await asyncio.sleep(delay if first else delay + 1 / self.rate)
+        except asyncio.CancelledError:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+
+
+class _Outgoing:
+    """Одне повідомлення в черзі: виклик метода бота з аргументами"""
+    __slots__ = ('priority', 'order', 'bot', 'chat_id', 'method', 'kwargs', 'future', 'attempts', 'queued_at',
+                 'on_retry')
+
+    def __init__(self, priority, order, bot, chat_id, method, kwargs, future, on_retry=None):
+        self.priority = priority
+        self.order = order
+        self.bot = bot
+        self.chat_id = chat_id
+        self.method = method
+        self.kwargs = kwargs
+        self.future = future
+        self.attempts = 0
+        self.queued_at = time.monotonic()
+        self.on_retry = on_retry
+
+
+class OutboundScheduler:
+    """Єдина черга всіх вихідних повідомлень процесу (одного або кількох ботів).
+
+    - у межах чату повідомлення йдуть строго по черзі (одне в дорозі на чат);
+    - між чатами першим обслуговується чат, чиє перше повідомлення найтерміновіше;
+    - загальний ліміт і ліміт на чат - відра токенів, окремі для кожного бота
+      (чат - пара бот і chat_id, як і ліміти Telegram);
+    - після RetryAfter чат чекає вказаний час і повідомлення відправляється знову;
+    - мережеві помилки повторюються з експоненційною затримкою.
+
+    Обробники ставлять повідомлення в чергу і одразу повертаються; submit повертає
+    future з результатом відправки для тих, кому він потрібен.
+    """
+
+    def __init__(self, concurrency=16, global_rate=GLOBAL_RATE, chat_rate=PER_CHAT_RATE,
+                 chat_burst=PER_CHAT_BURST, max_attempts=5, base_delay=0.5):
+        self.concurrency = concurrency
+        self.chat_rate = chat_rate
+        self.global_rate = global_rate
+        self.chat_burst = max(chat_burst, chat_rate)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        # Токен бота -> загальне відро; (токен бота, chat_id) -> відро і черга чату
+        self._global_buckets = {}
+        self._chat_buckets = {}
+        self._queues = {}
+        # Чати, чиє перше повідомлення зараз відправляється або чекає на повтор
+        self._busy = set()
+        self._ready = []
+        self._ready_count = None
+        self._idle = None
+        self._workers = []
+        self._order = itertools.count()
+        self.stats = {
+            'queued': 0, 'sent': 0, 'failed': 0, 'retries': 0, 'retry_after': 0, 'max_queued': 0,
+            **{f'queued_{name}': 0 for name in PRIORITY_NAMES.values()},
+        }
+
+    @property
+    def depth(self):
+        """Кількість повідомлень, що чекають на відправку"""
+        return self.stats['queued']
+
+    def _start(self):
+        self._ready_count = asyncio.Semaphore(0)
+        self._idle = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f'outbound-{i}') for i in range(self.concurrency)
+        ]
+
+    def submit(self, bot, chat_id, method='send_message', priority=PATIENT, on_retry=None, **kwargs):
+        """Ставить виклик bot.<method>(chat_id=chat_id, **kwargs) у чергу і повертає future з результатом.
+        on_retry() викликається перед кожною повторною спробою (RetryAfter або мережева помилка)"""
+        if not self._workers:
+            self._start()
+        future = asyncio.get_running_loop().create_future()
+        item = _Outgoing(priority, next(self._order), bot, chat_id, method, kwargs, future, on_retry)
+        route = (bot.token, chat_id)
+        queue = self._queues.get(route)
+        if queue is None:
+            queue = self._queues[route] = deque()
+        queue.append(item)
+        self._count(item, 1)
+        if len(queue) == 1 and route not in self._busy:
+            self._push_ready(route)
+        return future
+
+    async def reply(self, message, text, keyboard=None, priority=PATIENT, **kwargs):
+        """Відповідь у чат повідомлення без очікування відправки (готовий JSON клавіатури
+        передається як є). Повертає future з результатом"""
+        if keyboard is not None:
+            kwargs['api_kwargs'] = {'reply_markup': keyboard.json}
+        return self.submit(message.get_bot(), message.chat_id, 'send_message', priority, text=text, **kwargs)
+
+    async def edit(self, message, text=None, keyboard=None, priority=PATIENT, **kwargs):
+        """Редагує повідомлення бота на місці (text=None - лише inline-клавіатуру) через ту саму
+        чергу чату, тож редагування не обганяє попередні відповіді. Повертає future з результатом"""
+        if keyboard is not None:
+            kwargs['api_kwargs'] = {'reply_markup': keyboard.json}
+        if text is None:
+            return self.submit(message.get_bot(), message.chat_id, 'edit_message_reply_markup', priority,
+                               message_id=message.message_id, **kwargs)
+        return self.submit(message.get_bot(), message.chat_id, 'edit_message_text', priority,
+                           message_id=message.message_id, text=text, **kwargs)
+
+    async def close(self, timeout=30):
+        """Дочікується відправки всієї черги (не довше timeout) і зупиняє обробників"""
+        if not self._workers:
+            return
+        if self.stats['queued']:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"Не відправлено {self.stats['queued']} повідомлень до зупинки бота")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info(f"Черга вихідних повідомлень зупинена. Статистика: {self.stats}")
+
+    def _count(self, item, delta):
+        stats = self.stats
+        stats['queued'] += delta
+        stats[f'queued_{PRIORITY_NAMES[item.priority]}'] += delta
+        if delta > 0:
+            stats['max_queued'] = max(stats['max_queued'], stats['queued'])
+            self._idle.clear()
+        elif not stats['queued']:
+            self._idle.set()
+
+    def _push_ready(self, route):
+        head = self._queues[route][0]
+        heapq.heappush(self._ready, (head.priority, head.order, route))
+        self._ready_count.release()
+
+    def _chat_bucket(self, route):
+        bucket = self._chat_buckets.get(route)
+        if bucket is None:
+            if len(self._chat_buckets) > 10000:
+                self._prune_buckets()
+            bucket = self._chat_buckets[route] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _global_bucket(self, token):
+        bucket = self._global_buckets.get(token)
+        if bucket is None:
+            bucket = self._global_buckets[token] = TokenBucket(self.global_rate)
+        return bucket
+
+    def _prune_buckets(self):
+        """Забуває повні відра (чати, куди давно нічого не надсилали)"""
+        for route, bucket in list(self._chat_buckets.items()):
+            bucket._refill()
+            if bucket._tokens >= bucket.capacity and route not in self._queues:
+                del self._chat_buckets[route]
+
+    async def _worker(self):
+        while True:
+            await self._ready_count.acquire()
+            _, _, route = heapq.heappop(self._ready)
+            self._busy.add(route)
+            queue = self._queues[route]
+            item = queue[0]
+            try:
+                delay = await self._deliver(item, route)
+            except asyncio.CancelledError:
+                self._busy.discard(route)
+                raise
+            if item.future.done():
+                queue.popleft()
+                self._count(item, -1)
+            if delay:
+                asyncio.get_running_loop().call_later(delay, self._retry_chat, route)
+                continue
+            self._busy.discard(route)
+            if queue:
+                self._push_ready(route)
+            else:
+                del self._queues[route]
+
+    def _retry_chat(self, route):
+        self._busy.discard(route)
+        if self._queues.get(route):
+            self._push_ready(route)
+
+    async def _deliver(self, item, route):
+        """Одна спроба відправки. Повертає затримку перед наступною спробою або None"""
+        await self._chat_bucket(route).acquire(item.priority)
+        await self._global_bucket(route[0]).acquire(item.priority)
+        try:
+            result = await getattr(item.bot, item.method)(chat_id=item.chat_id, **item.kwargs)
+        except RetryAfter as e:
+            # Чекає лише цей чат (загальний темп вже обмежує відро), повтор не рахується спробою
+            self.stats['retry_after'] += 1
+            logger.warning(f"Telegram просить зачекати {e.retry_after} с (чат {item.chat_id})")
+            if item.on_retry:
+                item.on_retry()
+            return e.retry_after + random.uniform(0, 1)
+        except (BadRequest, Forbidden) as e:
+            # Помилки запиту не виправляться повтором
+            self._fail(item, e)
+        except NetworkError as e:
+            item.attempts += 1
+            if item.attempts < self.max_attempts:
+                self.stats['retries'] += 1
+                logger.warning(f"Мережева помилка відправки в чат {item.chat_id}: {e}")
+                if item.on_retry:
+                    item.on_retry()
+                return self.base_delay * 2 ** (item.attempts - 1) * random.uniform(0.5, 1.5)
+            self._fail(item, e)
+        except Exception as e:
+            self._fail(item, e)
+        else:
+            self.stats['sent'] += 1
+            OUTBOUND_QUEUE_SECONDS.labels(PRIORITY_NAMES[item.priority]).observe(time.monotonic() - item.queued_at)
+            item.future.set_result(result)
+        return None
+
+    def _fail(self, item, error):
+        self.stats['failed'] += 1
+        logger.error(f"Не вдалося відправити повідомлення в чат {item.chat_id}: {error}")
+        item.future.set_exception(error)
+        # Більшість відповідей ніхто не чекає - позначаємо виняток як оброблений
+        item.future.exception()
+
+
+class AdminFanout:
+    """Розсилка анкет усім адміністраторам через спільну чергу вихідних повідомлень"""
+
+    def __init__(self, admin_ids, scheduler):
+        self.admin_ids = list(admin_ids)
+        self.scheduler = scheduler
+        # Статистика доставки по кожному адміністратору
+        self.stats = {}
+
+    def _admin_stats(self, admin_id):
+        stats = self.stats.get(admin_id)
+        if stats is None:
+            stats = self.stats[admin_id] = {
+                'sent': 0, 'failed': 0, 'retries': 0, 'last_latency': None, 'total_latency': 0.0,
+            }
+        return stats
+
+    def _retried(self, admin_id):
+        self._admin_stats(admin_id)['retries'] += 1
+
+    def _delivered(self, admin_id, started, future):
+        """Статистика одного адміністратора в момент завершення саме його відправки"""
+        stats = self._admin_stats(admin_id)
+        if future.cancelled() or future.exception() is not None:
+            stats['failed'] += 1
+            return
+        latency = time.monotonic() - started
+        stats['sent'] += 1
+        stats['last_latency'] = latency
+        stats['total_latency'] += latency
+        logger.info(f"Анкету відправлено адміністратору {admin_id} за {latency:.2f} с")
+
+    async def send(self, bot, text, priority=ROUTINE):
+        """Відправляє повідомлення всім адміністраторам одночасно.
+        Повертає кількість адміністраторів, яким його доставлено"""
+        if not self.admin_ids:
+            logger.warning("ADMIN_IDS порожній! Анкету не відправлено жодному адміністратору.")
+            return 0
+        started = time.monotonic()
+        futures = []
+        for admin_id in self.admin_ids:
+            future = self.scheduler.submit(bot, admin_id, 'send_message', priority, text=text,
+                                           on_retry=functools.partial(self._retried, admin_id))
+            future.add_done_callback(functools.partial(self._delivered, admin_id, started))
+            futures.append(future)
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        return sum(not isinstance(result, BaseException) for result in results)
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+Декларативний опис анкети і скомпільований автомат станів для ConversationHandler
+"""
+
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from telegram.ext import CallbackQueryHandler, MessageHandler, filters
+
+from keyboards import inline_keyboard, pressed, reply, reply_keyboard
+from validation import InvalidAnswer, format_number, value_key
+
+DEFAULT_VALUE = 'Не вказано'
+BACK_LABEL = '◀️ Назад до перевірки'
+DONE_LABEL = '➡️ Готово'
+
+# Префікси callback_data inline-кнопок анкети: 'survey:<стан>:<варіант>' і меню редагування
+CALLBACK_PREFIX = 'survey'
+EDIT_PREFIX = 'survey_edit'
+
+
+@dataclass(frozen=True)
+class Branch:
+    """Перехід до уточнюючого питання, якщо відповідь збігається (equals)
+    або містить підрядок (contains, без урахування регістру)"""
+    target: int
+    equals: Optional[str] = None
+    contains: Optional[str] = None
+
+    def matches(self, text):
+        if self.equals is not None:
+            return text == self.equals
+        return self.contains in text.lower()
+
+
+@dataclass(frozen=True)
+class Question:
+    """Одне питання анкети.
+
+    state      - стан ConversationHandler, в якому очікується відповідь
+    key        - ключ у user_data для відповіді
+    prompt     - текст питання
+    next       - наступний стан (None - анкету заповнено)
+    keyboard   - варіанти відповідей (рядки клавіатури)
+    branches   - умовні переходи до уточнюючих питань
+    edit_label - кнопка в меню редагування
+    edit_prompt - текст питання при редагуванні ({} - поточна відповідь)
+    append     - дописати відповідь до існуючого значення за шаблоном
+    replace    - заміна відповідей (наприклад, 'Пропустити' -> 'Не вказано')
+    validator  - повертає текст помилки або None, якщо відповідь коректна
+    parse      - перетворює відповідь на число (InvalidAnswer - питання ставиться знову);
+                 число зберігається в user_data[key + '_value'], текст - нормалізований
+    stable     - відповідь рідко змінюється між візитами: повторний пацієнт може взяти її
+                 з попередньої анкети, і питання пропускається
+    multi      - в inline-режимі варіанти перемикаються (✅) і підтверджуються кнопкою
+                 'Готово'; відповідь - вибрані варіанти через кому, як при введенні вручну
+    exclusive  - варіанти, що скасовують усі інші (наприклад, 'Немає таких симптомів')
+    """
+    state: int
+    key: str
+    prompt: str
+    next: Optional[int] = None
+    keyboard: Optional[tuple] = None
+    branches: tuple = ()
+    edit_label: Optional[str] = None
+    edit_prompt: Optional[str] = None
+    append: Optional[str] = None
+    replace: dict = field(default_factory=dict)
+    validator: Optional[Callable[[str], Optional[str]]] = None
+    parse: Optional[Callable[[str], float]] = None
+    stable: bool = False
+    multi: bool = False
+    exclusive: tuple = ()
+
+
+class Questionnaire:
+    """Компілює список питань в автомат: стан -> питання, кнопка меню редагування -> питання.
+
+    on_complete(update, context) викликається, коли анкету заповнено або
+    редагування завершено, і повертає наступний стан розмови.
+    on_answer(question, update, context) викликається після збереження кожної відповіді.
+
+    inline=True - варіанти відповідей як inline-кнопки: натискання редагує те саме
+    повідомлення бота наступним питанням (edit), а нове повідомлення бот надсилає лише
+    після відповіді, набраної текстом. Текстом можна відповідати і в цьому режимі.
+    """
+
+    def __init__(self, questions, on_complete, on_answer=None, send=reply, edit=None, inline=False):
+        self.questions = tuple(questions)
+        self.on_complete = on_complete
+        self.on_answer = on_answer
+        # send(message, text, keyboard) - відправка відповіді пацієнту (за замовчуванням напряму);
+        # edit(message, text, keyboard) - редагування повідомлення бота (text=None - лише клавіатури)
+        self.send = send
+        self.edit = edit
+        self.inline = inline
+        self.first = self.questions[0]
+        self.by_state = {q.state: q for q in self.questions}
+        self.by_edit_label = {q.edit_label: q for q in self.questions if q.edit_label}
+        # Ключі user_data стабільних відповідей (разом з числовими значеннями)
+        self.stable = tuple(q for q in self.questions if q.stable)
+        self.stable_keys = tuple(dict.fromkeys(
+            key for q in self.stable for key in ((q.key, value_key(q.key)) if q.parse else (q.key,))
+        ))
+        self._check_transitions()
+        self.options = {q.state: [option for row in q.keyboard for option in row] for q in self.questions if q.keyboard}
+        self.keyboards = {q.state: self.keyboard(q) for q in self.questions if q.keyboard}
+        labels = [q.edit_label for q in self.questions if q.edit_label]
+        edit_rows = [labels[i:i + 2] for i in range(0, len(labels), 2)] + [[BACK_LABEL]]
+        self.edit_options = [option for row in edit_rows for option in row]
+        self.edit_menu = inline_keyboard(edit_rows, EDIT_PREFIX) if inline else reply_keyboard(edit_rows)
+        self._handlers = {q.state: self._make_handler(q) for q in self.questions}
+
+    def _check_transitions(self):
+        for q in self.questions:
+            targets = [b.target for b in q.branches] + ([q.next] if q.next is not None else [])
+            for target in targets:
+                if target not in self.by_state:
+                    raise ValueError(f"Питання '{q.key}' посилається на невідомий стан {target}")
+
+    def _make_handler(self, question):
+        async def handler(update, context):
+            return await self.answer(question, update, context)
+        handler.__name__ = question.key
+        return handler
+
+    def keyboard(self, question, selected=()):
+        """Клавіатура питання (в inline-режимі з позначеними вибраними варіантами)"""
+        if not self.inline:
+            return reply_keyboard(question.keyboard)
+        return inline_keyboard(question.keyboard, f"{CALLBACK_PREFIX}:{question.state}", selected,
+                               DONE_LABEL if question.multi else None)
+
+    def states(self, message_filter=filters.TEXT & ~filters.COMMAND):
+        """Стани для ConversationHandler: по одному обробнику на питання
+        (в inline-режимі той самий обробник приймає і натискання кнопок питання)"""
+        states = {}
+        for state, handler in self._handlers.items():
+            states[state] = [MessageHandler(message_filter, handler)]
+            if self.inline and state in self.keyboards:
+                states[state].append(CallbackQueryHandler(handler, pattern=f"^{CALLBACK_PREFIX}:{state}:"))
+        return states
+
+    def answer_handlers(self, callback, prefix, message_filter=filters.TEXT & ~filters.COMMAND):
+        """Обробники стану з меню (підтвердження, редагування): текст і в inline-режимі кнопки prefix"""
+        handlers = [MessageHandler(message_filter, callback)]
+        if self.inline:
+            handlers.append(CallbackQueryHandler(callback, pattern=f"^{prefix}:"))
+        return handlers
+
+    async def show(self, update, text, keyboard=None):
+        """Після натискання inline-кнопки редагує повідомлення з кнопкою, інакше надсилає нове"""
+        query = update.callback_query
+        if query is not None and self.edit is not None:
+            await self.edit(query.message, text, keyboard)
+        else:
+            await self.send(update.effective_message, text, keyboard)
+
+    async def ask(self, update, state):
+        """Ставить питання і повертає його стан"""
+        await self.show(update, self.by_state[state].prompt, self.keyboards.get(state))
+        return state
+
+    def prefill(self, user_data, record):
+        """Переносить стабільні відповіді з попередньої анкети; повертає, чи перенесено хоч одну"""
+        found = False
+        for key in self.stable_keys:
+            value = record.get(key)
+            if value is not None:
+                user_data[key] = value
+                found = True
+        if found:
+            user_data['prefilled'] = True
+        return found
+
+    def clear_prefill(self, user_data):
+        """Пацієнт відмовився від попередніх відповідей: анкета заповнюється з початку"""
+        for key in self.stable_keys + ('prefilled',):
+            user_data.pop(key, None)
+
+    def prefill_summary(self, user_data):
+        """Перенесені відповіді рядками 'кнопка меню редагування: відповідь'"""
+        return '\n'.join(
+            f"{q.edit_label}: {user_data[q.key]}" for q in self.stable if q.edit_label and q.key in user_data
+        )
+
+    def _skip(self, state, user_data):
+        """Перший стан, починаючи з state, відповідь на який ще не перенесена з попередньої анкети"""
+        if not user_data.get('prefilled'):
+            return state
+        while state is not None:
+            question = self.by_state[state]
+            if not (question.stable and question.key in user_data):
+                break
+            state = question.next
+        return state
+
+    async def proceed(self, update, context, state):
+        """Ставить питання state (або перше не перенесене після нього);
+        якщо відповіді на решту питань уже є - завершує анкету"""
+        state = self._skip(state, context.user_data)
+        if state is None:
+            return await self.on_complete(update, context)
+        return await self.ask(update, state)
+
+    async def _toggle(self, question, update, user_data):
+        """Натискання кнопки питання з кількома варіантами: перемикає варіант або
+        завершує вибір. Повертає відповідь (варіанти через кому) або None, якщо вибір триває"""
+        options = self.options[question.state]
+        selection = user_data.get('selection')
+        selected = list(selection[1]) if selection and selection[0] == question.state else []
+        choice = update.callback_query.data.rpartition(':')[2]
+        if choice == 'done':
+            if not selected:
+                return None
+            del user_data['selection']
+            return ', '.join(options[number] for number in sorted(selected))
+        if not choice.isdigit() or int(choice) >= len(options):
+            return None
+        number = int(choice)
+        if number in selected:
+            selected.remove(number)
+        elif options[number] in question.exclusive:
+            selected = [number]
+        else:
+            selected = [n for n in selected if options[n] not in question.exclusive] + [number]
+        user_data['selection'] = [question.state, selected]
+        # Змінюється лише позначка на кнопці: текст повідомлення лишається
+        await self.show(update, None, self.keyboard(question, selected))
+        return None
+
+    async def answer(self, question, update, context):
+        """Зберігає відповідь і переходить до наступного питання"""
+        user_data = context.user_data
+        if update.callback_query is None:
+            text = update.message.text
+            user_data.pop('selection', None)
+        elif question.multi:
+            text = await self._toggle(question, update, user_data)
+        else:
+            text = pressed(update, self.options[question.state])
+        if text is None:
+            return question.state
+
+        if question.validator:
+            error = question.validator(text)
+            if error:
+                await self.show(update, error, self.keyboards.get(question.state))
+                return question.state
+
+        if question.parse:
+            try:
+                number = question.parse(text)
+            except InvalidAnswer as e:
+                await self.show(update, str(e), self.keyboards.get(question.state))
+                return question.state
+            user_data[value_key(question.key)] = number
+            text = format_number(number)
+
+        value = question.replace.get(text, text)
+        if question.append:
+            user_data[question.key] += question.append.format(value)
+        else:
+            user_data[question.key] = value
+
+        if self.on_answer:
+            await self.on_answer(question, update, context)
+
+        # Уточнююче питання ставимо навіть у режимі редагування
+        for branch in question.branches:
+            if branch.matches(text):
+                return await self.ask(update, branch.target)
+
+        # Якщо в режимі редагування, повертаємося до підтвердження. Прапорець
+        # скидаємо після відправки: якщо вона не вдалась, повторна відповідь теж поверне до підтвердження
+        next_state = self._skip(question.next, user_data)
+        if user_data.get('editing') or next_state is None:
+            state = await self.on_complete(update, context)
+            user_data['editing'] = False
+            return state
+
+        return await self.ask(update, next_state)
+
+    async def show_edit_menu(self, update, context):
+        """Показує меню вибору поля для редагування"""
+        context.user_data['editing'] = True
+        await self.show(update, "✏️ Оберіть, що ви хочете змінити:", self.edit_menu)
+
+    async def edit_choice(self, update, context):
+        """Вибір поля для редагування"""
+        choice = pressed(update, self.edit_options)
+
+        if choice == BACK_LABEL:
+            # Вимикаємо режим редагування і повертаємось до підтвердження
+            context.user_data['editing'] = False
+            return await self.on_complete(update, context)
+
+        question = self.by_edit_label.get(choice)
+        if question is None:
+            return None
+
+        current = context.user_data.get(question.key, DEFAULT_VALUE)
+        keyboard = self.keyboards.get(question.state)
+        if self.inline and question.multi:
+            # Поточні варіанти одразу позначені: пацієнт знімає або додає лише потрібні
+            answers = current.split(', ')
+            selected = [number for number, option in enumerate(self.options[question.state]) if option in answers]
+            context.user_data['selection'] = [question.state, selected]
+            keyboard = self.keyboard(question, selected)
+        await self.show(update, question.edit_prompt.format(current), keyboard)
+        return question.state
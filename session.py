@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Компактна сесія пацієнта (context.user_data): поля анкети лежать у слотах,
+а відповіді-варіанти з клавіатур зберігаються як малі коди спільного довідника
+"""
+
+import sys
+from collections.abc import MutableMapping
+
+from survey_render import SURVEY_FIELDS
+from survey_store import SERVICE_KEYS
+from validation import VALUE_FIELDS
+
+# Відомі поля сесії; решта ключів (наприклад, admin_query лікаря) - у словнику _extra
+FIELDS = ('user_id', 'username') + SURVEY_FIELDS + VALUE_FIELDS + SERVICE_KEYS
+
+# Поля, значення яких повторюються між сесіями (дата заповнення) і інтернуються
+INTERNED = frozenset({'date'})
+
+# Значення незаповненого слота
+_MISSING = object()
+
+# Довідники варіантів: поле -> список варіантів і варіант -> код
+_OPTIONS = {}
+_CODES = {}
+
+
+def register_choices(key, options):
+    """Реєструє варіанти відповіді поля; коди стабільні в межах процесу
+    (на диск сесія зберігається з текстом варіантів, а не кодами)"""
+    known = _OPTIONS.setdefault(key, [])
+    codes = _CODES.setdefault(key, {})
+    for option in options:
+        if option not in codes:
+            codes[option] = len(known)
+            known.append(sys.intern(option))
+
+
+class Session(MutableMapping):
+    """Словникове представлення відповідей пацієнта поверх слотів.
+
+    Відповідь, що збігається з варіантом клавіатури, зберігається як код
+    і розкодовується при читанні, тож кожна сесія не тримає власних копій
+    довгих кириличних рядків варіантів. Використовується як ContextTypes(user_data=Session).
+    """
+    __slots__ = FIELDS + ('_extra',)
+
+    def __init__(self, data=None):
+        for slot in _SLOT_LIST:
+            slot.__set__(self, _MISSING)
+        self._extra = None
+        if data:
+            self.update(data)
+
+    def get(self, key, default=None):
+        slot = _SLOTS.get(key)
+        if slot is None:
+            return default if self._extra is None else self._extra.get(key, default)
+        value = slot.__get__(self)
+        if value is _MISSING:
+            return default
+        if value.__class__ is int:
+            options = _OPTIONS.get(key)
+            if options is not None:
+                return options[value]
+        return value
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        slot = _SLOTS.get(key)
+        if slot is None:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+            return
+        if value.__class__ is str:
+            codes = _CODES.get(key)
+            if codes is not None:
+                code = codes.get(value)
+                if code is not None:
+                    value = code
+            elif key in INTERNED:
+                value = sys.intern(value)
+        slot.__set__(self, value)
+
+    def __delitem__(self, key):
+        slot = _SLOTS.get(key)
+        if slot is None:
+            if self._extra is None:
+                raise KeyError(key)
+            del self._extra[key]
+        elif slot.__get__(self) is _MISSING:
+            raise KeyError(key)
+        else:
+            slot.__set__(self, _MISSING)
+
+    def __contains__(self, key):
+        slot = _SLOTS.get(key)
+        if slot is None:
+            return self._extra is not None and key in self._extra
+        return slot.__get__(self) is not _MISSING
+
+    def __iter__(self):
+        for key, slot in _SLOTS.items():
+            if slot.__get__(self) is not _MISSING:
+                yield key
+        if self._extra:
+            yield from list(self._extra)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def clear(self):
+        for slot in _SLOT_LIST:
+            slot.__set__(self, _MISSING)
+        self._extra = None
+
+    def to_dict(self):
+        """Звичайний словник з текстом відповідей (для збереження на диск)"""
+        return {key: self[key] for key in self}
+
+    def __reduce__(self):
+        # copy.deepcopy (PTB копіює user_data перед збереженням) і pickle
+        return type(self), (self.to_dict(),)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+
+# Дескриптори слотів: прямий доступ без getattr за іменем
+_SLOTS = {key: Session.__dict__[key] for key in FIELDS}
+_SLOT_LIST = tuple(_SLOTS.values())
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Обмеження сесій у пам'яті: неактивні сесії вивантажуються за TTL (окремим для кожного
+стану анкети), кількість сесій у пам'яті обмежена (LRU), а вивантажені незавершені
+анкети лишаються в SQLitePersistence і відновлюються, коли пацієнт повертається
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from telegram import Update
+from telegram.ext import Application, ConversationHandler, TypeHandler
+from telegram.ext._conversationhandler import PendingState
+from telegram.ext._utils.trackingdict import TrackingDict
+
+logger = logging.getLogger(__name__)
+
+# Внутрішні атрибути python-telegram-bot, з якими працює SessionCache (перевірено з 20.7,
+# версія закріплена в requirements.txt). Якщо їх немає, імпорт падає одразу, а не
+# вивантаження сесій ламається мовчки під час роботи бота
+_PTB_INTERNALS = (
+    ('Application', Application, ('_user_data', '_user_ids_to_be_updated_in_persistence')),
+    ('ConversationHandler', ConversationHandler, ('_conversations', '_get_key')),
+    ('TrackingDict', TrackingDict(), ('data', '_write_access_keys', 'update_no_track')),
+)
+_missing = [f"{label}.{name}" for label, owner, names in _PTB_INTERNALS for name in names if not hasattr(owner, name)]
+if _missing:
+    raise ImportError(f"SessionCache не підтримує цю версію python-telegram-bot (немає {', '.join(_missing)}); "
+                      f"потрібна версія з requirements.txt")
+
+
+class SessionCache:
+    """Облік активності сесій (user_data і стан ConversationHandler).
+
+    Кожен TTL - окрема черга користувачів у порядку останньої активності, тому прохід
+    зупиняється на першій неактуальній сесії і коштує O(кількості протермінованих).
+    Загальний порядок активності - LRU для ліміту max_sessions.
+
+    Сесія з незавершеною анкетою при вивантаженні зберігається на диск (spill=True
+    і є persistence), інакше анкета завершується. Сесія без анкети просто забувається.
+    """
+
+    def __init__(self, ttl=86400, state_ttl=None, max_sessions=10000, spill=True, sweep_interval=60,
+                 on_drop=None):
+        self.ttl = ttl
+        # стан розмови -> TTL (секунди, 0 - без обмеження)
+        self.state_ttl = state_ttl or {}
+        self.max_sessions = max_sessions
+        self.spill = spill
+        self.sweep_interval = sweep_interval
+        # on_drop(user_id) - сесію з незавершеною анкетою видалено (для метрик воронки)
+        self.on_drop = on_drop
+        self.application = None
+        self.conversation = None
+        # user_id -> (ключ розмови, TTL) у порядку останньої активності
+        self._lru = OrderedDict()
+        # TTL -> {user_id: час останньої активності} у порядку активності
+        self._by_ttl = {}
+        self._task = None
+        # Користувачі, чиє оновлення зараз обробляється: їх сесії не вивантажуються
+        self._handling = set()
+        self.stats = {'resident': 0, 'expired': 0, 'evicted': 0, 'spilled': 0, 'restored': 0, 'dropped': 0}
+
+    def attach(self, application, conversation):
+        """Додає обробники до і після ConversationHandler (групи -1 і 1)"""
+        self.application = application
+        self.conversation = conversation
+        application.add_handler(TypeHandler(Update, self._before), group=-1)
+        application.add_handler(TypeHandler(Update, self._after), group=1)
+
+    @property
+    def can_spill(self):
+        return self.spill and hasattr(self.application.persistence, 'load_session')
+
+    async def start(self):
+        """Реєструє сесії, завантажені з persistence при старті, і запускає періодичний прохід"""
+        for key, state in list(self.conversation._conversations.items()):
+            self._touch(key[-1], key, state)
+        for user_id in list(self.application.user_data):
+            if user_id not in self._lru:
+                self._touch(user_id, None, None)
+        await self._evict_over_limit()
+        self._task = asyncio.create_task(self._sweep_loop())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _key(self, update):
+        if update.effective_user is None:
+            return None, None
+        try:
+            return update.effective_user.id, self.conversation._get_key(update)
+        except RuntimeError:
+            return update.effective_user.id, None
+
+    def _state(self, key):
+        """Поточний стан розмови (для неблокуючих обробників - попередній)"""
+        state = self.conversation._conversations.get(key) if key is not None else None
+        return state.old_state if isinstance(state, PendingState) else state
+
+    def _ttl_for(self, state):
+        return self.state_ttl.get(state, self.ttl)
+
+    def _touch(self, user_id, key, state):
+        ttl = self._ttl_for(state)
+        entry = self._lru.pop(user_id, None)
+        if entry is not None:
+            key = key or entry[0]
+            self._by_ttl[entry[1]].pop(user_id, None)
+        self._lru[user_id] = (key, ttl)
+        self._by_ttl.setdefault(ttl, OrderedDict())[user_id] = time.monotonic()
+        self.stats['resident'] = len(self._lru)
+
+    def _forget(self, user_id):
+        key, ttl = self._lru.pop(user_id)
+        self._by_ttl[ttl].pop(user_id, None)
+        self.stats['resident'] = len(self._lru)
+        return key
+
+    async def _before(self, update, context):
+        """Відновлює вивантажену сесію до того, як оновлення дійде до ConversationHandler"""
+        user_id, key = self._key(update)
+        if user_id is None:
+            return
+        self._handling.add(user_id)
+        if user_id not in self._lru and self.can_spill:
+            await self._restore(user_id, key)
+        self._touch(user_id, key, self._state(key))
+
+    async def _after(self, update, context):
+        """Оновлює TTL за новим станом розмови і тримає ліміт сесій у пам'яті"""
+        user_id, key = self._key(update)
+        if user_id is None:
+            return
+        self._touch(user_id, key, self._state(key))
+        await self._evict_over_limit()
+        # Лише тепер: PTB позначає user_data для persistence після останньої групи, і якби
+        # сесію вивантажили раніше, періодичне збереження записало б порожні user_data
+        self._handling.discard(user_id)
+
+    async def _restore(self, user_id, key):
+        """Повертає в пам'ять вивантажені user_data і стан розмови"""
+        data, states = await self.application.persistence.load_session(user_id, self.conversation.name)
+        if data is None and not states:
+            return
+        if data is not None:
+            self.application._user_data[user_id] = self.application.persistence.user_data_type(data)
+        if states:
+            self.conversation._conversations.update_no_track(states)
+        self.stats['restored'] += 1
+        logger.info(f"Відновлено сесію користувача {user_id}")
+
+    async def _evict_over_limit(self):
+        while len(self._lru) > self.max_sessions:
+            # Сесію, чий обробник ще працює (стан розмови ще не записано), вивантажувати
+            # не можна: обробник продовжив би писати в нові порожні user_data
+            user_id = next((user_id for user_id in self._lru if user_id not in self._handling), None)
+            if user_id is None:
+                break
+            key = self._forget(user_id)
+            self.stats['evicted'] += 1
+            await self._evict(user_id, key)
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Помилка вивантаження неактивних сесій: {e}")
+
+    def _pop_expired(self, now):
+        expired = []
+        for ttl, seen in self._by_ttl.items():
+            if ttl <= 0:
+                continue
+            # Черга впорядкована за активністю: далі лише свіжіші сесії
+            while seen:
+                user_id, last_seen = next(iter(seen.items()))
+                if last_seen + ttl > now:
+                    break
+                if user_id in self._handling:
+                    # Обробник ще працює з сесією (повільний запит): вона знову активна
+                    seen.move_to_end(user_id)
+                    seen[user_id] = now
+                    continue
+                seen.popitem(last=False)
+                expired.append((user_id, self._lru.pop(user_id)[0]))
+        self.stats['resident'] = len(self._lru)
+        return expired
+
+    async def sweep(self):
+        """Вивантажує сесії, неактивні довше за свій TTL; повертає їх кількість"""
+        expired = self._pop_expired(time.monotonic())
+        for user_id, key in expired:
+            self.stats['expired'] += 1
+            await self._evict(user_id, key)
+        if expired:
+            logger.info(f"Вивантажено {len(expired)} неактивних сесій, у пам'яті {len(self._lru)}")
+        return len(expired)
+
+    async def _evict(self, user_id, key):
+        application = self.application
+        conversations = self.conversation._conversations
+        state = self._state(key)
+        if state is None:
+            # Анкети немає: user_data більше не потрібні
+            application.drop_user_data(user_id)
+            self.stats['dropped'] += 1
+            return
+        if not self.can_spill:
+            application.drop_user_data(user_id)
+            del conversations[key]
+            self.stats['dropped'] += 1
+            if self.on_drop:
+                self.on_drop(user_id)
+            return
+        # Прибираємо з пам'яті без позначок PTB для persistence (інакше наступне
+        # update_persistence видалило б вивантажену сесію), і записуємо поточні дані самі
+        data = application._user_data.pop(user_id, None)
+        application._user_ids_to_be_updated_in_persistence.discard(user_id)
+        conversations.data.pop(key, None)
+        conversations._write_access_keys.discard(key)
+        persistence = application.persistence
+        if data is not None:
+            await persistence.update_user_data(user_id, data)
+        await persistence.update_conversation(self.conversation.name, key, state)
+        self.stats['spilled'] += 1
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+Збереження стану розмов і user_data у SQLite (WAL), щоб пацієнти не втрачали
+відповіді після перезапуску бота
+"""
+
+import asyncio
+import copy
+import json
+import logging
+import sqlite3
+import time
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from metrics import PERSISTENCE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (
+    tenant TEXT NOT NULL DEFAULT '',
+    user_id INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (tenant, user_id)
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    tenant TEXT NOT NULL DEFAULT '',
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    user_id INTEGER,
+    state INTEGER NOT NULL,
+    PRIMARY KEY (tenant, name, key)
+);
+CREATE INDEX IF NOT EXISTS conversations_user_id ON conversations (tenant, user_id);
+"""
+SCHEMA_VERSION = 1
+
+
+class _StateDB:
+    """Файл стану, спільний для всіх ботів процесу: одне з'єднання і один набір
+    незаписаних змін (ключі з назвою бота), тож зміни всіх ботів за цикл
+    оновлення фіксуються однією транзакцією"""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self.dirty_users = {}
+        self.dropped_users = set()
+        self.dirty_conversations = {}
+        self._commit_task = None
+        self._commit_lock = asyncio.Lock()
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            # timeout - очікування блокування, коли пише інший процес-обробник
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript(SCHEMA)
+            self._migrate(self._conn)
+        return self._conn
+
+    @staticmethod
+    def _migrate(conn):
+        if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+            return
+        with conn:
+            # IMMEDIATE: процеси-обробники стартують одночасно, мігрує лише перший
+            conn.execute('BEGIN IMMEDIATE')
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+                return
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(user_data)')]
+            if 'tenant' not in columns:
+                # Таблиці без назви бота (до TENANTS): стан переноситься в бот '' (TELEGRAM_BOT_TOKEN)
+                conn.execute('ALTER TABLE user_data RENAME TO user_data_old')
+                conn.execute('ALTER TABLE conversations RENAME TO conversations_old')
+                conn.execute('DROP INDEX IF EXISTS conversations_user_id')
+                for statement in SCHEMA.split(';'):
+                    if statement.strip():
+                        conn.execute(statement)
+                conn.execute('INSERT INTO user_data (user_id, data) SELECT user_id, data FROM user_data_old')
+                conn.execute(
+                    'INSERT INTO conversations (name, key, user_id, state) '
+                    'SELECT name, key, user_id, state FROM conversations_old'
+                )
+                conn.execute('DROP TABLE user_data_old')
+                conn.execute('DROP TABLE conversations_old')
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    async def flush(self):
+        """Фіксує всі незаписані зміни"""
+        if self._commit_task:
+            await self._commit_task
+        await self._commit()
+
+    def schedule_commit(self):
+        # Усі update_* одного циклу Application.update_persistence запускаються разом,
+        # тому одна задача встигає зібрати їх в одну транзакцію
+        if self._commit_task is None or self._commit_task.done():
+            self._commit_task = asyncio.create_task(self._commit())
+
+    async def _commit(self):
+        async with self._commit_lock:
+            if not (self.dirty_users or self.dropped_users or self.dirty_conversations):
+                return
+            users, self.dirty_users = self.dirty_users, {}
+            dropped, self.dropped_users = self.dropped_users, set()
+            conversations, self.dirty_conversations = self.dirty_conversations, {}
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._write, users, dropped, conversations)
+            except Exception as e:
+                logger.error(f"Помилка збереження стану розмов: {e}")
+                # Повертаємо зміни, щоб записати їх наступного разу
+                for key, data in users.items():
+                    self.dirty_users.setdefault(key, data)
+                self.dropped_users |= dropped - self.dirty_users.keys()
+                for key, value in conversations.items():
+                    self.dirty_conversations.setdefault(key, value)
+            else:
+                PERSISTENCE_SECONDS.labels('state').observe(time.perf_counter() - started)
+
+    def _write(self, users, dropped, conversations):
+        conn = self.conn
+        with conn:
+            conn.execute('BEGIN')
+            conn.executemany(
+                'INSERT OR REPLACE INTO user_data (tenant, user_id, data) VALUES (?, ?, ?)',
+                [(*key, json.dumps(dict(data), ensure_ascii=False)) for key, data in users.items()],
+            )
+            conn.executemany('DELETE FROM user_data WHERE tenant = ? AND user_id = ?', list(dropped))
+            conn.executemany(
+                'DELETE FROM conversations WHERE tenant = ? AND name = ? AND key = ?',
+                [key for key, (_, state) in conversations.items() if state is None],
+            )
+            conn.executemany(
+                'INSERT OR REPLACE INTO conversations (tenant, name, key, user_id, state) VALUES (?, ?, ?, ?, ?)',
+                [(*key, user_id, state) for key, (user_id, state) in conversations.items() if state is not None],
+            )
+
+
+class SQLitePersistence(BasePersistence):
+    """Персистентність для Application: зберігає лише user_data та стани розмов.
+
+    Записуються тільки змінені користувачі (PTB передає їх у update_user_data),
+    усі зміни одного циклу оновлення фіксуються однією транзакцією у фоновому потоці.
+    При старті завантажуються лише користувачі з незавершеними анкетами.
+    user_data_type - тип user_data з ContextTypes (створюється зі словника).
+    shard=(index, count) - завантажувати лише користувачів з user_id % count == index
+    (кілька процесів-обробників з одним файлом бази).
+    preload=False - нічого не завантажувати при старті: сесії читаються по одній
+    через load_session (SessionCache), тож час запуску не залежить від їх кількості.
+    tenant - назва бота, якому належить стан (кілька ботів в одному процесі, for_tenant).
+    """
+
+    def __init__(self, path='bot_state.db', update_interval=5, user_data_type=dict, shard=(0, 1), preload=True,
+                 tenant=''):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.path = path
+        self.user_data_type = user_data_type
+        self.shard = shard
+        self.preload = preload
+        self.tenant = tenant
+        self._db = _StateDB(path)
+
+    def for_tenant(self, tenant):
+        """Персистентність іншого бота в тому самому файлі: спільні з'єднання і транзакції запису"""
+        persistence = copy.copy(self)
+        persistence.tenant = tenant
+        return persistence
+
+    @property
+    def conn(self):
+        return self._db.conn
+
+    async def get_user_data(self):
+        if not self.preload:
+            return {}
+        return await asyncio.to_thread(self._load_user_data)
+
+    def _load_user_data(self):
+        index, count = self.shard
+        rows = self.conn.execute(
+            'SELECT user_id, data FROM user_data WHERE tenant = ? '
+            'AND user_id IN (SELECT user_id FROM conversations WHERE tenant = ?) AND user_id % ? = ?',
+            (self.tenant, self.tenant, count, index),
+        ).fetchall()
+        logger.info(f"Відновлено дані {len(rows)} незавершених анкет")
+        return {user_id: self.user_data_type(json.loads(data)) for user_id, data in rows}
+
+    async def load_session(self, user_id, name):
+        """user_data і стани розмови name одного користувача (для сесій, вивантажених з пам'яті)"""
+        await self.flush()
+        return await asyncio.to_thread(self._load_session, user_id, name)
+
+    def _load_session(self, user_id, name):
+        row = self.conn.execute(
+            'SELECT data FROM user_data WHERE tenant = ? AND user_id = ?', (self.tenant, user_id)
+        ).fetchone()
+        rows = self.conn.execute(
+            'SELECT key, state FROM conversations WHERE tenant = ? AND name = ? AND user_id = ?',
+            (self.tenant, name, user_id),
+        ).fetchall()
+        return (json.loads(row[0]) if row else None), {tuple(json.loads(key)): state for key, state in rows}
+
+    async def get_conversations(self, name):
+        if not self.preload:
+            return {}
+        rows = await asyncio.to_thread(
+            lambda: self.conn.execute(
+                'SELECT key, state FROM conversations WHERE tenant = ? AND name = ? AND user_id % ? = ?',
+                (self.tenant, name, self.shard[1], self.shard[0]),
+            ).fetchall()
+        )
+        return {tuple(json.loads(key)): state for key, state in rows}
+
+    async def update_conversation(self, name, key, new_state):
+        self._db.dirty_conversations[(self.tenant, name, json.dumps(list(key)))] = (
+            key[-1] if key else None, new_state)
+        self._db.schedule_commit()
+
+    async def update_user_data(self, user_id, data):
+        self._db.dropped_users.discard((self.tenant, user_id))
+        self._db.dirty_users[(self.tenant, user_id)] = data
+        self._db.schedule_commit()
+
+    async def drop_user_data(self, user_id):
+        self._db.dirty_users.pop((self.tenant, user_id), None)
+        self._db.dropped_users.add((self.tenant, user_id))
+        self._db.schedule_commit()
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def get_chat_data(self):
+        return {}
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def get_bot_data(self):
+        return {}
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def flush(self):
+        """Фіксує всі незаписані зміни (усіх ботів, що ділять файл)"""
+        await self._db.flush()
@@ -0,0 +1,511 @@
+# -*- coding: utf-8 -*-
+"""
+Зашифрований архів анкет (SURVEY_STORAGE=archive) замість текстових файлів з відкритими
+медичними даними. Архів - каталог сегментів; кожен пакет анкет з черги збереження стає
+одним фрагментом, зашифрованим AES-256-GCM і дописаним у кінець сегмента, тож дописування
+не переписує архів, а читання розшифровує фрагмент за фрагментом.
+
+Ключі лежать у локальному файлі (SURVEY_ARCHIVE_KEY, права 0600), кожен фрагмент містить
+номер свого ключа. Потребує пакета cryptography (pip install cryptography).
+
+    python survey_archive.py keygen                 # новий активний ключ
+    python survey_archive.py rotate --limit 10      # перешифрувати 10 сегментів новим ключем
+    python survey_archive.py prune-keys             # видалити ключі, якими нічого не зашифровано
+    python survey_archive.py export --out surveys.csv
+    python survey_archive.py import surveys/ --remove-plaintext
+    python survey_archive.py import-failed surveys/failed_surveys.jsonl
+"""
+
+import argparse
+import base64
+import itertools
+import json
+import logging
+import os
+import struct
+import sys
+from collections import Counter
+from datetime import datetime
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:  # необов'язкова залежність: потрібна лише для SURVEY_STORAGE=archive
+    AESGCM = InvalidTag = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: без блокування сегментів
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Заголовок сегмента: MAGIC і випадковий id сегмента. Заголовок фрагмента: номер ключа,
+# довжина шифротексту (з тегом GCM), nonce. Автентифікуються також id сегмента і номер
+# фрагмента в ньому, тож переставлений, пропущений чи перенесений з іншого сегмента
+# фрагмент не розшифровується
+MAGIC = b'SVA1'
+SEGMENT = struct.Struct('>4s16s')
+CHUNK = struct.Struct('>II12s')
+INDEX = struct.Struct('>Q')
+NONCE_SIZE = 12
+SUFFIX = '.sva'
+
+# Після такого розміру сегмент закривається і наступний пакет починає новий
+SEGMENT_SIZE = 16 * 1024 * 1024
+
+
+def _fsync_dir(directory):
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def _try_lock(fd):
+    """Ексклюзивне блокування сегмента; False - сегмент зараз дописує інший процес"""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+class KeyRing:
+    """Ключі архіву з локального файлу: {"active": номер, "keys": {номер: base64}}.
+    Новий фрагмент шифрується активним ключем, старі ключі потрібні для читання"""
+
+    def __init__(self, path):
+        if AESGCM is None:
+            raise RuntimeError("Зашифрований архів анкет потребує пакета cryptography (pip install cryptography)")
+        self.path = path
+        self.keys = {}
+        self.active = None
+        self._mtime = None
+        self._ciphers = {}
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        with open(self.path, encoding='utf-8') as f:
+            self._mtime = os.fstat(f.fileno()).st_mtime_ns
+            data = json.load(f)
+        self.keys = {int(key_id): base64.b64decode(key) for key_id, key in data['keys'].items()}
+        self.active = int(data['active'])
+        if self.active not in self.keys or any(len(key) != 32 for key in self.keys.values()):
+            raise ValueError(f"{self.path}: некоректний файл ключів")
+        self._ciphers = {}
+        return self
+
+    def changed(self):
+        """Файл ключів змінено іншим процесом (keygen) після load"""
+        try:
+            return os.stat(self.path).st_mtime_ns != self._mtime
+        except FileNotFoundError:
+            return False
+
+    def save(self, exclusive=False):
+        """Атомарний запис з правами 0600; exclusive - лише якщо файлу ще немає
+        (FileExistsError, якщо його вже створив інший процес)"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({
+                'active': self.active,
+                'keys': {str(key_id): base64.b64encode(key).decode() for key_id, key in sorted(self.keys.items())},
+            }, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        if exclusive:
+            try:
+                os.link(tmp, self.path)
+            finally:
+                os.unlink(tmp)
+        else:
+            os.replace(tmp, self.path)
+        _fsync_dir(directory)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def create(self):
+        """Перший ключ нового архіву; якщо інший процес встиг створити файл - читає його.
+        Повертає True, якщо ключ створено тут"""
+        self.keys = {1: AESGCM.generate_key(bit_length=256)}
+        self.active = 1
+        try:
+            self.save(exclusive=True)
+        except FileExistsError:
+            self.load()
+            return False
+        return True
+
+    def add(self):
+        """Новий випадковий ключ стає активним; повертає його номер"""
+        key_id = max(self.keys, default=0) + 1
+        self.keys[key_id] = AESGCM.generate_key(bit_length=256)
+        self.active = key_id
+        self.save()
+        return key_id
+
+    def remove(self, key_ids):
+        for key_id in key_ids:
+            if key_id == self.active:
+                raise ValueError("активний ключ не можна видалити")
+            self.keys.pop(key_id)
+            self._ciphers.pop(key_id, None)
+        self.save()
+
+    def cipher(self, key_id):
+        cipher = self._ciphers.get(key_id)
+        if cipher is None:
+            key = self.keys.get(key_id)
+            if key is None:
+                raise KeyError(f"ключа {key_id} немає у {self.path}")
+            cipher = self._ciphers[key_id] = AESGCM(key)
+        return cipher
+
+    def encrypt(self, plaintext, segment_id, index):
+        """Фрагмент index сегмента segment_id: заголовок і шифротекст"""
+        nonce = os.urandom(NONCE_SIZE)
+        length = len(plaintext) + 16
+        header = CHUNK.pack(self.active, length, nonce)
+        return header + self.cipher(self.active).encrypt(nonce, plaintext, _aad(segment_id, index, header))
+
+    def decrypt(self, header, ciphertext, segment_id, index):
+        """ValueError, якщо фрагмент змінено, переставлено або перенесено з іншого сегмента"""
+        key_id, _, nonce = CHUNK.unpack(header)
+        try:
+            return self.cipher(key_id).decrypt(nonce, ciphertext, _aad(segment_id, index, header))
+        except InvalidTag:
+            raise ValueError(f"фрагмент {index} пошкоджено або не на своєму місці") from None
+
+
+def _aad(segment_id, index, header):
+    return segment_id + INDEX.pack(index) + header[:8]
+
+
+def read_chunks(path, skip_data=False):
+    """Фрагменти сегмента (id сегмента, номер фрагмента, заголовок, шифротекст) по одному.
+    Обірваний хвіст (збій процесу під час дописування, пакет тоді записується повторно)
+    пропускається"""
+    with open(path, 'rb') as f:
+        magic, segment_id = SEGMENT.unpack(f.read(SEGMENT.size).ljust(SEGMENT.size, b'\0'))
+        if magic != MAGIC:
+            raise ValueError(f"{path}: не сегмент архіву анкет")
+        for index in itertools.count():
+            header = f.read(CHUNK.size)
+            if not header:
+                return
+            length = CHUNK.unpack(header)[1] if len(header) == CHUNK.size else 0
+            if skip_data and length:
+                position = f.tell()
+                if f.seek(0, os.SEEK_END) >= position + length:
+                    f.seek(position + length)
+                    yield segment_id, index, header, None
+                    continue
+            else:
+                data = f.read(length)
+                if length and len(data) == length:
+                    yield segment_id, index, header, data
+                    continue
+            logger.warning(f"{path}: обірваний останній фрагмент пропущено")
+            return
+
+
+class SurveyArchive:
+    """Зашифрований архів анкет у каталозі directory; інтерфейс sink для SurveyWriter.
+
+    Кожен процес дописує власний сегмент і тримає на ньому блокування, тож процеси-обробники
+    не заважають один одному, а rotate пропускає сегменти, які зараз дописуються. Якщо
+    файл ключів змінився (keygen), наступний пакет починає новий сегмент новим ключем.
+    """
+
+    def __init__(self, directory, key_file, segment_size=SEGMENT_SIZE):
+        self.directory = directory
+        self.keys = KeyRing(key_file)
+        self.segment_size = segment_size
+        self._loaded = False
+        self._fd = None
+        self._size = 0
+        self._key_id = None
+        self._segment_id = None
+        self._index = 0
+        self._names = itertools.count(1)
+
+    def segments(self):
+        """Шляхи сегментів у порядку створення"""
+        if not os.path.isdir(self.directory):
+            return []
+        return [
+            os.path.join(self.directory, name) for name in sorted(os.listdir(self.directory)) if name.endswith(SUFFIX)
+        ]
+
+    def open(self):
+        if self._loaded:
+            return
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        if self.keys.exists():
+            self.keys.load()
+        elif self.segments():
+            # Без ключа існуючий архів не прочитати: не створюємо новий ключ мовчки
+            raise FileNotFoundError(f"файл ключів {self.keys.path} не знайдено, а архів {self.directory} не порожній")
+        elif self.keys.create():
+            logger.warning(f"Створено ключ архіву анкет у {self.keys.path}: збережіть його резервну копію")
+        self._loaded = True
+
+    def close(self):
+        self._seal()
+
+    def _start_segment(self):
+        name = f"surveys_{datetime.now():%Y%m%d_%H%M%S}_{os.getpid()}_{next(self._names):06d}{SUFFIX}"
+        path = os.path.join(self.directory, name)
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o600)
+        _try_lock(self._fd)
+        self._segment_id = os.urandom(16)
+        _write_all(self._fd, SEGMENT.pack(MAGIC, self._segment_id))
+        os.fsync(self._fd)
+        _fsync_dir(self.directory)
+        self._size = SEGMENT.size
+        self._index = 0
+        self._key_id = self.keys.active
+
+    def _seal(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def write_batch(self, records):
+        """Дописує пакет анкет одним зашифрованим фрагментом з одним fsync"""
+        self.open()
+        if self.keys.changed():
+            self.keys.load()
+            if self._key_id != self.keys.active:
+                self._seal()
+        if self._fd is None:
+            self._start_segment()
+        plaintext = '\n'.join(json.dumps(record, ensure_ascii=False) for record in records).encode()
+        chunk = self.keys.encrypt(plaintext, self._segment_id, self._index)
+        try:
+            _write_all(self._fd, chunk)
+            os.fsync(self._fd)
+        except BaseException:
+            # Пакет буде записано повторно: прибираємо частково дописаний фрагмент
+            os.ftruncate(self._fd, self._size)
+            raise
+        self._size += len(chunk)
+        self._index += 1
+        for record in records:
+            logger.info(f"Анкету збережено в архів: користувач {record.get('user_id')}, {record['saved_at']}")
+        if self._size >= self.segment_size:
+            self._seal()
+
+    def iter_records(self):
+        """Усі анкети архіву по одній; у пам'яті не більше одного фрагмента (пакета)"""
+        self.open()
+        for path in self.segments():
+            for segment_id, index, header, ciphertext in read_chunks(path):
+                try:
+                    plaintext = self.keys.decrypt(header, ciphertext, segment_id, index)
+                except ValueError as e:
+                    raise ValueError(f"{path}: {e}") from None
+                for line in plaintext.split(b'\n'):
+                    yield json.loads(line)
+
+    def seal(self, record):
+        """Анкета, зашифрована поза сегментами активним ключем (для failed_surveys.jsonl):
+        рядок base64 з власним випадковим id замість id сегмента"""
+        self.open()
+        seal_id = os.urandom(16)
+        plaintext = json.dumps(record, ensure_ascii=False).encode()
+        return base64.b64encode(seal_id + self.keys.encrypt(plaintext, seal_id, 0)).decode()
+
+    def unseal(self, text):
+        """Анкета з рядка seal"""
+        self.open()
+        data = base64.b64decode(text)
+        header_end = 16 + CHUNK.size
+        return json.loads(self.keys.decrypt(data[16:header_end], data[header_end:], data[:16], 0))
+
+    def import_failed(self, path):
+        """Дописує в архів анкети з файлу незбережених (failed_surveys.jsonl) і видаляє файл.
+        Повертає кількість анкет"""
+        records = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    records.append(self.unseal(entry['sealed']) if 'sealed' in entry else entry['record'])
+        if records:
+            self.write_batch(records)
+        self.close()
+        os.unlink(path)
+        return len(records)
+
+    def key_usage(self):
+        """Кількість фрагментів за номером ключа (читаються лише заголовки)"""
+        self.open()
+        usage = Counter()
+        for path in self.segments():
+            for _, _, header, _ in read_chunks(path, skip_data=True):
+                usage[CHUNK.unpack(header)[0]] += 1
+        return usage
+
+    def rotate(self, limit=None):
+        """Перешифровує активним ключем сегменти зі старими ключами, по одному сегменту
+        (новий файл і атомарна заміна), тож перерваний поворот продовжується з того ж місця.
+        Пропускає сегменти, які зараз дописує бот. Повертає статистику"""
+        self.open()
+        self._seal()
+        stats = {'segments': 0, 'chunks': 0, 'bytes': 0, 'busy': 0, 'remaining': 0}
+        for path in self.segments():
+            with open(path, 'rb') as f:
+                if not _try_lock(f.fileno()):
+                    stats['busy'] += 1
+                    continue
+                if all(CHUNK.unpack(header)[0] == self.keys.active for _, _, header, _ in read_chunks(path, True)):
+                    continue
+                if limit is not None and stats['segments'] >= limit:
+                    stats['remaining'] += 1
+                    continue
+                tmp = f"{path}.tmp"
+                fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                try:
+                    # Той самий id сегмента і ті самі номери фрагментів
+                    f.seek(0)
+                    _write_all(fd, f.read(SEGMENT.size))
+                    for segment_id, index, header, ciphertext in read_chunks(path):
+                        if CHUNK.unpack(header)[0] != self.keys.active:
+                            plaintext = self.keys.decrypt(header, ciphertext, segment_id, index)
+                            chunk = self.keys.encrypt(plaintext, segment_id, index)
+                            stats['chunks'] += 1
+                        else:
+                            chunk = header + ciphertext
+                        _write_all(fd, chunk)
+                        stats['bytes'] += len(chunk)
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+                os.replace(tmp, path)
+                _fsync_dir(self.directory)
+                stats['segments'] += 1
+                logger.info(f"Сегмент {os.path.basename(path)} перешифровано ключем {self.keys.active}")
+        return stats
+
+    def prune_keys(self):
+        """Видаляє з файлу ключів неактивні ключі, якими не зашифровано жодного фрагмента"""
+        usage = self.key_usage()
+        unused = [key_id for key_id in self.keys.keys if key_id != self.keys.active and not usage[key_id]]
+        if unused:
+            self.keys.remove(unused)
+        return unused
+
+    def import_text_surveys(self, directory, remove=False, batch_size=500):
+        """Переносить старі .txt анкети в архів пакетами; повторний запуск пропускає вже
+        перенесені. remove - видаляє текстові файли, щойно їх анкети є в архіві на диску.
+        Повертає (перенесено, пропущено, з помилками)"""
+        from survey_store import parse_text_survey
+        from validation import normalize_record
+
+        # Назва файлу зберігається в зашифрованій анкеті (поле source), а не поруч з архівом:
+        # вона містить ID Telegram пацієнта
+        done = {record['source'] for record in self.iter_records() if 'source' in record}
+        imported = skipped = failed = 0
+        names = sorted(name for name in os.listdir(directory) if name.endswith('.txt'))
+        for start in range(0, len(names), batch_size):
+            records, paths = [], []
+            for name in names[start:start + batch_size]:
+                path = os.path.join(directory, name)
+                if name in done:
+                    skipped += 1
+                    paths.append(path)
+                    continue
+                try:
+                    with open(path, encoding='utf-8') as f:
+                        record = normalize_record(parse_text_survey(f.read(), name))
+                except (OSError, ValueError) as e:
+                    failed += 1
+                    logger.error(f"Не вдалося імпортувати {path}: {e}")
+                    continue
+                record['source'] = name
+                records.append(record)
+                paths.append(path)
+            if records:
+                self.write_batch(records)
+                imported += len(records)
+            if remove:
+                for path in paths:
+                    os.unlink(path)
+        self.close()
+        return imported, skipped, failed
+
+
+def _main():
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    surveys_dir = os.environ.get('SURVEYS_DIR', 'surveys')
+    parser = argparse.ArgumentParser(description='Зашифрований архів анкет')
+    parser.add_argument('--dir', default=os.path.join(surveys_dir, 'archive'), help='каталог архіву')
+    parser.add_argument('--key-file', default=os.environ.get('SURVEY_ARCHIVE_KEY', 'survey_archive.key'))
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('keygen', help='новий активний ключ (старі лишаються для читання)')
+    rotator = commands.add_parser('rotate', help='перешифрувати сегменти зі старими ключами')
+    rotator.add_argument('--limit', type=int, default=None, help='не більше стількох сегментів за запуск')
+    commands.add_parser('prune-keys', help='видалити ключі, якими нічого не зашифровано')
+    exporter = commands.add_parser('export', help='розшифрувати архів у CSV або JSON lines')
+    exporter.add_argument('--out', default='-', help='файл (за замовчуванням stdout)')
+    exporter.add_argument('--format', choices=('csv', 'jsonl'), default='csv')
+    importer = commands.add_parser('import', help='перенести старі .txt анкети в архів')
+    importer.add_argument('directory', nargs='?', default=surveys_dir)
+    importer.add_argument('--remove-plaintext', action='store_true', help='видалити .txt після перенесення')
+    failed = commands.add_parser('import-failed', help='дописати в архів анкети з failed_surveys.jsonl')
+    failed.add_argument('path', nargs='?', default=os.path.join(surveys_dir, 'failed_surveys.jsonl'))
+    args = parser.parse_args()
+
+    archive = SurveyArchive(args.dir, args.key_file)
+    if args.command == 'keygen':
+        if archive.keys.exists():
+            archive.keys.load()
+        print(f"Активний ключ: {archive.keys.add()}. Перешифрувати архів: python survey_archive.py rotate")
+    elif args.command == 'rotate':
+        stats = archive.rotate(args.limit)
+        print(f"Перешифровано сегментів: {stats['segments']} (фрагментів {stats['chunks']}, "
+              f"{stats['bytes'] / 1e6:.1f} МБ); зайнятих ботом: {stats['busy']}, лишилось: {stats['remaining']}")
+    elif args.command == 'prune-keys':
+        unused = archive.prune_keys()
+        print(f"Видалено ключів: {len(unused)} {unused or ''}".rstrip())
+    elif args.command == 'export':
+        out = sys.stdout.buffer if args.out == '-' else open(args.out, 'wb')
+        try:
+            if args.format == 'csv':
+                from survey_export import write_csv
+                # survey_id у CSV - порядковий номер анкети в архіві
+                records = (dict(record, survey_id=number) for number, record in enumerate(archive.iter_records(), 1))
+                count, _ = write_csv(records, out)
+            else:
+                count = 0
+                for record in archive.iter_records():
+                    out.write(json.dumps(record, ensure_ascii=False).encode() + b'\n')
+                    count += 1
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+        print(f"Вивантажено анкет: {count}", file=sys.stderr)
+    elif args.command == 'import-failed':
+        print(f"Дописано в архів: {archive.import_failed(args.path)}")
+    else:
+        imported, skipped, failed = archive.import_text_surveys(args.directory, remove=args.remove_plaintext)
+        print(f"Перенесено в архів: {imported}, вже перенесених: {skipped}, з помилками: {failed}")
+
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Вивантаження анкет у CSV для лікарів: періодичне зведення (замість повідомлення
+на кожну анкету) і команда /export. Анкети читаються зі сховища пакетами і
+пишуться у тимчасовий файл рядок за рядком, тож пам'ять не залежить від кількості анкет.
+"""
+
+import asyncio
+import csv
+import io
+import logging
+import os
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from outbound import ROUTINE
+from survey_render import SURVEY_FIELDS
+from validation import VALUE_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Колонки CSV (числові значення відповідей - окремими колонками для розрахунків у таблиці)
+EXPORT_FIELDS = ('survey_id', 'saved_at', 'user_id', 'username') + SURVEY_FIELDS + VALUE_FIELDS
+
+# Роздільник, який Excel з українською локаллю розпізнає без налаштувань
+DELIMITER = ';'
+
+# Початок клітинки, який Excel і LibreOffice сприймають як формулу
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _cell(value):
+    """Текст пацієнта не виконується як формула при відкритті CSV (CSV injection)"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def write_csv(records, file):
+    """Пише анкети у бінарний файл (UTF-8 з BOM для Excel); повертає (кількість, останній id)"""
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    writer = csv.writer(text, delimiter=DELIMITER)
+    writer.writerow(EXPORT_FIELDS)
+    count = last_id = 0
+    for record in records:
+        writer.writerow([_cell(record.get(field, '')) for field in EXPORT_FIELDS])
+        count += 1
+        last_id = record['survey_id']
+    text.flush()
+    text.detach()
+    return count, last_id
+
+
+def export_file(records):
+    """Тимчасовий CSV-файл з анкетами: (шлях, кількість, останній id); файл видаляє викликач"""
+    fd, path = tempfile.mkstemp(prefix='surveys_', suffix='.csv')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            count, last_id = write_csv(records, file)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path, count, last_id
+
+
+async def send_document(outbound, bot, chat_ids, path, filename, caption=None, priority=ROUTINE):
+    """Надсилає файл кожному чату: на сервер Telegram він завантажується один раз,
+    решта чатів отримують file_id. Повертає кількість чатів, яким файл доставлено"""
+    remaining = list(chat_ids)
+    file_id = None
+    while remaining and file_id is None:
+        chat_id = remaining.pop(0)
+        # Шлях, а не відкритий файл: при повторній спробі PTB прочитає файл заново
+        try:
+            message = await outbound.submit(
+                bot, chat_id, 'send_document', priority, document=Path(path), filename=filename, caption=caption)
+        except Exception as e:
+            logger.error(f"Не вдалося надіслати {filename} користувачу {chat_id}: {e}")
+            continue
+        file_id = message.document.file_id
+    if file_id is None:
+        return 0
+    results = await asyncio.gather(*(
+        outbound.submit(bot, chat_id, 'send_document', priority, document=file_id, caption=caption)
+        for chat_id in remaining
+    ), return_exceptions=True)
+    for chat_id, result in zip(remaining, results):
+        if isinstance(result, Exception):
+            logger.error(f"Не вдалося надіслати {filename} користувачу {chat_id}: {result}")
+    return 1 + sum(1 for result in results if not isinstance(result, Exception))
+
+
+class Digest:
+    """Періодичне зведення: кожен лікар раз на interval секунд отримує один CSV
+    з анкетами, збереженими після попереднього зведення.
+
+    Позиція (id останньої вивантаженої анкети) зберігається в сховищі, тому після
+    перезапуску зведення продовжується з того ж місця, а анкети, ще не записані
+    на диск, потрапляють у наступне зведення.
+    """
+
+    NAME = 'digest'
+
+    def __init__(self, store, admin_ids, outbound, interval=86400):
+        self.store = store
+        self.admin_ids = admin_ids
+        self.outbound = outbound
+        self.interval = interval
+        self.bot = None
+        self._task = None
+        self.stats = {'digests': 0, 'surveys': 0, 'errors': 0}
+
+    async def start(self, bot):
+        self.bot = bot
+        self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        try:
+            await asyncio.to_thread(self._init_cursor)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"Помилка ініціалізації зведення анкет: {e}")
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.send()
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"Помилка формування зведення анкет: {e}")
+
+    def _init_cursor(self):
+        """Перше увімкнення: зведення починаються з нових анкет, а не з усієї історії.
+        Повертає True, якщо позицію щойно встановлено"""
+        if self.store.get_cursor(self.NAME) is not None:
+            return False
+        self.store.set_cursor(self.NAME, self.store.last_id())
+        return True
+
+    async def send(self):
+        """Надсилає зведення нових анкет; повертає їх кількість"""
+        # Позиції немає (ініціалізація при старті не вдалась): лікарям не надсилається
+        # вся історія анкет, зведення починаються з поточної останньої анкети
+        if await asyncio.to_thread(self._init_cursor):
+            return 0
+        after_id = await asyncio.to_thread(self.store.get_cursor, self.NAME)
+        path, count, last_id = await asyncio.to_thread(
+            export_file, self.store.iter_surveys(after_id=after_id))
+        try:
+            if not count:
+                return 0
+            now = datetime.now()
+            delivered = await send_document(
+                self.outbound, self.bot, self.admin_ids, path,
+                f"surveys_{now:%Y%m%d_%H%M}.csv", f"📋 Нових анкет: {count}",
+            )
+        finally:
+            os.unlink(path)
+        if not delivered:
+            # Жодному лікарю не доставлено: ті самі анкети підуть у наступне зведення
+            raise RuntimeError(f"зведення з {count} анкет не доставлено")
+        await asyncio.to_thread(self.store.set_cursor, self.NAME, last_id)
+        self.stats['digests'] += 1
+        self.stats['surveys'] += count
+        logger.info(f"Зведення з {count} анкет надіслано {delivered} лікарям")
+        return count
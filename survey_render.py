@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Формування тексту анкети за попередньо скомпільованим шаблоном
+"""
+
+from functools import lru_cache
+from string import Formatter
+
+DEFAULT_VALUE = 'Не вказано'
+
+
+class Template:
+    """Шаблон у синтаксисі str.format, розібраний один раз на фіксовану розкладку:
+    літерали лежать на своїх місцях, поля підставляються за індексами, рендер — один join"""
+
+    def __init__(self, text):
+        self.layout = []
+        self.slots = []
+        for literal, name, _, _ in Formatter().parse(text):
+            if literal:
+                self.layout.append(literal)
+            if name is not None:
+                self.slots.append((len(self.layout), name))
+                self.layout.append('')
+        self.fields = tuple(name for _, name in self.slots)
+
+    def render(self, values):
+        """values - значення полів у порядку self.fields"""
+        parts = self.layout.copy()
+        for (index, _), value in zip(self.slots, values):
+            parts[index] = value
+        return ''.join(parts)
+
+
+BODY = Template(
+    "📋 АНКЕТА ПАЦІЄНТА З БОЛЕМ У СПИНІ\n"
+    + "=" * 40 + "\n\n"
+    "👤 ПІБ: {pib}\n"
+    "📅 Вік: {vik}\n"
+    "🗓 Дата заповнення: {date}\n\n"
+    "1️⃣ ДЕ САМЕ БОЛИТЬ?\n"
+    "   {de_bolit}\n"
+    "   Оніміння/поколювання: {onіmіnnya}\n"
+    "\n"
+    "2️⃣ КОЛИ ПОЯВИВСЯ БІЛЬ?\n"
+    "   {koly_zyavyvsya}\n"
+    "   {travma}\n"
+    "\n"
+    "3️⃣ ХАРАКТЕР БОЛЮ:\n"
+    "   {kharakter_boly}\n"
+    "   Інтенсивність (0-10): {shkala_boly}\n\n"
+    "4️⃣ ЩО ПОГІРШУЄ/ПОЛЕГШУЄ:\n"
+    "   Погіршує: {pohirshue}\n"
+    "   Полегшує: {polehshue}\n\n"
+    "5️⃣ РАНІШЕ ПОДІБНІ ЕПІЗОДИ:\n"
+    "   {ranishi_epizody}\n"
+    "{ranishi_yak_likuvaly}"
+    "\n"
+    "6️⃣ ЧЕРВОНІ ПРАПОРИ:\n"
+    "   {chervoni_prapory}\n\n"
+    "7️⃣ СУПУТНІ ЗАХВОРЮВАННЯ:\n"
+    "   {suputni}\n\n"
+    "8️⃣ РІВЕНЬ АКТИВНОСТІ:\n"
+    "   {aktyvnist}\n"
+    "{sport_yakyi}"
+    "\n"
+    "9️⃣ ПОТОЧНЕ ЛІКУВАННЯ:\n"
+    "   Ліки: {likuvannya}\n"
+    "   Фізіотерапія/масаж: {fizioterapiya}\n"
+    "\n"
+    "🔟 АНТРОПОМЕТРИЧНІ ДАНІ:\n"
+    "   Зріст: {zrist} см\n"
+    "   Вага: {vaga} кг\n"
+    "\n" + "=" * 40
+)
+
+CONTACTS = Template(
+    "\n📱 Telegram: @{username}"
+    "\n🆔 User ID: {user_id}"
+)
+
+# Поля user_data, від яких залежить текст анкети (ключ кешу)
+SURVEY_FIELDS = (
+    'pib', 'vik', 'date', 'de_bolit', 'onіmіnnya', 'onіmіnnya_de', 'koly_zyavyvsya',
+    'travma', 'travma_detalі', 'kharakter_boly', 'shkala_boly', 'pohirshue', 'polehshue',
+    'ranishi_epizody', 'ranishi_yak_likuvaly', 'chervoni_prapory', 'suputni', 'aktyvnist',
+    'sport_yakyi', 'likuvannya', 'fizioterapiya', 'zrist', 'vaga',
+)
+
+
+def _text(value, default=DEFAULT_VALUE):
+    return default if value is None else str(value)
+
+
+@lru_cache(maxsize=4096)
+def _render_body(values):
+    """Рендер спільної частини анкети; кешується за значеннями полів,
+    тому незмінена анкета ніколи не рендериться двічі"""
+    (pib, vik, date, de_bolit, oniminnya, oniminnya_de, koly_zyavyvsya,
+     travma, travma_detali, kharakter_boly, shkala_boly, pohirshue, polehshue,
+     ranishi_epizody, ranishi_yak_likuvaly, chervoni_prapory, suputni, aktyvnist,
+     sport_yakyi, likuvannya, fizioterapiya, zrist, vaga) = values
+
+    if oniminnya == 'Так':
+        oniminnya_text = _text(oniminnya_de)
+    else:
+        oniminnya_text = _text(oniminnya)
+    if travma == 'Так':
+        travma_text = f"Після травми: {_text(travma_detali)}"
+    else:
+        travma_text = f"Травма: {_text(travma)}"
+    if ranishi_epizody == 'Так':
+        ranishi_text = f"   Як лікували: {_text(ranishi_yak_likuvaly)}\n"
+    else:
+        ranishi_text = ''
+    if sport_yakyi and sport_yakyi != 'Не займаюся спортом':
+        sport_text = f"   Спорт: {sport_yakyi}\n"
+    else:
+        sport_text = ''
+
+    return BODY.render((
+        _text(pib), _text(vik), _text(date),
+        _text(de_bolit), oniminnya_text,
+        _text(koly_zyavyvsya), travma_text,
+        _text(kharakter_boly), _text(shkala_boly),
+        _text(pohirshue), _text(polehshue),
+        _text(ranishi_epizody), ranishi_text,
+        _text(chervoni_prapory, 'Немає'),
+        _text(suputni, 'Немає'),
+        _text(aktyvnist), sport_text,
+        _text(likuvannya), _text(fizioterapiya),
+        _text(zrist), _text(vaga),
+    ))
+
+
+def format_survey_result(user_data, for_admin=False):
+    """Форматує результати анкети для відправки"""
+    get = user_data.get
+    result = _render_body(tuple([get(field) for field in SURVEY_FIELDS]))
+
+    # Додаємо контактну інформацію тільки для адміністраторів
+    if for_admin:
+        result += CONTACTS.render((
+            _text(get('username'), 'невідомий'),
+            _text(get('user_id'), 'невідомий'),
+        ))
+
+    return result
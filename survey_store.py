@@ -0,0 +1,479 @@
+# -*- coding: utf-8 -*-
+"""
+Структуроване сховище анкет у SQLite з індексами за пацієнтом, датою і червоними прапорами.
+
+Імпорт старих .txt анкет і перерахунок агрегатів аналітики:
+    python survey_store.py import surveys/ --db surveys/surveys.db
+    python survey_store.py rollup --db surveys/surveys.db
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+from validation import VALUE_FIELDS, normalize_record
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS surveys (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER,
+    saved_at TEXT NOT NULL,
+    red_flags INTEGER NOT NULL DEFAULT 0,
+    source TEXT UNIQUE,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS surveys_user_id ON surveys (user_id, saved_at);
+CREATE INDEX IF NOT EXISTS surveys_saved_at ON surveys (saved_at);
+CREATE INDEX IF NOT EXISTS surveys_red_flags ON surveys (saved_at) WHERE red_flags = 1;
+CREATE TABLE IF NOT EXISTS survey_red_flags (
+    flag TEXT NOT NULL,
+    survey_id INTEGER NOT NULL,
+    PRIMARY KEY (flag, survey_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS export_cursors (
+    name TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS latest_surveys (
+    user_id INTEGER PRIMARY KEY,
+    survey_id INTEGER NOT NULL,
+    saved_at TEXT NOT NULL
+);
+"""
+
+# Повнотекстовий індекс (FTS5) за ПІБ і текстовими відповідями; rowid = surveys.id
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS surveys_fts USING fts5(
+    pib, answers, content='', tokenize='unicode61 remove_diacritics 2'
+);
+"""
+SCHEMA_VERSION = 5
+
+# Службові ключі user_data, які не є відповідями анкети
+SERVICE_KEYS = ('editing', 'triage_alerted', 'prefilled', 'selection')
+
+# Поля, які не потрапляють у повнотекстовий індекс відповідей
+NON_TEXT_KEYS = ('pib', 'username', 'user_id', 'date', 'saved_at') + VALUE_FIELDS
+
+
+def extract_red_flags(text, options):
+    """Повертає варіанти червоних прапорів, згадані у відповіді"""
+    if not text:
+        return []
+    lowered = text.lower()
+    return [option for option in options if option.lower() in lowered]
+
+
+def fts_query(text):
+    """Запит FTS5 з довільного тексту: кожне слово як префікс, усі слова обов'язкові"""
+    words = re.findall(r'\w+', text)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def survey_record(user_data, saved_at=None):
+    """Знімок відповідей для збереження (user_data далі змінюється пацієнтом)"""
+    record = {key: value for key, value in user_data.items() if key not in SERVICE_KEYS}
+    record['saved_at'] = (saved_at or datetime.now()).isoformat(timespec='seconds')
+    return record
+
+
+class SurveyStore:
+    """Сховище анкет. Методи синхронні: з обробників їх викликають через asyncio.to_thread"""
+
+    def __init__(self, path='surveys.db', red_flag_options=(), onset_options=()):
+        self.path = path
+        self.red_flag_options = tuple(red_flag_options)
+        # Варіанти відповіді про тривалість болю: інші відповіді в аналітиці - одна група
+        self.onset_options = tuple(onset_options)
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        if self._conn is None:
+            # Перші запити можуть прийти одночасно з кількох потоків (/start повторних пацієнтів)
+            with self._lock:
+                if self._conn is None:
+                    self._conn = self._connect()
+        return self._conn
+
+    def _connect(self):
+        # Модуль аналітики імпортується при першому зверненні до сховища, а не при старті бота
+        import analytics
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # timeout - очікування блокування, коли пише інший процес-обробник
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # Підтверджені анкети не можна втратити: fsync на кожну транзакцію (одну на пакет)
+        conn.execute('PRAGMA synchronous=FULL')
+        conn.executescript(SCHEMA)
+        conn.executescript(analytics.ROLLUP_SCHEMA)
+        self._migrate(conn)
+        return conn
+
+    def _migrate(self, conn):
+        import analytics
+
+        if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+            return
+        with conn:
+            # IMMEDIATE: процеси-обробники стартують одночасно, мігрує лише перший,
+            # а решта після очікування бачать уже нову версію
+            conn.execute('BEGIN IMMEDIATE')
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version < 2:
+                # Повнотекстовий індекс для пошуку; заповнюємо його вже збереженими анкетами
+                conn.execute(FTS_SCHEMA)
+                for survey_id, data in conn.execute('SELECT id, data FROM surveys').fetchall():
+                    self._index_text(conn, survey_id, json.loads(data))
+            if version < 3:
+                # Агрегати аналітики з уже збережених анкет (один запит над усім архівом)
+                analytics.rebuild(conn, self.onset_options)
+            if version < 4:
+                # Вказівник на останню анкету кожного пацієнта з уже збережених анкет
+                conn.execute(
+                    'INSERT OR REPLACE INTO latest_surveys (user_id, survey_id, saved_at) '
+                    'SELECT user_id, id, saved_at FROM surveys s WHERE user_id IS NOT NULL AND id = ('
+                    'SELECT id FROM surveys WHERE user_id = s.user_id ORDER BY saved_at DESC, id DESC LIMIT 1)'
+                )
+            if version < 5:
+                # Тижні - за датою понеділка, тривалість болю поза варіантами клавіатури - одна група
+                analytics.rebuild(conn, self.onset_options)
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def write_batch(self, records):
+        """Записує пакет анкет однією транзакцією"""
+        import analytics
+
+        conn = self.open()
+        with self._lock, conn:
+            # IMMEDIATE: блокування на запис одразу, з очікуванням timeout. Відкладений BEGIN
+            # після читання last_id отримує SQLITE_BUSY без очікування, коли пише інший процес
+            conn.execute('BEGIN IMMEDIATE')
+            after_id = analytics.last_id(conn)
+            for record in records:
+                self._insert(conn, record)
+            # Агрегати оновлюються в тій самій транзакції: кожна анкета врахована рівно раз
+            analytics.rollup(conn, after_id, onset_options=self.onset_options)
+        for record in records:
+            logger.info(f"Анкету збережено: користувач {record.get('user_id')}, {record['saved_at']}")
+
+    def _insert(self, conn, record, source=None):
+        flags = extract_red_flags(record.get('chervoni_prapory'), self.red_flag_options)
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO surveys (user_id, saved_at, red_flags, source, data) VALUES (?, ?, ?, ?, ?)',
+            (record.get('user_id'), record['saved_at'], int(bool(flags)), source,
+             json.dumps(record, ensure_ascii=False)),
+        )
+        if not cursor.rowcount:
+            return None
+        survey_id = cursor.lastrowid
+        conn.executemany(
+            'INSERT OR IGNORE INTO survey_red_flags (flag, survey_id) VALUES (?, ?)',
+            [(flag, survey_id) for flag in flags],
+        )
+        self._index_text(conn, survey_id, record)
+        if record.get('user_id') is not None:
+            # Імпортовані старі анкети не витісняють новіших
+            conn.execute(
+                'INSERT INTO latest_surveys (user_id, survey_id, saved_at) VALUES (?, ?, ?) '
+                'ON CONFLICT (user_id) DO UPDATE SET survey_id = excluded.survey_id, saved_at = excluded.saved_at '
+                'WHERE excluded.saved_at >= latest_surveys.saved_at',
+                (record['user_id'], survey_id, record['saved_at']),
+            )
+        return survey_id
+
+    @staticmethod
+    def _index_text(conn, survey_id, record):
+        answers = '\n'.join(
+            str(value) for key, value in record.items() if key not in NON_TEXT_KEYS and value is not None
+        )
+        conn.execute(
+            'INSERT INTO surveys_fts (rowid, pib, answers) VALUES (?, ?, ?)',
+            (survey_id, record.get('pib') or '', answers),
+        )
+
+    def _query(self, sql, params=()):
+        conn = self.open()
+        with self._lock:
+            rows = conn.execute(sql, params).fetchall()
+        return [self._row(row) for row in rows]
+
+    @staticmethod
+    def _row(row):
+        survey_id, data = row
+        record = json.loads(data)
+        record['survey_id'] = survey_id
+        return record
+
+    def get(self, survey_id):
+        rows = self._query('SELECT id, data FROM surveys WHERE id = ?', (survey_id,))
+        return rows[0] if rows else None
+
+    def for_patient(self, user_id, limit=50, offset=0):
+        """Анкети пацієнта, від найновіших (індекс user_id, saved_at)"""
+        return self._query(
+            'SELECT id, data FROM surveys WHERE user_id = ? ORDER BY saved_at DESC LIMIT ? OFFSET ?',
+            (user_id, limit, offset),
+        )
+
+    def latest_for_patient(self, user_id):
+        """Остання анкета пацієнта або None: два пошуки за первинним ключем
+        (вказівник latest_surveys оновлюється в транзакції запису анкети)"""
+        rows = self._query(
+            'SELECT s.id, s.data FROM latest_surveys l JOIN surveys s ON s.id = l.survey_id WHERE l.user_id = ?',
+            (user_id,),
+        )
+        return rows[0] if rows else None
+
+    def between(self, start, end, limit=1000, offset=0):
+        """Анкети, збережені в проміжку [start, end) (індекс saved_at)"""
+        return self._query(
+            'SELECT id, data FROM surveys WHERE saved_at >= ? AND saved_at < ? '
+            'ORDER BY saved_at DESC LIMIT ? OFFSET ?',
+            (start.isoformat(timespec='seconds'), end.isoformat(timespec='seconds'), limit, offset),
+        )
+
+    def iter_surveys(self, start=None, end=None, after_id=0, batch_size=500):
+        """Анкети з id > after_id (у проміжку [start, end), якщо задано) у порядку збереження.
+        Генератор читає пакетами за ключем id, тож у пам'яті не більше batch_size анкет"""
+        start = start.isoformat(timespec='seconds') if start else ''
+        end = end.isoformat(timespec='seconds') if end else '9999'
+        while True:
+            rows = self._query(
+                'SELECT id, data FROM surveys WHERE id > ? AND saved_at >= ? AND saved_at < ? '
+                'ORDER BY id LIMIT ?',
+                (after_id, start, end, batch_size),
+            )
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            after_id = rows[-1]['survey_id']
+
+    def get_cursor(self, name):
+        """Останній вивантажений id для періодичного вивантаження name (None - ще не було)"""
+        conn = self.open()
+        with self._lock:
+            row = conn.execute('SELECT last_id FROM export_cursors WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_cursor(self, name, last_id):
+        conn = self.open()
+        with self._lock:
+            conn.execute(
+                'INSERT INTO export_cursors (name, last_id) VALUES (?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET last_id = excluded.last_id',
+                (name, last_id),
+            )
+
+    def last_id(self):
+        conn = self.open()
+        with self._lock:
+            return conn.execute('SELECT COALESCE(MAX(id), 0) FROM surveys').fetchone()[0]
+
+    def recent(self, limit=10, offset=0):
+        """Останні збережені анкети"""
+        return self._query(
+            'SELECT id, data FROM surveys ORDER BY saved_at DESC, id DESC LIMIT ? OFFSET ?',
+            (limit, offset),
+        )
+
+    def search(self, text, limit=10, offset=0):
+        """Повнотекстовий пошук за ПІБ і текстовими відповідями (збіг ПІБ важить більше)"""
+        query = fts_query(text)
+        if not query:
+            return []
+        return self._query(
+            'SELECT s.id, s.data FROM surveys_fts f JOIN surveys s ON s.id = f.rowid '
+            'WHERE surveys_fts MATCH ? ORDER BY bm25(surveys_fts, 10.0, 1.0), s.id DESC LIMIT ? OFFSET ?',
+            (query, limit, offset),
+        )
+
+    def with_red_flags(self, flag=None, since=None, limit=100):
+        """Анкети з червоними прапорами (усі або з конкретним варіантом)"""
+        since = since.isoformat(timespec='seconds') if since else ''
+        if flag is None:
+            return self._query(
+                'SELECT id, data FROM surveys WHERE red_flags = 1 AND saved_at >= ? '
+                'ORDER BY saved_at DESC LIMIT ?',
+                (since, limit),
+            )
+        return self._query(
+            'SELECT s.id, s.data FROM survey_red_flags f JOIN surveys s ON s.id = f.survey_id '
+            'WHERE f.flag = ? AND s.saved_at >= ? ORDER BY s.saved_at DESC LIMIT ?',
+            (flag, since, limit),
+        )
+
+    def import_text_surveys(self, directory):
+        """Одноразовий імпорт старих .txt анкет; повторний запуск пропускає вже імпортовані"""
+        import analytics
+
+        imported = skipped = failed = 0
+        conn = self.open()
+        names = sorted(name for name in os.listdir(directory) if name.endswith('.txt'))
+        for start in range(0, len(names), 500):
+            with self._lock, conn:
+                conn.execute('BEGIN IMMEDIATE')
+                after_id = analytics.last_id(conn)
+                for name in names[start:start + 500]:
+                    path = os.path.join(directory, name)
+                    try:
+                        with open(path, encoding='utf-8') as f:
+                            record = normalize_record(parse_text_survey(f.read(), name))
+                    except (OSError, ValueError) as e:
+                        failed += 1
+                        logger.error(f"Не вдалося імпортувати {path}: {e}")
+                        continue
+                    if self._insert(conn, record, source=name) is None:
+                        skipped += 1
+                    else:
+                        imported += 1
+                analytics.rollup(conn, after_id, onset_options=self.onset_options)
+        return imported, skipped, failed
+
+    def rebuild_rollups(self):
+        """Перераховує агрегати аналітики з усього архіву"""
+        import analytics
+
+        conn = self.open()
+        with self._lock, conn:
+            conn.execute('BEGIN IMMEDIATE')
+            analytics.rebuild(conn, self.onset_options)
+
+    def summary(self, today=None):
+        """Агрегати для /stats (analytics.read_summary)"""
+        import analytics
+
+        conn = self.open()
+        with self._lock:
+            return analytics.read_summary(conn, today)
+
+
+# Рядки старого текстового формату: префікс -> поле user_data
+_LINE_FIELDS = (
+    ('👤 ПІБ: ', 'pib'),
+    ('📅 Вік: ', 'vik'),
+    ('🗓 Дата заповнення: ', 'date'),
+    ('   Оніміння/поколювання: ', 'onіmіnnya'),
+    ('   Після травми: ', 'travma_detalі'),
+    ('   Травма: ', 'travma'),
+    ('   Інтенсивність (0-10): ', 'shkala_boly'),
+    ('   Погіршує: ', 'pohirshue'),
+    ('   Полегшує: ', 'polehshue'),
+    ('   Як лікували: ', 'ranishi_yak_likuvaly'),
+    ('   Спорт: ', 'sport_yakyi'),
+    ('   Ліки: ', 'likuvannya'),
+    ('   Фізіотерапія/масаж: ', 'fizioterapiya'),
+    ('   Зріст: ', 'zrist'),
+    ('   Вага: ', 'vaga'),
+    ('📱 Telegram: @', 'username'),
+    ('🆔 User ID: ', 'user_id'),
+)
+
+# Заголовок розділу -> поле, що стоїть першим рядком розділу
+_SECTION_FIELDS = {
+    '1️⃣ ДЕ САМЕ БОЛИТЬ?': 'de_bolit',
+    '2️⃣ КОЛИ ПОЯВИВСЯ БІЛЬ?': 'koly_zyavyvsya',
+    '3️⃣ ХАРАКТЕР БОЛЮ:': 'kharakter_boly',
+    '4️⃣ ЩО ПОГІРШУЄ/ПОЛЕГШУЄ:': None,
+    '5️⃣ РАНІШЕ ПОДІБНІ ЕПІЗОДИ:': 'ranishi_epizody',
+    '6️⃣ ЧЕРВОНІ ПРАПОРИ:': 'chervoni_prapory',
+    '7️⃣ СУПУТНІ ЗАХВОРЮВАННЯ:': 'suputni',
+    '8️⃣ РІВЕНЬ АКТИВНОСТІ:': 'aktyvnist',
+    '9️⃣ ПОТОЧНЕ ЛІКУВАННЯ:': None,
+    '🔟 АНТРОПОМЕТРИЧНІ ДАНІ:': None,
+}
+
+_FILENAME_RE = re.compile(r'survey_(?P<user_id>\d+|None)_(?P<ts>\d{8}_\d{6})\.txt$')
+
+
+def parse_text_survey(text, filename=''):
+    """Розбирає анкету у форматі format_survey_result(for_admin=True) назад у поля"""
+    record = {}
+    section_field = None
+    last_field = None
+    for line in text.split('\n'):
+        if not line.strip() or set(line) == {'='} or line.startswith('📋 '):
+            last_field = None
+            continue
+        if line in _SECTION_FIELDS:
+            section_field = _SECTION_FIELDS[line]
+            last_field = None
+            continue
+        for prefix, field in _LINE_FIELDS:
+            if line.startswith(prefix):
+                record[field] = line[len(prefix):]
+                last_field = field
+                break
+        else:
+            if section_field and section_field not in record and line.startswith('   '):
+                record[section_field] = line[3:]
+                last_field = section_field
+            elif last_field:
+                # Продовження багаторядкової відповіді (наприклад, "Деталі: ...")
+                record[last_field] += '\n' + line
+            else:
+                raise ValueError(f"невідомий рядок: {line!r}")
+
+    # Відновлюємо відповіді, які текстовий формат показував в іншому вигляді
+    if 'onіmіnnya' in record and record['onіmіnnya'] != 'Ні':
+        record['onіmіnnya_de'] = record['onіmіnnya']
+        record['onіmіnnya'] = 'Так'
+    if 'travma_detalі' in record:
+        record['travma'] = 'Так'
+    for field, suffix in (('zrist', ' см'), ('vaga', ' кг')):
+        if record.get(field, '').endswith(suffix):
+            record[field] = record[field][:-len(suffix)]
+    record = {key: value for key, value in record.items() if value not in ('Не вказано', 'невідомий')}
+    if 'user_id' in record:
+        try:
+            record['user_id'] = int(record['user_id'])
+        except ValueError:
+            del record['user_id']
+
+    match = _FILENAME_RE.search(filename)
+    if not match:
+        raise ValueError(f"неочікувана назва файлу: {filename}")
+    record['saved_at'] = datetime.strptime(match.group('ts'), '%Y%m%d_%H%M%S').isoformat(timespec='seconds')
+    return record
+
+
+def _main():
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Сховище анкет')
+    commands = parser.add_subparsers(dest='command', required=True)
+    importer = commands.add_parser('import', help='імпорт старих .txt анкет')
+    importer.add_argument('directory', nargs='?', default=os.environ.get('SURVEYS_DIR', 'surveys'))
+    importer.add_argument('--db', default=None, help='файл бази (за замовчуванням SURVEY_DB)')
+    rebuilder = commands.add_parser('rollup', help='перерахунок агрегатів аналітики з усього архіву')
+    rebuilder.add_argument('--db', default=None, help='файл бази (за замовчуванням SURVEY_DB)')
+    args = parser.parse_args()
+
+    from medical_bot import ONSET_OPTIONS, RED_FLAG_OPTIONS, SURVEY_DB
+    store = SurveyStore(args.db or SURVEY_DB, RED_FLAG_OPTIONS, ONSET_OPTIONS)
+    if args.command == 'import':
+        imported, skipped, failed = store.import_text_surveys(args.directory)
+        print(f"Імпортовано: {imported}, вже були в базі: {skipped}, з помилками: {failed}")
+    else:
+        store.rebuild_rollups()
+        print("Агрегати аналітики перераховано")
+    store.close()
+
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Фонове збереження підтверджених анкет (write-behind черга)
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+from metrics import PERSISTENCE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class TextFileSink:
+    """Запис анкет у текстові файли (по файлу на анкету) з одним fsync каталогу на пакет"""
+
+    def __init__(self, directory, render):
+        self.directory = directory
+        self.render = render
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+    def close(self):
+        pass
+
+    def write_batch(self, records):
+        os.makedirs(self.directory, exist_ok=True)
+        for record in records:
+            timestamp = record['saved_at'].replace('-', '').replace(':', '').replace('T', '_')
+            filename = os.path.join(self.directory, f"survey_{record.get('user_id')}_{timestamp}.txt")
+            with open(filename, 'w', encoding='utf-8') as f:
+                f.write(self.render(record, for_admin=True))
+                f.flush()
+                os.fsync(f.fileno())
+            logger.info(f"Анкету збережено: {filename}")
+        # fsync каталогу фіксує нові записи каталогу одним викликом на пакет
+        if hasattr(os, 'O_DIRECTORY'):
+            fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+
+class SurveyWriter:
+    """Черга збереження анкет: обробники лише ставлять анкету в чергу,
+    а запис пакетами (sink.write_batch) виконується окремим потоком.
+
+    Пакет, який не вдалося записати після max_retries повторів, записується поанкетно,
+    а анкети, що так і не записались, - у файл dead_letter (JSON lines), тож одна
+    некоректна анкета чи недоступне сховище не блокують чергу назавжди. Якщо sink
+    вміє шифрувати анкети (sink.seal, як SurveyArchive), у файл потрапляють лише
+    зашифровані анкети; у журнал - ніколи, лише користувач і час анкети.
+    """
+
+    def __init__(self, sink, max_backlog=1000, batch_size=50, retry_delay=1.0, max_retries=5,
+                 dead_letter=None, close_timeout=30.0):
+        self.sink = sink
+        self.max_backlog = max_backlog
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        self.dead_letter = dead_letter
+        self.close_timeout = close_timeout
+        self._queue = None
+        self._task = None
+        # Пакет, який зараз записується
+        self._batch = ()
+        # Виклики sink у потоці: close не закриває сховище, поки триває перерваний запис
+        self._sink_lock = threading.Lock()
+        # Метрики черги (для моніторингу зворотного тиску)
+        self.stats = {
+            'enqueued': 0,
+            'written': 0,
+            'write_errors': 0,
+            'dead_letter': 0,
+            'batches': 0,
+            'max_depth': 0,
+            'backpressure_waits': 0,
+            'backpressure_seconds': 0.0,
+        }
+
+    @property
+    def depth(self):
+        """Поточна кількість анкет у черзі"""
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self):
+        """Запускає фонову задачу запису"""
+        if self._task:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_backlog)
+        self._task = asyncio.create_task(self._run(), name='survey-writer')
+
+    async def enqueue(self, item):
+        """Ставить анкету в чергу; якщо черга повна — чекає на вільне місце"""
+        if not self._task:
+            await self.start()
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Зворотний тиск: не втрачаємо анкету, а чекаємо на writer
+            self.stats['backpressure_waits'] += 1
+            started = time.monotonic()
+            await self._queue.put(item)
+            self.stats['backpressure_seconds'] += time.monotonic() - started
+            logger.warning(f"Черга збереження анкет переповнена ({self.max_backlog})")
+        self.stats['enqueued'] += 1
+        self.stats['max_depth'] = max(self.stats['max_depth'], self._queue.qsize())
+
+    async def close(self):
+        """Дописує анкети з черги та зупиняє фонову задачу. Якщо за close_timeout секунд
+        черга не спорожніла (сховище недоступне), решта анкет записується в dead_letter"""
+        if not self._task:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), self.close_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Черга збереження анкет не спорожніла за {self.close_timeout:g} с")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # Скасування задачі не зупиняє потік запису: чекаємо, доки перерваний запис завершиться
+        idle = await asyncio.to_thread(self._sink_lock.acquire, True, self.close_timeout)
+        # Пакет, перерваний посеред запису, може опинитися і в сховищі, і в dead_letter:
+        # дубль краще за втрачену анкету
+        remaining = list(self._batch)
+        self._batch = ()
+        while not self._queue.empty():
+            remaining.append(self._queue.get_nowait())
+            self._queue.task_done()
+        if remaining:
+            await asyncio.to_thread(self._write_dead_letter, remaining, 'бот зупинено до збереження')
+        if idle:
+            try:
+                await asyncio.to_thread(self.sink.close)
+            except Exception as e:
+                logger.error(f"Помилка закриття сховища анкет: {e}")
+            finally:
+                self._sink_lock.release()
+        else:
+            logger.error(f"Запис пакета анкет не завершився за {self.close_timeout:g} с, сховище не закрито")
+        logger.info(f"Черга збереження анкет зупинена. Статистика: {self.stats}")
+
+    async def _run(self):
+        """Забирає анкети з черги пакетами і записує їх у потоці"""
+        # Сховище (міграції бази) відкривається у фоні, не затримуючи запуск бота;
+        # якщо не вдалося, запис пакета відкриє його повторно
+        try:
+            await asyncio.to_thread(self._locked, self.sink.open)
+        except Exception as e:
+            logger.error(f"Не вдалося відкрити сховище анкет: {e}")
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            self._batch = batch
+            try:
+                await self._write_until_done(batch)
+                # При скасуванні (close з таймаутом) пакет лишається в _batch для dead_letter
+                self._batch = ()
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write_until_done(self, batch):
+        """Повторює запис пакета до max_retries разів з наростаючою паузою; потім пише
+        анкети поодинці, а ті, що не записались, - у dead_letter"""
+        delay = self.retry_delay
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+            error = await self._write(batch)
+            if error is None:
+                return
+            retry = f"повтор через {delay:.0f} с" if attempt < self.max_retries else "спроби вичерпано"
+            logger.error(f"Помилка збереження анкет ({len(batch)} шт.): {error}; {retry}")
+        # Одна некоректна анкета не повинна затримувати решту пакета
+        failed = []
+        for record in batch:
+            if len(batch) == 1 or await self._write([record]) is not None:
+                failed.append(record)
+        if failed:
+            await asyncio.to_thread(self._write_dead_letter, failed, error)
+
+    async def _write(self, batch):
+        """Один запис пакета; повертає помилку або None"""
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._locked, self.sink.write_batch, batch)
+        except Exception as e:
+            self.stats['write_errors'] += 1
+            return e
+        PERSISTENCE_SECONDS.labels('surveys').observe(time.perf_counter() - started)
+        self.stats['written'] += len(batch)
+        self.stats['batches'] += 1
+        return None
+
+    def _locked(self, method, *args):
+        with self._sink_lock:
+            return method(*args)
+
+    def _write_dead_letter(self, records, reason):
+        """Дописує незбережені анкети у файл dead_letter (права 0600), зашифровані, якщо
+        sink це вміє. Якщо файлу немає або запис не вдався, анкети втрачено: журнал
+        отримує лише користувача і час анкети, без медичних даних"""
+        self.stats['dead_letter'] += len(records)
+        seal = getattr(self.sink, 'seal', None)
+        if self.dead_letter:
+            try:
+                lines = []
+                for record in records:
+                    entry = {'error': str(reason)}
+                    if seal:
+                        entry['sealed'] = seal(record)
+                    else:
+                        entry['record'] = record
+                    lines.append(json.dumps(entry, ensure_ascii=False) + '\n')
+                directory = os.path.dirname(self.dead_letter)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                fd = os.open(self.dead_letter, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+                with os.fdopen(fd, 'a', encoding='utf-8') as f:
+                    f.writelines(lines)
+                    f.flush()
+                    os.fsync(f.fileno())
+                logger.error(f"Не збережено анкет: {len(records)} ({reason}), їх записано в {self.dead_letter}")
+                return
+            except Exception as e:
+                logger.error(f"Не вдалося записати {self.dead_letter}: {e}")
+        for record in records:
+            logger.critical(f"Анкету втрачено ({reason}): користувач {record.get('user_id')}, {record.get('saved_at')}")
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Кілька ботів (клінік) в одному процесі: опис клінік з JSON-файлу TENANTS і
+спільний життєвий цикл їхніх Application в одному циклі подій.
+
+    [
+        {"name": "kyiv", "token_env": "KYIV_BOT_TOKEN", "admin_ids": [123456789]},
+        {"name": "lviv", "token": "123:ABC", "admin_ids": "987654321,555", "digest_interval": 86400,
+         "survey_ui": "inline", "questions": {"SPORT_YAKYI": false, "PIB": {"prompt": "Ваше ПІБ:"}}}
+    ]
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import signal
+from dataclasses import dataclass
+
+from telegram import Update
+
+from webhook import serve_webhooks
+
+logger = logging.getLogger(__name__)
+
+# Назва клініки - частина шляху webhook, назв файлів і ключів STATE_DB
+NAME_RE = re.compile(r'^[a-z0-9_-]{1,32}$')
+
+SURVEY_STORAGES = ('sqlite', 'txt', 'archive')
+SURVEY_UIS = ('reply', 'inline')
+# Тексти питання, які клініка може замінити (false замість словника - питання пропускається)
+QUESTION_FIELDS = ('prompt', 'edit_prompt', 'edit_label')
+
+
+@dataclass(frozen=True)
+class Tenant:
+    """Одна клініка: власний бот, лікарі, анкета і сховище анкет.
+    questions - стан питання -> False (пропустити) або словник нових текстів"""
+    name: str
+    token: str
+    admin_ids: tuple
+    surveys_dir: str
+    survey_db: str
+    survey_storage: str
+    digest_interval: float
+    survey_ui: str
+    questions: dict
+
+
+def _admin_ids(value):
+    if isinstance(value, str):
+        value = [item for item in value.split(',') if item.strip()]
+    return tuple(int(item) for item in value)
+
+
+def _choice(entry, field, default, allowed):
+    value = entry.get(field, default)
+    if value not in allowed:
+        raise ValueError(f"{field} має бути одним з {', '.join(allowed)}, а не {value!r}")
+    return value
+
+
+def _questions(value, states):
+    """Перевіряє перевизначення питань: відомі стани, False або словник рядків QUESTION_FIELDS"""
+    if not isinstance(value, dict):
+        raise ValueError("questions має бути об'єктом стан питання -> false або тексти")
+    for state, override in value.items():
+        if state not in states:
+            raise ValueError(f"невідоме питання {state!r}")
+        if override is False:
+            continue
+        if not isinstance(override, dict) or not override:
+            raise ValueError(f"питання {state}: очікується false або об'єкт з {', '.join(QUESTION_FIELDS)}")
+        for field, text in override.items():
+            if field not in QUESTION_FIELDS or not isinstance(text, str) or not text:
+                raise ValueError(f"питання {state}: некоректне поле {field!r}")
+    return dict(value)
+
+
+def load_tenants(path, surveys_dir='surveys', survey_storage='sqlite', digest_interval=0.0, survey_ui='reply',
+                 states=()):
+    """Клініки з JSON-файлу; не вказані каталог і сховище анкет - окремі для кожної
+    клініки в surveys_dir/<назва>. states - назви станів питань, які можна перевизначити
+    в questions. ValueError з описом, якщо опис некоректний"""
+    with open(path, encoding='utf-8') as f:
+        entries = json.load(f)
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"{path}: очікується непорожній список клінік")
+    tenants = []
+    for entry in entries:
+        name = entry.get('name', '')
+        if not NAME_RE.match(name):
+            raise ValueError(f"{path}: некоректна назва клініки {name!r} (a-z, 0-9, _ і -)")
+        token = entry.get('token') or os.environ.get(entry.get('token_env', ''), '')
+        if not token:
+            raise ValueError(f"{path}: не вказано токен бота клініки {name}")
+        directory = entry.get('surveys_dir') or os.path.join(surveys_dir, name)
+        try:
+            tenants.append(Tenant(
+                name=name,
+                token=token,
+                admin_ids=_admin_ids(entry.get('admin_ids', ())),
+                surveys_dir=directory,
+                survey_db=entry.get('survey_db') or os.path.join(directory, 'surveys.db'),
+                survey_storage=_choice(entry, 'survey_storage', survey_storage, SURVEY_STORAGES),
+                digest_interval=float(entry.get('digest_interval', digest_interval)),
+                survey_ui=_choice(entry, 'survey_ui', survey_ui, SURVEY_UIS),
+                questions=_questions(entry.get('questions', {}), states),
+            ))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"{path}: клініка {name}: {e}") from None
+    for field in ('name', 'token'):
+        values = [getattr(tenant, field) for tenant in tenants]
+        if len(set(values)) != len(values):
+            raise ValueError(f"{path}: клініки мають повторювані {field}")
+    return tenants
+
+
+async def _poll(applications):
+    """Polling усіх ботів до SIGINT/SIGTERM (аналог Application.run_polling для кількох ботів)"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    started = []
+    try:
+        for application in applications:
+            started.append(application)
+            await application.initialize()
+            if application.post_init:
+                await application.post_init(application)
+            await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+            await application.start()
+        logger.info(f"Polling {len(applications)} ботів")
+        await stop_event.wait()
+    finally:
+        for application in started:
+            if application.updater.running:
+                await application.updater.stop()
+            if application.running:
+                await application.stop()
+                if application.post_stop:
+                    await application.post_stop(application)
+        for application in started:
+            await application.shutdown()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+
+
+async def run_tenants(applications, webhook_url=None, port=8080, webhook_path='/telegram', secret_token=None,
+                      extra_stats=None, on_start=None, on_stop=None):
+    """Усі боти в одному циклі подій: applications - назва клініки -> Application.
+    У режимі webhook бот клініки отримує оновлення на <webhook_path>/<назва>.
+    on_start / on_stop - запуск і зупинка спільних для всіх ботів компонентів"""
+    if on_start:
+        await on_start()
+    try:
+        if webhook_url:
+            await serve_webhooks(
+                {f"{webhook_path.rstrip('/')}/{name}": application for name, application in applications.items()},
+                webhook_url, port=port, secret_token=secret_token, extra_stats=extra_stats,
+            )
+        else:
+            await _poll(list(applications.values()))
+    finally:
+        if on_stop:
+            await on_stop()
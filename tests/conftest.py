@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+"""
+Спільне для тестів: модулі бота імпортуються з кореня репозиторію, а medical_bot -
+без токена, метрик і STATE_DB (змінні оточення читаються при імпорті)
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '123456:TEST')
+os.environ['METRICS_PORT'] = ''
+os.environ['STATE_DB'] = ''
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Черга вихідних повідомлень: повтори після мережевих помилок і статистика
+доставки кожному адміністратору
+"""
+
+import asyncio
+
+from telegram.error import BadRequest, NetworkError
+
+from outbound import AdminFanout, OutboundScheduler
+
+
+class Bot:
+    """Бот без мережі: затримка і помилки задаються для кожного чату"""
+
+    token = '123456:TEST'
+
+    def __init__(self, delays=None, network_errors=None, bad_chats=()):
+        self.delays = delays or {}
+        self.network_errors = dict(network_errors or {})
+        self.bad_chats = bad_chats
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        await asyncio.sleep(self.delays.get(chat_id, 0))
+        if self.network_errors.get(chat_id):
+            self.network_errors[chat_id] -= 1
+            raise NetworkError('з\'єднання перервано')
+        if chat_id in self.bad_chats:
+            raise BadRequest('Chat not found')
+        self.sent.append((chat_id, text))
+        return chat_id
+
+
+def fanout_send(bot, admin_ids):
+    async def run():
+        scheduler = OutboundScheduler(chat_rate=100, chat_burst=100, base_delay=0.05)
+        fanout = AdminFanout(admin_ids, scheduler)
+        delivered = await fanout.send(bot, 'анкета')
+        await scheduler.close()
+        return delivered, fanout.stats, scheduler.stats
+    return asyncio.run(run())
+
+
+def test_per_admin_latency_and_retries():
+    bot = Bot(delays={1: 0, 2: 0.2}, network_errors={3: 1})
+    delivered, stats, scheduler_stats = fanout_send(bot, [1, 2, 3])
+    assert delivered == 3
+    assert sorted(chat_id for chat_id, _ in bot.sent) == [1, 2, 3]
+    assert [stats[admin_id]['retries'] for admin_id in (1, 2, 3)] == [0, 0, 1]
+    assert scheduler_stats['retries'] == 1
+    # Швидкий адміністратор не отримує затримку повільного
+    assert stats[1]['last_latency'] < 0.1 <= stats[2]['last_latency']
+    assert all(stats[admin_id]['sent'] == 1 and stats[admin_id]['failed'] == 0 for admin_id in (1, 2, 3))
+
+
+def test_failed_admin_is_counted_separately():
+    bot = Bot(bad_chats=(2,))
+    delivered, stats, _ = fanout_send(bot, [1, 2])
+    assert delivered == 1
+    assert stats[1]['sent'] == 1 and stats[1]['failed'] == 0
+    assert stats[2]['sent'] == 0 and stats[2]['failed'] == 1 and stats[2]['last_latency'] is None
+
+
+def test_no_admins():
+    delivered, stats, _ = fanout_send(Bot(), [])
+    assert delivered == 0 and stats == {}
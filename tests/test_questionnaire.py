@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Автомат анкети: уточнюючі питання, розбір чисел, пропуск перенесених відповідей
+і редагування; анкета клініки з перевизначеннями (TENANTS)
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from questionnaire import Branch, Question, Questionnaire
+from validation import AGE
+
+DONE = 'DONE'
+A, B, C, D = 1, 2, 3, 4
+
+QUESTIONS = [
+    Question(A, 'a', prompt="A?", next=B, keyboard=[['Так', 'Ні']], branches=(Branch(C, equals='Так'),),
+             edit_label='A'),
+    Question(B, 'b', prompt="B?", next=D, stable=True, edit_label='B'),
+    Question(C, 'a', prompt="C?", next=B, append="\nДеталі: {}"),
+    Question(D, 'd', prompt="D?", parse=AGE, stable=True, edit_label='D'),
+]
+
+
+class Chat:
+    """Повідомлення, які анкета надіслала пацієнту"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message, text, keyboard=None):
+        self.sent.append(text)
+
+
+def make_survey(chat, questions=QUESTIONS):
+    async def on_complete(update, context):
+        return DONE
+    return Questionnaire(questions, on_complete=on_complete, send=chat.send)
+
+
+def answer(survey, state, text, user_data):
+    message = SimpleNamespace(text=text)
+    update = SimpleNamespace(callback_query=None, message=message, effective_message=message)
+    context = SimpleNamespace(user_data=user_data)
+    return asyncio.run(survey.answer(survey.by_state[state], update, context))
+
+
+def test_branch_asks_clarification_and_appends_answer():
+    chat = Chat()
+    survey = make_survey(chat)
+    user_data = {}
+    assert answer(survey, A, 'Так', user_data) == C
+    assert answer(survey, C, 'зранку', user_data) == B
+    assert user_data['a'] == "Так\nДеталі: зранку"
+    assert chat.sent == ["C?", "B?"]
+
+
+def test_without_branch_goes_to_next_question():
+    survey = make_survey(Chat())
+    assert answer(survey, A, 'Ні', {}) == B
+
+
+def test_number_is_parsed_once_or_question_repeated():
+    chat = Chat()
+    survey = make_survey(chat)
+    user_data = {}
+    assert answer(survey, D, 'багато', user_data) == D
+    assert chat.sent == [AGE.error]
+    assert 'd' not in user_data
+    assert answer(survey, D, 'сорок', user_data) == DONE
+    assert user_data['d'] == '40' and user_data['d_value'] == 40
+
+
+def test_prefill_skips_stable_questions():
+    survey = make_survey(Chat())
+    user_data = {}
+    assert survey.prefill(user_data, {'b': 'старе', 'd': '40', 'd_value': 40, 'a': 'Так'})
+    # Переносяться лише стабільні відповіді
+    assert user_data == {'b': 'старе', 'd': '40', 'd_value': 40, 'prefilled': True}
+    assert answer(survey, A, 'Ні', user_data) == DONE
+    survey.clear_prefill(user_data)
+    assert not {'b', 'd', 'd_value', 'prefilled'} & set(user_data)
+    assert answer(survey, A, 'Ні', user_data) == B
+
+
+def test_prefill_without_previous_answers():
+    survey = make_survey(Chat())
+    user_data = {}
+    assert not survey.prefill(user_data, {'a': 'Так'})
+    assert user_data == {}
+
+
+def test_editing_returns_to_confirmation():
+    survey = make_survey(Chat())
+    user_data = {'editing': True}
+    assert answer(survey, B, 'нове', user_data) == DONE
+    assert user_data['editing'] is False
+    # Уточнююче питання ставиться і в режимі редагування
+    user_data['editing'] = True
+    assert answer(survey, A, 'Так', user_data) == C
+
+
+def test_unknown_transition_is_rejected():
+    with pytest.raises(ValueError):
+        make_survey(Chat(), [Question(A, 'a', prompt="A?", next=B)])
+
+
+def test_clinic_question_overrides():
+    import medical_bot
+
+    names = medical_bot.STATE_NAMES
+    questions = medical_bot.survey_questions({
+        'PIB': False, 'ONIMINNYA': False, 'SPORT_YAKYI': False, 'VIK': {'prompt': 'Вік?'},
+    })
+    states = [names[question.state] for question in questions]
+    assert states[0] == 'VIK' and questions[0].prompt == 'Вік?'
+    # Уточнення до пропущеного питання недосяжне і прибирається
+    assert not {'PIB', 'ONIMINNYA', 'ONIMINNYA_DE', 'SPORT_YAKYI'} & set(states)
+    by_name = {names[question.state]: question for question in questions}
+    assert names[by_name['DE_BOLIT'].next] == 'KOLY_ZYAVYVSYA'
+    assert not by_name['AKTYVNIST'].branches
+    # Анкета компілюється: усі переходи ведуть до питань анкети
+    make_survey(Chat(), questions)
+
+
+def test_clinic_cannot_skip_every_question():
+    import medical_bot
+
+    with pytest.raises(ValueError):
+        medical_bot.survey_questions({medical_bot.STATE_NAMES[q.state]: False for q in medical_bot.SURVEY_QUESTIONS})
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Еталонний вивід format_survey_result: шаблон (survey_render.py) дає той самий текст,
+що й попередня реалізація, на анкетах, які вмикають кожну умовну гілку
+"""
+
+import itertools
+
+import pytest
+
+from survey_render import format_survey_result
+
+
+def legacy_format_survey_result(user_data, for_admin=False):
+    """Попередня реалізація (40 конкатенацій) — еталон для порівняння"""
+    result = "📋 АНКЕТА ПАЦІЄНТА З БОЛЕМ У СПИНІ\n"
+    result += "=" * 40 + "\n\n"
+
+    result += f"👤 ПІБ: {user_data.get('pib', 'Не вказано')}\n"
+    result += f"📅 Вік: {user_data.get('vik', 'Не вказано')}\n"
+    result += f"🗓 Дата заповнення: {user_data.get('date', 'Не вказано')}\n\n"
+
+    result += "1️⃣ ДЕ САМЕ БОЛИТЬ?\n"
+    result += f"   {user_data.get('de_bolit', 'Не вказано')}\n"
+    if user_data.get('onіmіnnya') == 'Так':
+        result += f"   Оніміння/поколювання: {user_data.get('onіmіnnya_de', 'Не вказано')}\n"
+    else:
+        result += f"   Оніміння/поколювання: {user_data.get('onіmіnnya', 'Не вказано')}\n"
+    result += "\n"
+
+    result += "2️⃣ КОЛИ ПОЯВИВСЯ БІЛЬ?\n"
+    result += f"   {user_data.get('koly_zyavyvsya', 'Не вказано')}\n"
+    if user_data.get('travma') == 'Так':
+        result += f"   Після травми: {user_data.get('travma_detalі', 'Не вказано')}\n"
+    else:
+        result += f"   Травма: {user_data.get('travma', 'Не вказано')}\n"
+    result += "\n"
+
+    result += "3️⃣ ХАРАКТЕР БОЛЮ:\n"
+    result += f"   {user_data.get('kharakter_boly', 'Не вказано')}\n"
+    result += f"   Інтенсивність (0-10): {user_data.get('shkala_boly', 'Не вказано')}\n\n"
+
+    result += "4️⃣ ЩО ПОГІРШУЄ/ПОЛЕГШУЄ:\n"
+    result += f"   Погіршує: {user_data.get('pohirshue', 'Не вказано')}\n"
+    result += f"   Полегшує: {user_data.get('polehshue', 'Не вказано')}\n\n"
+
+    result += "5️⃣ РАНІШЕ ПОДІБНІ ЕПІЗОДИ:\n"
+    result += f"   {user_data.get('ranishi_epizody', 'Не вказано')}\n"
+    if user_data.get('ranishi_epizody') == 'Так':
+        result += f"   Як лікували: {user_data.get('ranishi_yak_likuvaly', 'Не вказано')}\n"
+    result += "\n"
+
+    result += "6️⃣ ЧЕРВОНІ ПРАПОРИ:\n"
+    result += f"   {user_data.get('chervoni_prapory', 'Немає')}\n\n"
+
+    result += "7️⃣ СУПУТНІ ЗАХВОРЮВАННЯ:\n"
+    result += f"   {user_data.get('suputni', 'Немає')}\n\n"
+
+    result += "8️⃣ РІВЕНЬ АКТИВНОСТІ:\n"
+    result += f"   {user_data.get('aktyvnist', 'Не вказано')}\n"
+    if user_data.get('sport_yakyi') and user_data.get('sport_yakyi') != 'Не займаюся спортом':
+        result += f"   Спорт: {user_data.get('sport_yakyi')}\n"
+    result += "\n"
+
+    result += "9️⃣ ПОТОЧНЕ ЛІКУВАННЯ:\n"
+    result += f"   Ліки: {user_data.get('likuvannya', 'Не вказано')}\n"
+    result += f"   Фізіотерапія/масаж: {user_data.get('fizioterapiya', 'Не вказано')}\n"
+
+    result += "\n"
+    result += "🔟 АНТРОПОМЕТРИЧНІ ДАНІ:\n"
+    result += f"   Зріст: {user_data.get('zrist', 'Не вказано')} см\n"
+    result += f"   Вага: {user_data.get('vaga', 'Не вказано')} кг\n"
+
+    result += "\n" + "=" * 40
+
+    # Додаємо контактну інформацію тільки для адміністраторів
+    if for_admin:
+        result += f"\n📱 Telegram: @{user_data.get('username', 'невідомий')}"
+        result += f"\n🆔 User ID: {user_data.get('user_id', 'невідомий')}"
+
+    return result
+
+
+BASE_SURVEY = {
+    'username': 'patient', 'user_id': 123456789, 'date': '18.10.2026', 'editing': False,
+    'pib': 'Шевченко Тарас Григорович', 'vik': '42', 'de_bolit': 'Поперек',
+    'onіmіnnya': 'Ні', 'koly_zyavyvsya': 'Більше 3 місяців (хронічний)', 'travma': 'Ні',
+    'kharakter_boly': 'Ниючий', 'shkala_boly': '6', 'pohirshue': 'Сидіння',
+    'polehshue': 'Лежання', 'ranishi_epizody': 'Ні', 'chervoni_prapory': 'Немає таких симптомів',
+    'suputni': 'Немає супутніх захворювань', 'aktyvnist': 'Сидяча робота',
+    'likuvannya': 'Не приймаю ліків', 'fizioterapiya': 'Ні', 'zrist': '180', 'vaga': '82',
+}
+
+# Варіації, що вмикають кожну умовну гілку шаблону
+VARIATIONS = [
+    {},
+    {'onіmіnnya': 'Так', 'onіmіnnya_de': 'Ліва стопа'},
+    {'onіmіnnya': 'Так'},
+    {'travma': 'Так', 'travma_detalі': 'Впав на сходах'},
+    {'travma': 'Так'},
+    {'ranishi_epizody': 'Так', 'ranishi_yak_likuvaly': 'Масаж'},
+    {'ranishi_epizody': 'Так'},
+    {'aktyvnist': 'Займаюся спортом', 'sport_yakyi': 'Біг'},
+    {'aktyvnist': 'Займаюся спортом', 'sport_yakyi': 'Не займаюся спортом'},
+    {'de_bolit': 'Біль віддає у ногу\nДеталі: до коліна'},
+    {'pib': '{фігурні} дужки %s'},
+]
+
+
+def golden_surveys():
+    yield {}
+    yield {'username': 'x', 'user_id': 1}
+    for variation in VARIATIONS:
+        yield {**BASE_SURVEY, **variation}
+    for first, second in itertools.combinations(VARIATIONS[1:9], 2):
+        yield {**BASE_SURVEY, **first, **second}
+    for field in BASE_SURVEY:
+        yield {key: value for key, value in BASE_SURVEY.items() if key != field}
+
+
+@pytest.mark.parametrize('for_admin', (False, True))
+@pytest.mark.parametrize('survey', list(golden_surveys()))
+def test_matches_legacy_output(survey, for_admin):
+    assert format_survey_result(survey, for_admin) == legacy_format_survey_result(survey, for_admin)
+
+
+def test_memoized_body_does_not_leak_between_surveys():
+    first = format_survey_result(BASE_SURVEY, True)
+    other = format_survey_result({**BASE_SURVEY, 'pib': 'Інший пацієнт'}, True)
+    assert 'Інший пацієнт' in other and 'Інший пацієнт' not in first
+    assert format_survey_result(BASE_SURVEY, True) == first
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""
+Вивантаження неактивних сесій: черги TTL і сесії, чиє оновлення ще обробляється
+"""
+
+from session_cache import SessionCache
+
+
+def test_sweep_skips_sessions_being_handled():
+    cache = SessionCache(ttl=10, state_ttl={'PIB': 0})
+    for user_id, state in ((1, None), (2, None), (3, 'PIB'), (4, None)):
+        cache._touch(user_id, (user_id, user_id), state)
+    now = max(cache._by_ttl[10].values())
+    cache._handling.add(1)
+
+    expired = cache._pop_expired(now + 10)
+    assert [user_id for user_id, _ in expired] == [2, 4]
+    # Сесія з обробником, що ще працює, лишається і вважається щойно активною;
+    # для стану з TTL 0 сесія не вивантажується взагалі
+    assert list(cache._lru) == [1, 3]
+    assert cache._by_ttl[10] == {1: now + 10}
+    assert cache.stats['resident'] == 2
+
+    cache._handling.discard(1)
+    assert [user_id for user_id, _ in cache._pop_expired(now + 20)] == [1]
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Зашифрований архів анкет: запис і читання, поворот ключів, виявлення підміни
+фрагментів, зашифрований файл незбережених анкет
+"""
+
+import asyncio
+import json
+import os
+
+import pytest
+
+pytest.importorskip('cryptography')
+
+from survey_archive import CHUNK, SEGMENT, SurveyArchive  # noqa: E402
+from survey_writer import SurveyWriter  # noqa: E402
+
+
+def record(user_id, **answers):
+    return {'user_id': user_id, 'saved_at': f'2026-01-05T10:00:{user_id:02d}', 'pib': f'Пацієнт {user_id}', **answers}
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = SurveyArchive(str(tmp_path / 'archive'), str(tmp_path / 'archive.key'))
+    yield archive
+    archive.close()
+
+
+def test_round_trip(archive):
+    batches = [[record(i) for i in range(start, start + 3)] for start in (0, 3, 6)]
+    for batch in batches:
+        archive.write_batch(batch)
+    archive.close()
+    assert list(archive.iter_records()) == [item for batch in batches for item in batch]
+    assert oct(os.stat(archive.keys.path).st_mode & 0o777) == '0o600'
+    with open(archive.segments()[0], 'rb') as f:
+        assert 'Пацієнт'.encode() not in f.read()
+
+
+def test_rotate_and_prune_keys(archive):
+    archive.write_batch([record(1)])
+    archive.close()
+    old_key = archive.keys.active
+    new_key = archive.keys.add()
+    archive.write_batch([record(2)])
+    archive.close()
+    assert archive.key_usage() == {old_key: 1, new_key: 1}
+    # Старий ключ ще потрібен для читання
+    assert archive.prune_keys() == []
+
+    stats = archive.rotate()
+    assert stats['segments'] == 1 and stats['chunks'] == 1
+    assert archive.key_usage() == {new_key: 2}
+    assert archive.prune_keys() == [old_key]
+    assert list(SurveyArchive(archive.directory, archive.keys.path).iter_records()) == [record(1), record(2)]
+
+
+def test_tampered_chunk_is_rejected(archive):
+    archive.write_batch([record(1)])
+    archive.close()
+    path = archive.segments()[0]
+    with open(path, 'r+b') as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 1]))
+    with pytest.raises(ValueError):
+        list(archive.iter_records())
+
+
+def test_swapped_chunks_are_rejected(archive):
+    archive.write_batch([record(1)])
+    archive.write_batch([record(2)])
+    archive.close()
+    path = archive.segments()[0]
+    with open(path, 'rb') as f:
+        data = f.read()
+    header, body = data[:SEGMENT.size], data[SEGMENT.size:]
+    first = CHUNK.size + CHUNK.unpack(body[:CHUNK.size])[1]
+    with open(path, 'wb') as f:
+        f.write(header + body[first:] + body[:first])
+    with pytest.raises(ValueError):
+        list(archive.iter_records())
+
+
+def test_seal_round_trip(archive):
+    sealed = archive.seal(record(1, chervoni_prapory='Температура'))
+    assert 'Температура' not in sealed and 'Пацієнт' not in sealed
+    assert archive.unseal(sealed) == record(1, chervoni_prapory='Температура')
+
+
+class FailingArchive(SurveyArchive):
+    """Архів, у який не вдається дописати жодного пакета (диск недоступний)"""
+
+    def write_batch(self, records):
+        raise OSError('диск недоступний')
+
+
+def test_dead_letters_are_sealed_and_imported(tmp_path):
+    directory, key_file = str(tmp_path / 'archive'), str(tmp_path / 'archive.key')
+    dead_letter = str(tmp_path / 'failed_surveys.jsonl')
+    records = [record(1, pib='Іваненко Іван'), record(2)]
+
+    async def fail():
+        writer = SurveyWriter(FailingArchive(directory, key_file), retry_delay=0, max_retries=0,
+                              dead_letter=dead_letter)
+        for item in records:
+            await writer.enqueue(item)
+        await writer.close()
+        return writer.stats
+
+    assert asyncio.run(fail())['dead_letter'] == 2
+    with open(dead_letter, encoding='utf-8') as f:
+        text = f.read()
+    assert 'Іваненко' not in text
+    assert all('sealed' in json.loads(line) for line in text.splitlines())
+
+    archive = SurveyArchive(directory, key_file)
+    assert archive.import_failed(dead_letter) == 2
+    assert not os.path.exists(dead_letter)
+    assert list(archive.iter_records()) == records
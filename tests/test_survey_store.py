@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Сховище анкет: міграції схеми, запис пакета однією транзакцією, індекси
+і агрегати аналітики
+"""
+
+import sqlite3
+from datetime import date
+
+import pytest
+
+import analytics
+from survey_store import SCHEMA_VERSION, SurveyStore
+
+RED_FLAGS = ('Температура', 'Онкологія в анамнезі')
+ONSET = ('До 6 тижнів (гострий)', 'Більше 3 місяців (хронічний)')
+
+
+def record(user_id, saved_at, **answers):
+    return {'user_id': user_id, 'saved_at': saved_at, 'pib': f'Пацієнт {user_id}', **answers}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SurveyStore(str(tmp_path / 'surveys.db'), RED_FLAGS, ONSET)
+    yield store
+    store.close()
+
+
+def rollups(store, period):
+    return {
+        (bucket, metric, value): count
+        for bucket, metric, value, count in store.open().execute(
+            'SELECT bucket, metric, value, count FROM survey_rollups WHERE period = ?', (period,))
+    }
+
+
+def test_new_database_has_current_schema(store):
+    assert store.open().execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+
+
+def test_write_batch_stores_and_indexes(store):
+    store.write_batch([
+        record(1, '2026-01-05T10:00:00', chervoni_prapory='Температура, біль', shkala_boly='7'),
+        record(2, '2026-01-05T11:00:00', chervoni_prapory='Немає таких симптомів'),
+        record(1, '2026-01-06T09:00:00', kharakter_boly='Пекучий'),
+    ])
+    assert store.last_id() == 3
+    assert store.latest_for_patient(1)['saved_at'] == '2026-01-06T09:00:00'
+    assert [survey['survey_id'] for survey in store.for_patient(1)] == [3, 1]
+    assert [survey['survey_id'] for survey in store.with_red_flags()] == [1]
+    assert [survey['survey_id'] for survey in store.search('пекуч')] == [3]
+    assert [survey['user_id'] for survey in store.search('Пацієнт 2')] == [2]
+
+
+def test_failed_batch_leaves_no_trace(store):
+    store.write_batch([record(1, '2026-01-05T10:00:00')])
+    before = rollups(store, 'all')
+    with pytest.raises(KeyError):
+        # Друга анкета без saved_at: пакет не записується частково
+        store.write_batch([record(2, '2026-01-05T11:00:00'), {'user_id': 3}])
+    assert store.last_id() == 1
+    assert store.latest_for_patient(2) is None
+    assert rollups(store, 'all') == before
+
+
+def test_rollups_bucket_typed_onset_and_iso_weeks(store):
+    store.write_batch([
+        record(1, '2025-12-31T10:00:00', koly_zyavyvsya=ONSET[0]),
+        record(2, '2026-01-01T10:00:00', koly_zyavyvsya='з минулого вівторка'),
+        record(3, '2026-01-04T23:00:00', koly_zyavyvsya='третій день'),
+        record(4, '2026-01-05T08:00:00'),
+    ])
+    assert rollups(store, 'all')[('', 'onset', analytics.OTHER)] == 2
+    assert rollups(store, 'all')[('', 'onset', ONSET[0])] == 1
+    assert not any('день' in value or 'вівторка' in value for _, _, value in rollups(store, 'all'))
+    weeks = {bucket: count for (bucket, metric, _), count in rollups(store, 'week').items() if metric == 'surveys'}
+    # Тиждень з понеділка 29.12.2025 не розривається на 1 січня
+    assert weeks == {'2025-12-29': 3, '2026-01-05': 1}
+    summary = store.summary(date(2026, 1, 4))
+    assert summary['week']['surveys'][''][0] == 3
+    text = analytics.format_summary(summary, RED_FLAGS, ONSET)
+    assert 'третій день' not in text and f'{analytics.OTHER} 2' in text
+
+
+def test_incremental_rollups_match_rebuild(store):
+    for day in range(1, 8):
+        store.write_batch([record(user_id, f'2026-02-0{day}T12:00:00', shkala_boly=str(user_id % 11),
+                                  koly_zyavyvsya=ONSET[user_id % 2], zrist='180', vaga=str(60 + user_id))
+                           for user_id in range(day * 10, day * 10 + 5)])
+    incremental = {period: rollups(store, period) for period in ('all', 'week', 'day')}
+    store.rebuild_rollups()
+    assert {period: rollups(store, period) for period in incremental} == incremental
+
+
+def test_migration_rebuilds_rollups(tmp_path):
+    path = str(tmp_path / 'surveys.db')
+    store = SurveyStore(path, RED_FLAGS, ONSET)
+    store.write_batch([record(1, '2026-01-01T10:00:00', koly_zyavyvsya='секрет')])
+    store.close()
+    # Агрегати у форматі версії 4: тиждень strftime('%Y-W%W'), тривалість болю - текст пацієнта
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE survey_rollups SET bucket = '2026-W00' WHERE period = 'week'")
+    conn.execute("UPDATE survey_rollups SET value = 'секрет' WHERE metric = 'onset'")
+    conn.execute('PRAGMA user_version = 4')
+    conn.commit()
+    conn.close()
+
+    store = SurveyStore(path, RED_FLAGS, ONSET)
+    try:
+        assert store.open().execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+        assert ('2025-12-29', 'surveys', '') in rollups(store, 'week')
+        assert ('', 'onset', analytics.OTHER) in rollups(store, 'all')
+        assert not [key for key in rollups(store, 'all') if key[2] == 'секрет']
+    finally:
+        store.close()
+
+
+def test_reopening_current_schema_does_not_migrate(tmp_path):
+    path = str(tmp_path / 'surveys.db')
+    store = SurveyStore(path)
+    store.write_batch([record(1, '2026-01-01T10:00:00')])
+    store.close()
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE survey_rollups SET count = 100 WHERE period = 'all' AND metric = 'surveys'")
+    conn.commit()
+    conn.close()
+    store = SurveyStore(path)
+    try:
+        assert rollups(store, 'all')[('', 'surveys', '')] == 100
+    finally:
+        store.close()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Опис клінік (TENANTS): значення за замовчуванням і перевірка некоректних описів
+"""
+
+import json
+
+import pytest
+
+from tenants import load_tenants
+
+STATES = ('PIB', 'SPORT_YAKYI')
+
+
+def load(tmp_path, entries, **kwargs):
+    path = tmp_path / 'tenants.json'
+    path.write_text(json.dumps(entries), encoding='utf-8')
+    return load_tenants(str(path), str(tmp_path / 'surveys'), states=STATES, **kwargs)
+
+
+def test_defaults_and_overrides(tmp_path, monkeypatch):
+    monkeypatch.setenv('KYIV_BOT_TOKEN', '1:KYIV')
+    kyiv, lviv = load(tmp_path, [
+        {'name': 'kyiv', 'token_env': 'KYIV_BOT_TOKEN', 'admin_ids': '1, 2'},
+        {'name': 'lviv', 'token': '2:LVIV', 'admin_ids': [3], 'survey_storage': 'txt', 'survey_ui': 'inline',
+         'questions': {'SPORT_YAKYI': False, 'PIB': {'prompt': 'Ваше ПІБ:'}}},
+    ], survey_storage='sqlite')
+    assert kyiv.token == '1:KYIV' and kyiv.admin_ids == (1, 2)
+    assert kyiv.survey_storage == 'sqlite' and kyiv.survey_ui == 'reply' and kyiv.questions == {}
+    assert kyiv.survey_db == str(tmp_path / 'surveys' / 'kyiv' / 'surveys.db')
+    assert lviv.survey_storage == 'txt' and lviv.survey_ui == 'inline'
+    assert lviv.questions == {'SPORT_YAKYI': False, 'PIB': {'prompt': 'Ваше ПІБ:'}}
+
+
+@pytest.mark.parametrize('entry', [
+    {'name': 'Kyiv', 'token': '1:A'},
+    {'name': 'kyiv'},
+    {'name': 'kyiv', 'token': '1:A', 'admin_ids': 'abc'},
+    {'name': 'kyiv', 'token': '1:A', 'survey_storage': 'sqlite3'},
+    {'name': 'kyiv', 'token': '1:A', 'survey_ui': 'buttons'},
+    {'name': 'kyiv', 'token': '1:A', 'questions': {'VAGA': False}},
+    {'name': 'kyiv', 'token': '1:A', 'questions': {'PIB': {'hint': 'текст'}}},
+    {'name': 'kyiv', 'token': '1:A', 'questions': {'PIB': True}},
+])
+def test_invalid_entry(tmp_path, entry):
+    with pytest.raises(ValueError):
+        load(tmp_path, [entry])
+
+
+def test_duplicate_tokens(tmp_path):
+    with pytest.raises(ValueError, match='token'):
+        load(tmp_path, [{'name': 'kyiv', 'token': '1:A'}, {'name': 'lviv', 'token': '1:A'}])
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Розбір числових відповідей: цифри, слова, одиниці виміру і межі
+"""
+
+import pytest
+
+from validation import AGE, HEIGHT, PAIN, WEIGHT, InvalidAnswer, NumberAnswer, format_number, normalize_record
+
+
+@pytest.mark.parametrize('parse, text, expected', [
+    (AGE, '45', 45),
+    (AGE, ' 45 років ', 45),
+    (AGE, 'сорок два', 42),
+    (AGE, "п’ятдесят", 50),
+    (PAIN, '0', 0),
+    (PAIN, '10', 10),
+    (PAIN, 'сім', 7),
+    (HEIGHT, '175', 175),
+    (HEIGHT, '175 см', 175),
+    (HEIGHT, '1,83 м', 183),
+    (HEIGHT, '1.755m', 175.5),
+    (WEIGHT, '72,5', 72.5),
+    (WEIGHT, '80 кг.', 80),
+    (WEIGHT, 'сто двадцять кг', 120),
+])
+def test_parses_valid_answers(parse, text, expected):
+    number = parse(text)
+    assert number == expected
+    assert type(number) is type(expected)
+
+
+@pytest.mark.parametrize('parse, text', [
+    (AGE, '0'),
+    (AGE, '121'),
+    (AGE, '45.5'),
+    (AGE, 'багато'),
+    (AGE, ''),
+    (PAIN, '11'),
+    (PAIN, '-1'),
+    (HEIGHT, '175 кг'),
+    (HEIGHT, '99'),
+    (WEIGHT, '301'),
+    (WEIGHT, '70 фунтів'),
+])
+def test_rejects_invalid_answers(parse, text):
+    with pytest.raises(InvalidAnswer) as error:
+        parse(text)
+    # Текст винятку показується пацієнту
+    assert str(error.value) == parse.error
+
+
+def test_parse_returns_none_for_unknown_unit():
+    answer = NumberAnswer(0, 10, 'помилка', units={'бал': 1})
+    assert answer.parse('5 бал') == 5
+    assert answer.parse('5 балів') is None
+
+
+def test_format_number():
+    assert format_number(175) == '175'
+    assert format_number(72.5) == '72.5'
+
+
+def test_normalize_record_adds_values_once():
+    record = normalize_record({'vik': '40', 'zrist': '1,8 м', 'vaga': 'не знаю', 'shkala_boly_value': 3,
+                               'shkala_boly': '5'})
+    assert record['vik_value'] == 40
+    assert record['zrist_value'] == 180
+    assert 'vaga_value' not in record
+    # Уже розібране значення не перераховується
+    assert record['shkala_boly_value'] == 3
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Webhook: секретний токен, некоректні оновлення, 503 при переповненні і
+послідовна обробка оновлень одного користувача
+"""
+
+import asyncio
+import json
+
+from telegram.ext import Application
+
+from http_server import Request
+from webhook import SECRET_HEADER, PerUserUpdateProcessor, WebhookServer, pending_updates
+
+TOKEN = '123456:TEST'
+
+
+def application(queue_size=0, concurrent_updates=4):
+    return (
+        Application.builder().token(TOKEN).updater(None)
+        .update_queue(asyncio.Queue(maxsize=queue_size))
+        .concurrent_updates(PerUserUpdateProcessor(concurrent_updates))
+        .build()
+    )
+
+
+def update_body(update_id, user_id=1):
+    return json.dumps({'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'text': 'так', 'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Пацієнт'},
+    }}).encode()
+
+
+def post(server, app, body, secret=None):
+    headers = {SECRET_HEADER: secret} if secret is not None else {}
+    return asyncio.run(server._handle_update(app, Request('POST', '/telegram', '', headers, body)))[0]
+
+
+def user_update(user_id):
+    return type('Update', (), {'effective_user': type('User', (), {'id': user_id})()})()
+
+
+def test_secret_token():
+    app = application()
+    server = WebhookServer(app, secret_token='s3cret')
+    assert post(server, app, update_body(1)) == 403
+    assert post(server, app, update_body(1), 'wrong') == 403
+    assert post(server, app, update_body(1), 's3cret') == 200
+    assert server.stats['forbidden'] == 2 and server.stats['accepted'] == 1
+
+
+def test_bad_request():
+    app = application()
+    server = WebhookServer(app)
+    assert post(server, app, b'not json') == 400
+    assert post(server, app, b'{"message": {}}') == 400
+    assert server.stats['bad_request'] == 2
+
+
+def test_full_queue_returns_503():
+    app = application(queue_size=2)
+    server = WebhookServer(app)
+    assert [post(server, app, update_body(i)) for i in range(4)] == [200, 200, 503, 503]
+    assert server.stats['rejected_full'] == 2
+
+
+def test_updates_in_processor_count_towards_limit():
+    async def run():
+        app = application(queue_size=2)
+        server = WebhookServer(app)
+        processor = app.update_processor
+        release = asyncio.Event()
+        # Application вже забрав оновлення з черги: вони чекають у процесорі
+        tasks = [asyncio.create_task(processor.process_update(user_update(user_id), release.wait()))
+                 for user_id in (1, 1)]
+        await asyncio.sleep(0)
+        assert pending_updates(app) == 2
+        rejected = await server._handle_update(app, Request('POST', '/telegram', '', {}, update_body(1)))
+        release.set()
+        await asyncio.gather(*tasks)
+        accepted = await server._handle_update(app, Request('POST', '/telegram', '', {}, update_body(2)))
+        return rejected[0], accepted[0], processor.in_flight
+    assert asyncio.run(run()) == (503, 200, 0)
+
+
+def test_user_updates_are_serialized_without_blocking_others():
+    async def run():
+        processor = PerUserUpdateProcessor(4)
+        order = []
+        slow = asyncio.Event()
+
+        async def handle(name, event=None):
+            order.append(f'{name} start')
+            if event:
+                await event.wait()
+            order.append(f'{name} end')
+
+        tasks = [
+            asyncio.create_task(processor.process_update(user_update(1), handle('1a', slow))),
+            asyncio.create_task(processor.process_update(user_update(1), handle('1b'))),
+            asyncio.create_task(processor.process_update(user_update(2), handle('2'))),
+        ]
+        await asyncio.sleep(0.01)
+        # Другий користувач не чекає на повільне оновлення першого, а друге оновлення
+        # першого користувача - чекає
+        assert order == ['1a start', '2 start', '2 end']
+        slow.set()
+        await asyncio.gather(*tasks)
+        return order, processor._locks
+    order, locks = asyncio.run(run())
+    assert order == ['1a start', '2 start', '2 end', '1a end', '1b start', '1b end']
+    assert locks == {}
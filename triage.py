@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Тріаж червоних прапорів: відповідь перевіряється одразу після надходження,
+а про тривожні симптоми лікарі дізнаються до підтвердження всієї анкети
+"""
+
+import logging
+import re
+import time
+
+from metrics import TRIAGE_SECONDS
+from outbound import URGENT
+
+logger = logging.getLogger(__name__)
+
+# Ключ user_data зі списком прапорів, про які лікарів вже сповіщено
+ALERTED_KEY = 'triage_alerted'
+
+
+class RedFlagMatcher:
+    """Один скомпільований регулярний вираз на всі варіанти червоних прапорів
+    (пошук підрядка без урахування регістру, як у extract_red_flags)"""
+
+    def __init__(self, options):
+        self.options = tuple(options)
+        self._by_lower = {option.lower(): option for option in self.options}
+        # Довші варіанти першими, щоб альтернатива не зупинялась на коротшому префіксі
+        alternatives = sorted(self.options, key=len, reverse=True)
+        self._pattern = re.compile('|'.join(re.escape(option) for option in alternatives), re.IGNORECASE)
+
+    def match(self, text):
+        """Варіанти, згадані у відповіді, в порядку self.options"""
+        if not text or not self.options:
+            return []
+        found = {self._by_lower[m.group(0).lower()] for m in self._pattern.finditer(text)}
+        return [option for option in self.options if option in found]
+
+
+def format_alert(user_data, flags):
+    """Коротке термінове повідомлення лікарям"""
+    return (
+        "🚨 ЧЕРВОНІ ПРАПОРИ ⚠️\n\n"
+        f"👤 ПІБ: {user_data.get('pib', 'Не вказано')}\n"
+        f"📅 Вік: {user_data.get('vik', 'Не вказано')}\n"
+        f"⚠️ {', '.join(flags)}\n\n"
+        "Пацієнт ще заповнює анкету, повна анкета надійде після підтвердження."
+        f"\n📱 Telegram: @{user_data.get('username', 'невідомий')}"
+        f"\n🆔 User ID: {user_data.get('user_id', 'невідомий')}"
+    )
+
+
+class Triage:
+    """Перевіряє відповіді на питання keys і терміново сповіщає лікарів про нові червоні прапори.
+
+    Час від отримання відповіді до доставки сповіщення всім лікарям
+    накопичується в stats (/healthz) і гістограмі bot_triage_alert_seconds.
+    """
+
+    def __init__(self, fanout, options, keys=('chervoni_prapory',)):
+        self.fanout = fanout
+        self.matcher = RedFlagMatcher(options)
+        self.keys = frozenset(keys)
+        self.stats = {
+            'alerts': 0, 'delivered': 0, 'failed': 0,
+            'last_latency': None, 'max_latency': 0.0, 'total_latency': 0.0,
+        }
+
+    def flags(self, user_data):
+        """Усі червоні прапори у відповідях пацієнта"""
+        flags = []
+        for key in self.keys:
+            flags += [flag for flag in self.matcher.match(user_data.get(key)) if flag not in flags]
+        return flags
+
+    async def on_answer(self, question, update, context):
+        """Хук Questionnaire: викликається після збереження кожної відповіді"""
+        if question.key not in self.keys:
+            return
+        received = time.monotonic()
+        user_data = context.user_data
+        alerted = user_data.setdefault(ALERTED_KEY, [])
+        # При редагуванні сповіщаємо лише про прапори, яких ще не було
+        new_flags = [flag for flag in self.matcher.match(user_data.get(question.key)) if flag not in alerted]
+        if not new_flags:
+            return
+        alerted.extend(new_flags)
+        logger.warning(f"Червоні прапори у користувача {user_data.get('user_id')}: {', '.join(new_flags)}")
+        context.application.create_task(
+            self._notify(context.bot, format_alert(user_data, new_flags), received), update=update
+        )
+
+    async def _notify(self, bot, text, received):
+        self.stats['alerts'] += 1
+        if not await self.fanout.send(bot, text, priority=URGENT):
+            self.stats['failed'] += 1
+            logger.error("Термінове сповіщення про червоні прапори не доставлено жодному лікарю")
+            return
+        latency = time.monotonic() - received
+        self.stats['delivered'] += 1
+        self.stats['last_latency'] = latency
+        self.stats['max_latency'] = max(self.stats['max_latency'], latency)
+        self.stats['total_latency'] += latency
+        TRIAGE_SECONDS.labels().observe(latency)
+        logger.info(f"Сповіщення про червоні прапори доставлено за {latency:.3f} с")
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Розбір числових відповідей (вік, інтенсивність болю, зріст, вага) один раз під час
+введення: цифри або слова ("сорок"), одиниці виміру ("175 см", "1,75 м") і межі.
+Число зберігається поруч із текстом відповіді (ключ <поле>_value), тож сховище,
+аналітика і вивантаження не розбирають рядки повторно.
+"""
+
+import re
+
+# Числа словами (українською; "сорок", "сто" збігаються з російськими)
+_WORDS = {
+    'нуль': 0, 'один': 1, 'одна': 1, 'одно': 1, 'два': 2, 'дві': 2, 'три': 3, 'чотири': 4,
+    "п'ять": 5, 'шість': 6, 'сім': 7, 'вісім': 8, "дев'ять": 9, 'десять': 10,
+    'одинадцять': 11, 'дванадцять': 12, 'тринадцять': 13, 'чотирнадцять': 14, "п'ятнадцять": 15,
+    'шістнадцять': 16, 'сімнадцять': 17, 'вісімнадцять': 18, "дев'ятнадцять": 19,
+    'двадцять': 20, 'тридцять': 30, 'сорок': 40, "п'ятдесят": 50, 'шістдесят': 60,
+    'сімдесят': 70, 'вісімдесят': 80, "дев'яносто": 90, 'сто': 100, 'двісті': 200, 'триста': 300,
+}
+
+_APOSTROPHES = str.maketrans({'’': "'", 'ʼ': "'", '`': "'", '‘': "'"})
+_NUMBER_RE = re.compile(r'^([-+]?\d+(?:\.\d+)?)\s*([^\d\s.]*)\.?$')
+
+
+class InvalidAnswer(ValueError):
+    """Відповідь не є допустимим числом; текст винятку - повідомлення пацієнту"""
+
+
+def value_key(key):
+    """Ключ числового значення відповіді key"""
+    return f'{key}_value'
+
+
+def format_number(value):
+    """Текст відповіді з числа: 175, 72.5"""
+    return str(value) if isinstance(value, int) else f'{value:g}'
+
+
+def _words_to_number(words):
+    total = 0
+    for word in words:
+        if word not in _WORDS:
+            return None
+        total += _WORDS[word]
+    return total
+
+
+class NumberAnswer:
+    """Розбір відповіді в число в межах [minimum, maximum].
+
+    units - одиниці виміру і множники до основної одиниці ('м': 100 для зросту в см);
+    integer - лише цілі числа (вік, шкала болю), інакше округлення до decimals знаків.
+    """
+
+    def __init__(self, minimum, maximum, error, units=None, integer=True, decimals=1):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.error = error
+        self.units = {'': 1, **(units or {})}
+        self.integer = integer
+        self.decimals = decimals
+
+    def parse(self, text):
+        """Число з тексту або None, якщо текст не є числом у відомих одиницях"""
+        text = text.strip().lower().translate(_APOSTROPHES).replace(',', '.')
+        match = _NUMBER_RE.match(text)
+        if match:
+            number, unit = float(match.group(1)), match.group(2)
+        else:
+            words = text.replace('-', ' ').split()
+            unit = words.pop().rstrip('.') if len(words) > 1 and words[-1].rstrip('.') in self.units else ''
+            number = _words_to_number(words) if words else None
+        factor = self.units.get(unit)
+        if number is None or factor is None:
+            return None
+        return number * factor
+
+    def __call__(self, text):
+        """Повертає int або float; InvalidAnswer з повідомленням пацієнту, якщо відповідь некоректна"""
+        number = self.parse(text)
+        if number is None or not self.minimum <= number <= self.maximum:
+            raise InvalidAnswer(self.error)
+        if not self.integer:
+            # 1.83 м * 100 = 183.00000000000003
+            number = round(number, self.decimals)
+        if number == int(number):
+            return int(number)
+        if self.integer:
+            raise InvalidAnswer(self.error)
+        return number
+
+
+AGE = NumberAnswer(
+    1, 120, "❗ Введіть вік числом від 1 до 120 (наприклад: 45)",
+    units={'р': 1, 'рік': 1, 'роки': 1, 'років': 1},
+)
+PAIN = NumberAnswer(0, 10, "❗ Оцініть біль числом від 0 до 10")
+HEIGHT = NumberAnswer(
+    100, 250, "❗ Введіть зріст у сантиметрах, від 100 до 250 (наприклад: 175)",
+    units={'см': 1, 'cm': 1, 'м': 100, 'm': 100}, integer=False,
+)
+WEIGHT = NumberAnswer(
+    20, 300, "❗ Введіть вагу в кілограмах, від 20 до 300 (наприклад: 70)",
+    units={'кг': 1, 'kg': 1, 'кілограм': 1, 'кілограмів': 1}, integer=False,
+)
+
+# Поля анкети з числовою відповіддю
+NUMERIC_ANSWERS = {'vik': AGE, 'shkala_boly': PAIN, 'zrist': HEIGHT, 'vaga': WEIGHT}
+VALUE_FIELDS = tuple(value_key(key) for key in NUMERIC_ANSWERS)
+
+
+def normalize_record(record):
+    """Додає числові значення до анкети, збереженої лише з текстом (імпорт старих анкет)"""
+    for key, parse in NUMERIC_ANSWERS.items():
+        if key in record and value_key(key) not in record:
+            try:
+                record[value_key(key)] = parse(str(record[key]))
+            except InvalidAnswer:
+                pass
+    return record
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Режим webhook: вбудований HTTP сервер приймає оновлення від Telegram
+"""
+
+import asyncio
+import hmac
+import json
+import logging
+import signal
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from http_server import HttpServer
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Паралельна обробка оновлень різних користувачів.
+
+    Оновлення одного користувача обробляються строго по черзі, тому
+    ConversationHandler не бачить гонок між відповідями одного пацієнта.
+    Черга користувача чекає на свій замок до семафора CONCURRENT_UPDATES:
+    пацієнт, що надіслав багато повідомлень поспіль, займає одне місце, а не всі.
+    in_flight - оновлення, передані процесору і ще не оброблені (разом з тими, що чекають).
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._locks = {}
+        self.in_flight = 0
+
+    async def process_update(self, update, coroutine):
+        # Заміняє BaseUpdateProcessor.process_update, який бере семафор до do_process_update
+        self.in_flight += 1
+        try:
+            user = getattr(update, 'effective_user', None)
+            if user is None:
+                async with self._semaphore:
+                    await coroutine
+                return
+            entry = self._locks.get(user.id)
+            if entry is None:
+                entry = self._locks[user.id] = [asyncio.Lock(), 0]
+            entry[1] += 1
+            try:
+                async with entry[0], self._semaphore:
+                    await coroutine
+            finally:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[user.id]
+        finally:
+            self.in_flight -= 1
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+def pending_updates(application):
+    """Необроблені оновлення: у черзі Application і вже передані процесору оновлень.
+    Application одразу забирає оновлення з черги в окремі задачі, тож розмір черги
+    сам по собі майже завжди нульовий"""
+    return application.update_queue.qsize() + getattr(application.update_processor, 'in_flight', 0)
+
+
+class WebhookServer:
+    """Приймає оновлення на webhook_path, перевіряє секретний токен і
+    кладе їх у чергу оновлень Application; якщо необроблених оновлень уже
+    update_queue.maxsize (WEBHOOK_QUEUE_SIZE), відповідає 503.
+    Кілька ботів в одному процесі - кожен на своєму шляху (add).
+    extra_stats - додаткова статистика для /healthz (назва -> словник)"""
+
+    def __init__(self, application, host='0.0.0.0', port=8080, webhook_path='/telegram', secret_token=None,
+                 extra_stats=None):
+        self.application = application
+        self.applications = []
+        self.extra_stats = extra_stats or {}
+        self.secret_token = secret_token
+        self.webhook_path = webhook_path
+        self.server = HttpServer(host, port)
+        self.server.route('GET', '/healthz', self._handle_health)
+        self.stats = {'accepted': 0, 'rejected_full': 0, 'forbidden': 0, 'bad_request': 0}
+        self.add(application, webhook_path)
+
+    def add(self, application, webhook_path):
+        """Оновлення, що надходять на webhook_path, обробляє application"""
+        self.applications.append(application)
+
+        async def handle(request):
+            return await self._handle_update(application, request)
+
+        self.server.route('POST', webhook_path, handle)
+
+    async def _handle_update(self, application, request):
+        if self.secret_token and not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, '').encode(), self.secret_token.encode()
+        ):
+            self.stats['forbidden'] += 1
+            return 403, 'text/plain', 'forbidden'
+        try:
+            update = Update.de_json(json.loads(request.body), application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            self.stats['bad_request'] += 1
+            logger.warning(f"Некоректне оновлення у webhook: {e}")
+            return 400, 'text/plain', 'bad request'
+        try:
+            if pending_updates(application) >= application.update_queue.maxsize > 0:
+                raise asyncio.QueueFull
+            application.update_queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Telegram повторить доставку пізніше
+            self.stats['rejected_full'] += 1
+            return 503, 'text/plain', 'busy'
+        self.stats['accepted'] += 1
+        return 200, 'text/plain', 'ok'
+
+    async def _handle_health(self, request):
+        running = all(application.running for application in self.applications)
+        body = json.dumps({
+            'running': running,
+            'update_queue': sum(pending_updates(application) for application in self.applications),
+            **self.stats,
+            **self.extra_stats,
+        })
+        return 200 if running else 503, 'application/json', body
+
+
+async def serve_webhook(application, webhook_url, host='0.0.0.0', port=8080, webhook_path='/telegram',
+                        secret_token=None, max_connections=100, extra_stats=None):
+    """Повний життєвий цикл бота в режимі webhook (аналог Application.run_webhook)"""
+    await serve_webhooks({webhook_path: application}, webhook_url, host, port, secret_token, max_connections,
+                         extra_stats)
+
+
+async def serve_webhooks(applications, webhook_url, host='0.0.0.0', port=8080, secret_token=None,
+                         max_connections=100, extra_stats=None):
+    """Життєвий цикл кількох ботів на одному HTTP сервері: applications - шлях webhook -> Application"""
+    (first_path, first), *others = applications.items()
+    webhook = WebhookServer(first, host, port, first_path, secret_token, extra_stats)
+    for webhook_path, application in others:
+        webhook.add(application, webhook_path)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    # Сервер стартує першим, щоб платформа бачила health endpoint під час ініціалізації
+    await webhook.server.start()
+    started = []
+    try:
+        for webhook_path, application in applications.items():
+            started.append(application)
+            await application.initialize()
+            if application.post_init:
+                await application.post_init(application)
+            await application.start()
+            await application.bot.set_webhook(
+                url=webhook_url.rstrip('/') + webhook_path,
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=max_connections,
+            )
+            logger.info(f"Webhook встановлено: {webhook_url.rstrip('/')}{webhook_path}")
+        await stop_event.wait()
+    finally:
+        await webhook.server.close()
+        for application in started:
+            if application.running:
+                await application.stop()
+                if application.post_stop:
+                    await application.post_stop(application)
+        for application in started:
+            await application.shutdown()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Кілька процесів-обробників: маршрутизатор передає кожне оновлення процесу
+user_id % N, тож оновлення одного користувача завжди обробляє один процес і по черзі.
+Стан розмов (STATE_DB) і анкети (SURVEY_DB) - спільні SQLite у режимі WAL;
+кожен процес завантажує і змінює лише сесії своїх користувачів.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# Як часто процес-обробник перевіряє, чи живий маршрутизатор (с)
+POLL_INTERVAL = 1.0
+
+
+def shard_of(user_id, count):
+    """Номер процесу, що обробляє користувача"""
+    return user_id % count
+
+
+class WorkerPool:
+    """Процеси-обробники target(updates) і розподіл оновлень між ними.
+
+    Процеси запускаються через spawn і отримують WORKER_INDEX і WORKER_COUNT
+    у змінних оточення (до імпорту модуля бота), а оновлення - у вигляді словників.
+    """
+
+    def __init__(self, count, target):
+        self.count = count
+        self.target = target
+        self._context = multiprocessing.get_context('spawn')
+        self._queues = [self._context.Queue() for _ in range(count)]
+        self._processes = [None] * count
+        self.stats = {'dispatched': 0, 'restarts': 0}
+
+    def start(self):
+        for index in range(self.count):
+            self._start(index)
+        logger.info(f"Запущено {self.count} процесів-обробників")
+
+    def _start(self, index):
+        previous = {key: os.environ.get(key) for key in ('WORKER_INDEX', 'WORKER_COUNT')}
+        os.environ.update(WORKER_INDEX=str(index), WORKER_COUNT=str(self.count))
+        try:
+            process = self._context.Process(
+                target=_run, args=(self.target, self._queues[index]), name=f'worker-{index}'
+            )
+            process.start()
+        finally:
+            for key, value in previous.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+        self._processes[index] = process
+
+    def dispatch(self, user_id, data):
+        """Передає оновлення (Update.to_dict()) процесу користувача"""
+        index = shard_of(user_id, self.count)
+        process = self._processes[index]
+        if not process.is_alive():
+            # Черга процесу зберігається: новий процес продовжить з неї
+            logger.error(f"Процес-обробник {index} завершився (код {process.exitcode}), перезапуск")
+            self.stats['restarts'] += 1
+            self._start(index)
+        self._queues[index].put(data)
+        self.stats['dispatched'] += 1
+
+    async def close(self, timeout=30):
+        """Просить процеси дообробити черги і завершитись"""
+        for index, process in enumerate(self._processes):
+            if process is not None and process.is_alive():
+                self._queues[index].put(None)
+        for process in self._processes:
+            if process is None:
+                continue
+            await asyncio.to_thread(process.join, timeout)
+            if process.is_alive():
+                logger.error(f"Процес {process.name} не завершився за {timeout} с")
+                process.terminate()
+        logger.info(f"Процеси-обробники зупинено. Статистика: {self.stats}")
+
+
+def _run(target, updates):
+    # Ctrl+C отримує вся група процесів; зупинкою керує маршрутизатор
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    target(updates)
+
+
+async def serve_updates(application, updates):
+    """Життєвий цикл Application у процесі-обробнику: оновлення надходять з черги updates,
+    None - сигнал завершення"""
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    loop = asyncio.get_running_loop()
+    parent = multiprocessing.parent_process()
+    try:
+        while True:
+            try:
+                data = await loop.run_in_executor(None, updates.get, True, POLL_INTERVAL)
+            except queue.Empty:
+                if parent is not None and not parent.is_alive():
+                    logger.error("Маршрутизатор завершився, зупинка процесу-обробника")
+                    break
+                continue
+            if data is None:
+                break
+            await application.update_queue.put(Update.de_json(data, application.bot))
+    finally:
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)